@@ -0,0 +1,173 @@
+"""End-to-end benchmark: stream a generated CSV through main_async into the fake backend.
+
+Run from the repository root:
+
+    python benchmarks/end_to_end.py [small|medium|large|all] [--latency-ms 40] [--max-rps 0] ...
+
+Scenarios: small = 1,000 rows, medium = 50,000, large = 500,000. The fake
+Parse/Bubble server (benchmarks/fake_backend.py) runs in its own process and
+every scenario runs in a fresh one, so peak RSS belongs to that scenario alone.
+main.py settings come from the environment as usual (e.g. CHUNK_SIZE,
+MAX_CONCURRENT); the Back4App rate limit defaults to 1000/s here so the fake
+server's latency, not the production limit, is what gets measured.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import enrollment_csv  # noqa: E402
+
+SCENARIOS = {"small": 1_000, "medium": 50_000, "large": 500_000}
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_scenario(name: str, base_url: str) -> dict:
+    """Child process: import main against the fake backend and process /csv/<name>.csv"""
+    import aiohttp
+    import logging
+    import main
+
+    logging.disable(logging.INFO)
+    latencies = []
+
+    async def on_request_start(session, ctx, params):
+        ctx.started = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        latencies.append(time.perf_counter() - ctx.started)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    connector = aiohttp.TCPConnector(limit=main.HTTP_POOL_LIMIT, limit_per_host=main.HTTP_POOL_LIMIT_PER_HOST)
+    csv_url = f"{base_url}/csv/{name}.csv"
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector, trace_configs=[trace],
+                                     timeout=aiohttp.ClientTimeout(total=main.HTTP_TIMEOUT_SECONDS)) as session:
+        # Same steps as process_csv_url, on a traced session
+        async with main.open_csv_stream(session, csv_url) as stream:
+            head = await stream.peek(main.CSV_INLINE_MAX_CHARS + 1)
+            content_hash = await stream.spool() if main.CSV_DEDUPE_FILES else ""
+            await main.main_async(stream.rows(), csv_url, f"{name}.csv", csv_content=head,
+                                  session=session, content_hash=content_hash, total_rows=stream.estimate_rows(),
+                                  source_fingerprint=stream.fingerprint, stream=stream)
+    elapsed = time.perf_counter() - started
+    main.shutdown_csv_pool()
+
+    outcomes = ("created", "updated", "unchanged", "failed")
+    rows = int(sum(main.metrics.rows.value(sink="back4app", result=r) for r in outcomes) + main.metrics.duplicate_rows.value())
+    bubble = {r: int(main.metrics.rows.value(sink="bubble", result=r)) for r in (*outcomes, "dropped")}
+    return {
+        "scenario": name,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows / elapsed, 1),
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "failed": int(main.metrics.rows.value(sink="back4app", result="failed")),
+        "bubble_rows": sum(bubble.values()),
+        "bubble_failed": bubble["failed"] + bubble["dropped"],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"fake backend did not start on port {port}")
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end main_async benchmark against a fake backend")
+    parser.add_argument("scenario", nargs="?", default="small", choices=[*SCENARIOS, "all"])
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="fake backend response delay")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=float, default=0.0, help="fake backend 429s above this rate (0 = unlimited)")
+    parser.add_argument("--bubble-latency-ms", type=float, default=0.0, help="extra delay on Bubble responses only")
+    parser.add_argument("--duplicate-rate", type=float, default=0.02, help="fraction of rows repeating an earlier email")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_scenario(args.child, args.base_url))))
+        return
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for name in names:
+            path = os.path.join(tmp, f"{name}.csv")
+            with open(path, "w", newline="") as f:
+                enrollment_csv.write_csv(f, SCENARIOS[name], duplicate_rate=args.duplicate_rate, email_domain=f"{name}.example.com")
+            paths.append(path)
+
+        backend = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "fake_backend.py"), "--port", str(port),
+             "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+             "--throttle-rate", str(args.throttle_rate), "--max-rps", str(args.max_rps),
+             "--bubble-latency-ms", str(args.bubble_latency_ms),
+             *[arg for path in paths for arg in ("--csv", path)]],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            env = {
+                **os.environ,
+                "BUBBLE_API_BASE_URL": f"{base_url}/api/1.1/obj",
+                "BUBBLE_API_TOKEN": "benchmark",
+                "BUBBLE_TABLE_NAME": os.environ.get("BUBBLE_TABLE_NAME", "PreLicensing"),
+                "BACK4APP_API_BASE_URL": f"{base_url}/classes",
+                "BACK4APP_RATE_LIMIT": os.environ.get("BACK4APP_RATE_LIMIT", "1000"),
+                "BUBBLE_RATE_LIMIT": os.environ.get("BUBBLE_RATE_LIMIT", "1000"),
+            }
+            print(f"{'scenario':<8} {'rows':>8} {'seconds':>8} {'rows/sec':>9} {'requests':>9} {'p50 ms':>7} {'p99 ms':>7} {'peak MB':>8} {'failed':>7} {'bubble':>8} {'b.failed':>8}")
+            for name in names:
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name, "--base-url", base_url],
+                                     env=env, cwd=os.path.dirname(HERE), capture_output=True, text=True)
+                if out.returncode:
+                    print(f"{name:<8} failed:\n{out.stderr[-2000:]}")
+                    continue
+                r = json.loads(next(line for line in out.stdout.splitlines() if line.startswith('{"scenario"')))
+                print(f"{r['scenario']:<8} {r['rows']:>8} {r['seconds']:>8} {r['rows_per_sec']:>9} {r['requests']:>9} "
+                      f"{r['p50_ms']:>7} {r['p99_ms']:>7} {r['peak_rss_mb']:>8} {r['failed']:>7} {r['bubble_rows']:>8} {r['bubble_failed']:>8}")
+        finally:
+            backend.terminate()
+            backend.wait()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,68 @@
+"""Synthetic pre-licensing enrollment exports, shaped like the files Apps Script posts.
+
+    python benchmarks/enrollment_csv.py 50000 > enrollments.csv
+"""
+import csv
+import io
+import random
+import sys
+
+COLUMNS = [
+    "FirstName", "LastName", "EmailAddress", "Phone", "Department", "HiringManager", "Course",
+    "DateEnrolled", "LastLoggedIn", "PLE DateCompleted", "% PLE Complete", "% Prep Complete",
+    "% Sim Complete", "Prepared to Pass", "TimeSpent",
+]
+DEPARTMENTS = ["Unitrust Financial", "Unitrust Financial", "Unitrust Financial", "Legacy IMO", "Summit Brokerage"]
+COURSES = ["Life & Health", "Life Only", "Health Only"]
+
+
+def make_row(i: int, rng: random.Random, email_domain: str = "example.com") -> dict:
+    """One agent row: US dates, percentages as text, blanks where the export leaves them"""
+    month, day = rng.randint(1, 12), rng.randint(1, 28)
+    enrolled = f"{month}/{day}/2024"
+    logged = f"{month}/{min(day + rng.randint(0, 20), 28)}/2024 {rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice('AP')}M"
+    ple = rng.randint(0, 100)
+    return {
+        "FirstName": f"First{i}",
+        "LastName": f"Last{i}",
+        "EmailAddress": f"Agent{i}@{email_domain} ",
+        "Phone": f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+        "Department": rng.choice(DEPARTMENTS),
+        "HiringManager": f"Manager {i % 40}",
+        "Course": rng.choice(COURSES),
+        "DateEnrolled": enrolled,
+        "LastLoggedIn": logged if rng.random() > 0.05 else "",
+        "PLE DateCompleted": enrolled if ple == 100 else "",
+        "% PLE Complete": str(ple),
+        "% Prep Complete": str(rng.randint(0, 100)) if ple > 50 else "",
+        "% Sim Complete": str(rng.randint(0, 100)) if ple > 80 else "",
+        "Prepared to Pass": rng.choice(["Yes", "No", ""]),
+        "TimeSpent": f"{rng.randint(0, 80)}:{rng.randint(0, 59):02d}",
+    }
+
+
+def iter_rows(count: int, seed: int = 7, duplicate_rate: float = 0.0, email_domain: str = "example.com"):
+    """`count` rows; a `duplicate_rate` fraction repeat an earlier agent's email with newer progress"""
+    rng = random.Random(seed)
+    for i in range(count):
+        if i and duplicate_rate and rng.random() < duplicate_rate:
+            yield make_row(rng.randrange(i), rng, email_domain)
+        else:
+            yield make_row(i, rng, email_domain)
+
+
+def write_csv(out, count: int, **kwargs):
+    writer = csv.DictWriter(out, COLUMNS, lineterminator="\n")
+    writer.writeheader()
+    for row in iter_rows(count, **kwargs):
+        writer.writerow(row)
+
+
+def csv_bytes(count: int, **kwargs) -> bytes:
+    out = io.StringIO()
+    write_csv(out, count, **kwargs)
+    return out.getvalue().encode()
+
+
+if __name__ == "__main__":
+    write_csv(sys.stdout, int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,359 @@
+"""In-memory stand-in for the Parse (Back4App) and Bubble Data APIs main.py talks to.
+
+Serves, on one port:
+
+    /classes/<Class>[/<objectId>]    Parse objects (where with $in/$or/$lt/$gt, keys,
+                                     order, limit, skip; Increment/Delete ops)
+    /batch                           Parse batch writes (X-Parse-Request-Id replays → 159)
+    /api/1.1/obj/<type>[/<id>|/bulk] Bubble Data API (constraints "in"/"equals", PATCH, bulk)
+    /csv/<name>                      Files registered with add_csv(), streamed in chunks
+    /stats                           Request counts by route and status
+
+Every API response is delayed by `latency` seconds (plus up to `jitter`, and
+`bubble_latency` more on Bubble routes); a fraction `error_rate` of requests fail with 502 before being applied, and
+`throttle_rate` of them (or everything above `max_rps`) get a 429 with
+Retry-After. Run standalone for manual testing:
+
+    python benchmarks/fake_backend.py --port 8900 --latency-ms 40 --max-rps 30
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+CSV_CHUNK_BYTES = 64 * 1024
+
+
+def _iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _plain(value):
+    """Compare Parse Date objects by their ISO string"""
+    return value.get("iso") if isinstance(value, dict) and value.get("__type") == "Date" else value
+
+
+def matches(record: dict, where: dict) -> bool:
+    for key, condition in where.items():
+        if key == "$or":
+            if not any(matches(record, clause) for clause in condition):
+                return False
+            continue
+        value = _plain(record.get(key))
+        if isinstance(condition, dict) and condition.get("__type") != "Date":
+            for op, operand in condition.items():
+                operand = _plain(operand)
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$lt" and (value is None or value >= operand):
+                    return False
+                if op == "$gt" and (value is None or value <= operand):
+                    return False
+                if op == "$exists" and (value is not None) != operand:
+                    return False
+        elif value != _plain(condition):
+            return False
+    return True
+
+
+class FakeBackend:
+    """Parse + Bubble server state and handlers (see the module docstring)"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, max_rps: float = 0.0, retry_after: float = 1.0, seed: int = 0,
+                 bubble_latency: float = 0.0):
+        self.latency = latency
+        self.bubble_latency = bubble_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.parse = defaultdict(dict)  # class → objectId → record
+        self.indexes = defaultdict(dict)  # class → field → value → objectIds (fields queried with $in)
+        self.bubble = defaultdict(dict)  # type → _id → record
+        self.bubble_indexes = defaultdict(dict)  # type → field → value → _ids (fields queried with "in")
+        self.csv_files = {}  # name → bytes
+        self.request_ids = set()
+        self.stats = Counter()
+        self._ids = itertools.count(1)
+        self._tokens = max_rps
+        self._refilled = time.monotonic()
+
+    def add_csv(self, name: str, data: bytes):
+        self.csv_files[name] = data
+
+    def _new_id(self) -> str:
+        return f"{next(self._ids):010d}"
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware], client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/classes/{cls}", self.parse_class)
+        app.router.add_route("*", "/classes/{cls}/{id}", self.parse_object)
+        app.router.add_post("/batch", self.parse_batch)
+        app.router.add_post("/api/1.1/obj/{type}/bulk", self.bubble_bulk)
+        app.router.add_route("*", "/api/1.1/obj/{type}", self.bubble_type)
+        app.router.add_route("*", "/api/1.1/obj/{type}/{id}", self.bubble_object)
+        app.router.add_get("/csv/{name}", self.csv)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    def _throttled(self) -> bool:
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            return True
+        if not self.max_rps:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.max_rps, self._tokens + (now - self._refilled) * self.max_rps)
+        self._refilled = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        if route.startswith(("/csv", "/stats")):
+            return await handler(request)
+        delay = self.latency + self.random.uniform(0, self.jitter) + (self.bubble_latency if route.startswith("/api/") else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self._throttled():
+            response = web.json_response({"code": 155, "error": "Too many requests"}, status=429,
+                                         headers={"Retry-After": f"{self.retry_after:g}"})
+        elif self.error_rate and self.random.random() < self.error_rate:
+            response = web.json_response({"error": "injected failure"}, status=502)
+        else:
+            response = await handler(request)
+        self.stats[f"{request.method} {route} {response.status}"] += 1
+        return response
+
+    async def get_stats(self, request: web.Request):
+        return web.json_response({"requests": dict(self.stats), "parse": {c: len(r) for c, r in self.parse.items()},
+                                  "bubble": {t: len(r) for t, r in self.bubble.items()}})
+
+    async def csv(self, request: web.Request):
+        data = self.csv_files.get(request.match_info["name"])
+        if data is None:
+            raise web.HTTPNotFound()
+        response = web.StreamResponse(headers={"Content-Type": "text/csv"})
+        await response.prepare(request)
+        for i in range(0, len(data), CSV_CHUNK_BYTES):
+            await response.write(data[i : i + CSV_CHUNK_BYTES])
+        await response.write_eof()
+        return response
+
+    # Parse
+    def _index(self, cls: str, record: dict, add: bool = True):
+        for field, index in self.indexes[cls].items():
+            ids = index.setdefault(record.get(field), set())
+            (ids.add if add else ids.discard)(record["objectId"])
+
+    def _candidates(self, cls: str, where: dict) -> list:
+        """Records that can match `where`, narrowed through an index for a top-level $in"""
+        for field, condition in where.items():
+            if isinstance(condition, dict) and "$in" in condition:
+                index = self.indexes[cls].get(field)
+                if index is None:
+                    index = self.indexes[cls][field] = {}
+                    for record in self.parse[cls].values():
+                        index.setdefault(record.get(field), set()).add(record["objectId"])
+                ids = set().union(*(index.get(value, ()) for value in condition["$in"]))
+                return [self.parse[cls][object_id] for object_id in sorted(ids)]
+        return list(self.parse[cls].values())
+
+    def _apply_update(self, cls: str, record: dict, body: dict) -> dict:
+        out = {"updatedAt": _iso_now()}
+        self._index(cls, record, add=False)
+        for key, value in body.items():
+            op = value.get("__op") if isinstance(value, dict) else None
+            if op == "Increment":
+                record[key] = (record.get(key) or 0) + value["amount"]
+                out[key] = record[key]
+            elif op == "Delete":
+                record.pop(key, None)
+            else:
+                record[key] = value
+        record["updatedAt"] = out["updatedAt"]
+        self._index(cls, record)
+        return out
+
+    def _create(self, cls: str, body: dict) -> dict:
+        object_id = self._new_id()
+        now = _iso_now()
+        self.parse[cls][object_id] = {**body, "objectId": object_id, "createdAt": now, "updatedAt": now}
+        self._index(cls, self.parse[cls][object_id])
+        return {"objectId": object_id, "createdAt": now}
+
+    def _query(self, cls: str, query) -> dict:
+        where = json.loads(query.get("where") or "{}")
+        results = [r for r in self._candidates(cls, where) if matches(r, where)]
+        order = query.get("order")
+        for key in reversed(order.split(",") if order else []):
+            field = key.lstrip("-")
+            results.sort(key=lambda r: str(_plain(r.get(field)) or ""), reverse=key.startswith("-"))
+        skip = int(query.get("skip", 0))
+        results = results[skip : skip + int(query.get("limit", 100))]
+        keys = query.get("keys")
+        if keys:
+            wanted = set(keys.split(",")) | {"objectId", "createdAt", "updatedAt"}
+            results = [{k: v for k, v in r.items() if k in wanted} for r in results]
+        return {"results": results}
+
+    async def parse_class(self, request: web.Request):
+        cls = request.match_info["cls"]
+        if request.method == "GET":
+            return web.json_response(self._query(cls, request.query))
+        if request.method == "POST":
+            if not self._first_time(request):
+                return web.json_response({"code": 159, "error": "Duplicate request"}, status=400)
+            return web.json_response(self._create(cls, await request.json()), status=201)
+        raise web.HTTPMethodNotAllowed(request.method, ["GET", "POST"])
+
+    async def parse_object(self, request: web.Request):
+        cls = request.match_info["cls"]
+        record = self.parse[cls].get(request.match_info["id"])
+        if record is None:
+            return web.json_response({"code": 101, "error": "Object not found."}, status=404)
+        if request.method == "GET":
+            return web.json_response(record)
+        if request.method == "PUT":
+            return web.json_response(self._apply_update(cls, record, await request.json()))
+        if request.method == "DELETE":
+            self._index(cls, record, add=False)
+            del self.parse[cls][record["objectId"]]
+            return web.json_response({})
+        raise web.HTTPMethodNotAllowed(request.method, ["GET", "PUT", "DELETE"])
+
+    def _first_time(self, request: web.Request) -> bool:
+        request_id = request.headers.get("X-Parse-Request-Id")
+        if request_id is None:
+            return True
+        if request_id in self.request_ids:
+            return False
+        self.request_ids.add(request_id)
+        return True
+
+    async def parse_batch(self, request: web.Request):
+        if not self._first_time(request):
+            return web.json_response({"code": 159, "error": "Duplicate request"}, status=400)
+        results = []
+        for op in (await request.json())["requests"]:
+            parts = op["path"].rstrip("/").split("/")
+            cls_index = parts.index("classes") + 1
+            cls = parts[cls_index]
+            if op["method"] == "POST":
+                results.append({"success": self._create(cls, op.get("body", {}))})
+                continue
+            record = self.parse[cls].get(parts[cls_index + 1]) if len(parts) > cls_index + 1 else None
+            if record is None:
+                results.append({"error": {"code": 101, "error": "Object not found."}})
+            elif op["method"] == "DELETE":
+                self._index(cls, record, add=False)
+                del self.parse[cls][record["objectId"]]
+                results.append({"success": {}})
+            else:
+                results.append({"success": self._apply_update(cls, record, op.get("body", {}))})
+        return web.json_response(results)
+
+    # Bubble
+    def _bubble_index(self, type_: str, record: dict, add: bool = True):
+        for field, index in self.bubble_indexes[type_].items():
+            ids = index.setdefault(record.get(field), set())
+            (ids.add if add else ids.discard)(record["_id"])
+
+    def _bubble_in(self, type_: str, key: str, values: list) -> list:
+        index = self.bubble_indexes[type_].get(key)
+        if index is None:
+            index = self.bubble_indexes[type_][key] = {}
+            for record in self.bubble[type_].values():
+                index.setdefault(record.get(key), set()).add(record["_id"])
+        ids = set().union(*(index.get(value, ()) for value in values))
+        return [self.bubble[type_][record_id] for record_id in sorted(ids)]
+
+    def _bubble_create(self, type_: str, body: dict) -> str:
+        record_id = f"{self._new_id()}x"
+        record = self.bubble[type_][record_id] = {**body, "_id": record_id, "Modified Date": _iso_now()}
+        self._bubble_index(type_, record)
+        return record_id
+
+    async def bubble_type(self, request: web.Request):
+        type_ = request.match_info["type"]
+        if request.method == "GET":
+            constraints = json.loads(request.query.get("constraints") or "[]")
+            first_in = next((c for c in constraints if c["constraint_type"] == "in"), None)
+            records = (self._bubble_in(type_, first_in["key"], first_in["value"]) if first_in
+                       else list(self.bubble[type_].values()))
+            for constraint in constraints:
+                key, kind, value = constraint["key"], constraint["constraint_type"], constraint.get("value")
+                if kind == "in":
+                    records = [r for r in records if r.get(key) in value]
+                elif kind == "equals":
+                    records = [r for r in records if r.get(key) == value]
+            cursor = int(request.query.get("cursor", 0))
+            limit = int(request.query.get("limit", 100))
+            page = records[cursor : cursor + limit]
+            return web.json_response({"response": {"cursor": cursor, "results": page, "count": len(page),
+                                                   "remaining": max(0, len(records) - cursor - len(page))}})
+        if request.method == "POST":
+            return web.json_response({"status": "success", "id": self._bubble_create(type_, await request.json())}, status=201)
+        raise web.HTTPMethodNotAllowed(request.method, ["GET", "POST"])
+
+    async def bubble_object(self, request: web.Request):
+        record = self.bubble[request.match_info["type"]].get(request.match_info["id"])
+        if record is None:
+            return web.json_response({"statusCode": 404, "body": {"status": "NOT_FOUND"}}, status=404)
+        if request.method == "GET":
+            return web.json_response({"response": record})
+        if request.method == "PATCH":
+            self._bubble_index(request.match_info["type"], record, add=False)
+            record.update(await request.json(), **{"Modified Date": _iso_now()})
+            self._bubble_index(request.match_info["type"], record)
+            return web.Response(status=204)
+        raise web.HTTPMethodNotAllowed(request.method, ["GET", "PATCH"])
+
+    async def bubble_bulk(self, request: web.Request):
+        """Newline-delimited JSON objects in, one {"status", "id"} line out per object"""
+        type_ = request.match_info["type"]
+        lines = []
+        for line in (await request.text()).splitlines():
+            if line.strip():
+                lines.append(json.dumps({"status": "success", "id": self._bubble_create(type_, json.loads(line))}))
+        return web.Response(text="\n".join(lines), content_type="text/plain")
+
+
+async def start(backend: FakeBackend, host: str = "127.0.0.1", port: int = 8900) -> web.AppRunner:
+    runner = web.AppRunner(backend.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every API response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random delay, 0..jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 502 (not applied)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="answer 429 above this request rate (0 = unlimited)")
+    parser.add_argument("--bubble-latency-ms", type=float, default=0.0, help="extra delay on Bubble Data API responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--csv", action="append", default=[], metavar="PATH", help="serve a CSV file at /csv/<basename>")
+    args = parser.parse_args()
+
+    backend = FakeBackend(args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate,
+                          args.throttle_rate, args.max_rps, args.retry_after, bubble_latency=args.bubble_latency_ms / 1000)
+    for path in args.csv:
+        with open(path, "rb") as f:
+            backend.add_csv(path.replace("\\", "/").rsplit("/", 1)[-1], f.read())
+    web.run_app(backend.app(), host=args.host, port=args.port, access_log=None)
@@ -0,0 +1,77 @@
+"""Microbenchmark: CSV row → Bubble/Back4App payloads, per-builder dateutil parsing vs RowTransformer.
+
+Run from the repository root:
+
+    python benchmarks/row_transform.py [rows]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("BUBBLE_API_BASE_URL", "http://localhost/api/1.1/obj")
+os.environ.setdefault("BUBBLE_API_TOKEN", "benchmark")
+os.environ.setdefault("BUBBLE_TABLE_NAME", "benchmark")
+
+import main  # noqa: E402
+
+
+def make_rows(count: int) -> list[dict]:
+    """Rows shaped like the pre-licensing export (US dates, a few hundred distinct days)"""
+    random.seed(7)
+    rows = []
+    for i in range(count):
+        day = f"{random.randint(1, 12)}/{random.randint(1, 28)}/2024"
+        rows.append({
+            "FirstName": f"First{i}",
+            "LastName": f"Last{i}",
+            "EmailAddress": f"Agent{i}@Example.com ",
+            "Phone": f"(555) {i % 1000:03d}-{i % 10000:04d}",
+            "Department": "IMO",
+            "DateEnrolled": day,
+            "LastLoggedIn": f"{day} {random.randint(1, 12)}:{random.randint(0, 59):02d} PM",
+            "PLE DateCompleted": day if i % 3 else "",
+            "% PLE Complete": str(i % 100),
+            "% Prep Complete": str((i * 7) % 100),
+            "% Sim Complete": "",
+            "Course": "Life & Health",
+        })
+    return rows
+
+
+def legacy_payloads(row: dict):
+    """The previous path: each builder parses every date with dateutil and every number on its own"""
+    for _ in range(2):
+        main.sanitize_phone(row.get("Phone", ""))
+        for column in ("DateEnrolled", "LastLoggedIn", "PLE DateCompleted"):
+            dt = main.parse_csv_date(row.get(column, ""))
+            if dt:
+                main.to_utc_iso(dt)
+        for column in ("% PLE Complete", "% Prep Complete", "% Sim Complete"):
+            main.parse_number(row.get(column, ""))
+        row.get("EmailAddress", "").lower().strip()
+
+
+def transformer_payloads(rows: list[dict]):
+    transformer = main.RowTransformer()
+    for row in rows:
+        record = transformer.record(row)
+        main.to_payload(record)
+        main.to_back4app_payload(record)
+
+
+def bench(label: str, fn, count: int):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<16} {count / elapsed:>12,.0f} rows/sec  ({elapsed:.3f}s)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rows = make_rows(count)
+    before = bench("dateutil", lambda: [legacy_payloads(row) for row in rows], count)
+    after = bench("RowTransformer", lambda: transformer_payloads(rows), count)
+    print(f"speedup          {before / after:.1f}x")
@@ -0,0 +1,30 @@
+# Gunicorn settings for the Cloud Run image: gunicorn -c gunicorn.conf.py main:app
+#
+# Each worker process imports main.py on its own (no preload), so every process
+# gets its own job executor thread, HTTP session and caches. POST / only queues
+# the file on that executor, so request threads are never held by CSV processing.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+# Processes. Each takes a fixed 1/WEB_WORKERS of BACK4APP/BUBBLE_RATE_LIMIT, even while the others are idle,
+# so one job only gets the full budget with a single process; raise this for more request capacity, not throughput
+workers = int(os.environ.get("WEB_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))  # Request threads per process
+timeout = 120  # Seconds a worker may go without a heartbeat before it is restarted
+graceful_timeout = int(float(os.environ.get("SHUTDOWN_GRACE_SECONDS", 8))) + 1  # Cloud Run allows 10s after SIGTERM
+keepalive = 75  # Seconds an idle keep-alive connection is held open
+accesslog = None  # main.py logs one line per request
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    import main
+
+    main.start_service(processes=workers)
+
+
+def worker_exit(server, worker):
+    import main
+
+    main.stop_service()
@@ -1,54 +1,177 @@
+import argparse
 import asyncio
+import base64
+import bisect
+import codecs
+import copy
+import fcntl
+import hashlib
 import io
+import itertools
 import csv
+import functools
+import gzip
 import json
+import atexit
 import logging, sys
+import logging.config
+import logging.handlers
+import multiprocessing
 import os
-from datetime import datetime, timezone
-from typing import Optional
+import queue
+import random
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Iterable, NamedTuple, Optional, Union
+from urllib.parse import quote, urlparse
 import dateutil.parser
 
 import aiohttp
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, g, request, jsonify
+from werkzeug.sansio.multipart import NEED_DATA, Data, Epilogue, File, MultipartDecoder
 
-# Counters for Bubble
-new_records_count = 0
-updated_records_count = 0
+try:
+    import brotli  # Optional: static assets are also precompressed with brotli when installed
+except ImportError:
+    brotli = None
 
-# Counters for Back4App
-new_records_back4app_count = 0
-updated_records_back4app_count = 0
+# Logging Configuration
+LOG_CONFIG_PATH = os.environ.get("LOG_CONFIG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.conf"))
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()  # "json" writes Cloud Logging structured entries
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", 500))  # Payloads/bodies in logs are cut here
+# Fraction of INFO/DEBUG records kept per category, e.g. "row=0.05,request=0.2" (warnings and errors are always kept)
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition("=") for item in os.environ.get("LOG_SAMPLE_RATES", "").split(",") if item.strip())
+}
+
+class LogPayload:
+    """Log argument rendered as (truncated) JSON only if the record is actually emitted"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, default=str)
+        if len(text) > LOG_PAYLOAD_MAX_CHARS:
+            return f"{text[:LOG_PAYLOAD_MAX_CHARS]}… ({len(text)} chars)"
+        return text
+
+class LogSampler(logging.Filter):
+    """Keeps LOG_SAMPLE_RATES of the records logged with extra={"category": ...}"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "category", None), 1.0)
+        return rate >= 1.0 or record.levelno >= logging.WARNING or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the fields Cloud Logging reads (severity, message, time)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "logger": record.name,
+        }
+        category = getattr(record, "category", None)
+        if category:
+            entry["category"] = category
+        if record.exc_info or record.exc_text:
+            entry["exception"] = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting (timestamp, layout, JSON) to the listener thread.
+
+    Like the stock prepare(), the message is merged with its args and any traceback
+    rendered to exc_text before queueing, so the record holds no references to
+    objects that may change (or frames that stay alive) while it waits. Sampling
+    and level checks run first, so dropped records are never rendered.
+    """
+
+    _traceback_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self._traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 # Setup logging
 def setup_logging():
-    """Configure application logging for Cloud Run"""
-    # Configure root logger
+    """Configure application logging for Cloud Run.
+
+    Levels and handlers come from logging.conf when it exists. Every handler is
+    then served by a QueueListener thread, so logging calls only enqueue records.
+    """
     root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    
-    # Remove existing handlers to avoid duplicates
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-    
-    # Create console handler for stdout (Cloud Run requirement)
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    
-    # Create detailed formatter for application logs
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    console_handler.setFormatter(formatter)
-    
-    # Add handler to root logger
-    root_logger.addHandler(console_handler)
+    if os.path.exists(LOG_CONFIG_PATH):
+        logging.config.fileConfig(LOG_CONFIG_PATH, disable_existing_loggers=False)
+    else:
+        # Configure root logger
+        root_logger.setLevel(logging.INFO)
+        
+        # Remove existing handlers to avoid duplicates
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+        
+        # Create console handler for stdout (Cloud Run requirement)
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(logging.INFO)
+        
+        # Create detailed formatter for application logs
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        console_handler.setFormatter(formatter)
+        
+        # Add handler to root logger
+        root_logger.addHandler(console_handler)
     
-    # Create application logger
-    app_logger = logging.getLogger(__name__)
-    app_logger.setLevel(logging.INFO)
+    # Move every configured handler behind a queue; loggers with the same handlers share one
+    # (a listener hands each record to all of its handlers, e.g. gunicorn's own loggers keep theirs)
+    loggers = [root_logger] + [l for l in logging.Logger.manager.loggerDict.values() if isinstance(l, logging.Logger) and l.handlers]
+    queue_handlers = {}
+    for l in loggers:
+        handlers = tuple(l.handlers)
+        if not handlers:
+            continue
+        if handlers not in queue_handlers:
+            if LOG_FORMAT == "json":
+                for handler in handlers:
+                    handler.setFormatter(JsonFormatter())
+            queue_handler = queue_handlers[handlers] = DeferredQueueHandler(queue.SimpleQueue())
+            queue_handler.addFilter(LogSampler(LOG_SAMPLE_RATES))
+            listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+        for handler in handlers:
+            l.removeHandler(handler)
+        l.addHandler(queue_handlers[handlers])
     
-    return app_logger
+    # Application logger level comes from logging.conf ([logger_app]); named "main" rather than __name__
+    # so the same logger is configured under gunicorn (main) and `python main.py` (__main__)
+    return logging.getLogger("main")
 
 # Initialize logger
 logger = setup_logging()
@@ -56,17 +179,16 @@ logger = setup_logging()
 # Initialize Flask app
 app = Flask(__name__)
 
-# Configure Flask logging
-app.logger.setLevel(logging.INFO)
-
-# Add request logging middleware
+# Add request logging middleware (one line per request, written once the response is ready)
 @app.before_request
 def log_request_info():
-    logger.info(f"Request: {request.method} {request.url} from {request.remote_addr}")
+    g.request_started = time.monotonic()
 
 @app.after_request
 def log_response_info(response):
-    logger.info(f"Response: {response.status_code} for {request.method} {request.url}")
+    elapsed_ms = (time.monotonic() - g.get("request_started", time.monotonic())) * 1000
+    logger.info("Request: %s %s from %s → %s in %.1fms", request.method, request.url, request.remote_addr,
+                response.status_code, elapsed_ms, extra={"category": "request"})
     return response
 
 # Configuration
@@ -75,9 +197,54 @@ API_TOKEN = os.environ["BUBBLE_API_TOKEN"]
 TABLE_NAME = os.environ["BUBBLE_TABLE_NAME"]
 MAX_CONCURRENT = int(os.environ.get("MAX_CONCURRENT", 25))
 CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 25))
+AUTOTUNE = os.environ.get("AUTOTUNE", "true").lower() == "true"  # Let each job retune CHUNK_SIZE/MAX_CONCURRENT as it runs
+CHUNK_SIZE_MIN = int(os.environ.get("CHUNK_SIZE_MIN", 10))
+CHUNK_SIZE_MAX = int(os.environ.get("CHUNK_SIZE_MAX", 500))
+MAX_CONCURRENT_MIN = int(os.environ.get("MAX_CONCURRENT_MIN", 2))
+MAX_CONCURRENT_MAX = int(os.environ.get("MAX_CONCURRENT_MAX", 100))
+AUTOTUNE_WINDOW_CHUNKS = int(os.environ.get("AUTOTUNE_WINDOW_CHUNKS", 3))  # Chunks measured per tuning step
+AUTOTUNE_MAX_CHUNK_SECONDS = float(os.environ.get("AUTOTUNE_MAX_CHUNK_SECONDS", 20))  # Keeps checkpoints well inside the lease
+AUTOTUNE_STEP = 1.5  # Initial chunk size factor per step
 RETRY_TOTAL = int(os.environ.get("RETRY_TOTAL", 3))
 BACKOFF_FACTOR = float(os.environ.get("BACKOFF_FACTOR", 1))
 STATUS_FORCELIST = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429}  # The backend rejected the request without applying it
+SLOWDOWN_STATUSES = {429, 503}  # Responses that make the limiter back off (503 may still have been applied)
+THROTTLE_RETRY_TOTAL = int(os.environ.get("THROTTLE_RETRY_TOTAL", 8))  # Extra attempts allowed for throttled requests
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "PATCH", "DELETE"}
+# Send X-Parse-Request-Id on Back4App writes so a replayed create is rejected instead of duplicated, and retry
+# creates/batches on 5xx and network errors. Only enable once idempotency is on for the app's classes/batch
+# paths: without it the retries create duplicate records.
+BACK4APP_IDEMPOTENT_WRITES = os.environ.get("BACK4APP_IDEMPOTENT_WRITES", "false").lower() == "true"
+PARSE_DUPLICATE_REQUEST = 159  # Parse error code for a request id it has already applied
+BACK4APP_RATE_LIMIT = float(os.environ.get("BACK4APP_RATE_LIMIT", 30))  # Requests per second
+BACK4APP_MAX_IN_FLIGHT = int(os.environ.get("BACK4APP_MAX_IN_FLIGHT", MAX_CONCURRENT))
+BUBBLE_RATE_LIMIT = float(os.environ.get("BUBBLE_RATE_LIMIT", 15))
+BUBBLE_MAX_IN_FLIGHT = int(os.environ.get("BUBBLE_MAX_IN_FLIGHT", MAX_CONCURRENT))
+BUBBLE_SYNC = os.environ.get("BUBBLE_SYNC", "true").lower() == "true"  # Also write rows to Bubble, alongside Back4App
+BUBBLE_CONCURRENCY = int(os.environ.get("BUBBLE_CONCURRENCY", 10))  # Bubble lookups/PATCHes one job runs at once
+BUBBLE_QUEUE_CHUNKS = int(os.environ.get("BUBBLE_QUEUE_CHUNKS", 200))  # Chunks Bubble may fall behind before Back4App waits for it
+BUBBLE_LOOKUP_BATCH = 100  # Emails per get_records_by_emails constraint (one cursor page)
+BUBBLE_BULK_MAX = 1000  # Objects Bubble accepts per /bulk call
+BUBBLE_BULK_SIZE = int(os.environ.get("BUBBLE_BULK_SIZE", 100))
+BUBBLE_DRAIN_SECONDS = float(os.environ.get("BUBBLE_DRAIN_SECONDS", 300))  # Wait for Bubble's queue when a job ends
+CSV_STREAM_CHUNK_BYTES = int(os.environ.get("CSV_STREAM_CHUNK_BYTES", 64 * 1024))
+CSV_INLINE_MAX_CHARS = 100000  # Above this, save_csv_file queues the file instead of storing csv_content
+CSV_DEDUPE_FILES = os.environ.get("CSV_DEDUPE_FILES", "true").lower() == "true"  # Skip files identical to a completed one
+# Bodies up to this size are buffered and hashed before the first write (so duplicate files are skipped and
+# repeated emails collapsed file-wide); larger ones stream straight through and are hashed as they go
+CSV_SPOOL_MEMORY_BYTES = int(os.environ.get("CSV_SPOOL_MEMORY_BYTES", 8 * 1024 * 1024))
+CSV_DUPLICATE_EMAILS = os.environ.get("CSV_DUPLICATE_EMAILS", "last")  # Row kept for a repeated email: "last" or "latest_login"
+CSV_PARSE_WORKERS = int(os.environ.get("CSV_PARSE_WORKERS", 0))  # >0 parses and transforms rows in that many processes
+CSV_PARSE_SHARD_CHARS = int(os.environ.get("CSV_PARSE_SHARD_CHARS", 256 * 1024))  # Text per process-pool shard
+UPLOAD_BUFFER_CHUNKS = int(os.environ.get("UPLOAD_BUFFER_CHUNKS", 64))  # Body chunks an upload may run ahead of its job
+UPLOAD_STALL_SECONDS = float(os.environ.get("UPLOAD_STALL_SECONDS", 300))  # An upload fails once its job reads nothing for this long
+UPLOAD_URL_PREFIX = "upload:"  # csv_url recorded for files sent to POST /upload (there is nothing to download again)
+HTTP_POOL_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", 50))
+HTTP_KEEPALIVE_SECONDS = float(os.environ.get("HTTP_KEEPALIVE_SECONDS", 60))
+HTTP_DNS_CACHE_SECONDS = int(os.environ.get("HTTP_DNS_CACHE_SECONDS", 300))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("HTTP_TIMEOUT_SECONDS", 120))
 
 # Back4App Configuration
 BACK4APP_API_BASE_URL = os.environ.get("BACK4APP_API_BASE_URL", "https://parseapi.back4app.com/classes")
@@ -85,6 +252,42 @@ BACK4APP_APP_ID = os.environ.get("BACK4APP_APP_ID", "mK60GEj1uzfoICD3dFxW75KZ5K7
 BACK4APP_MASTER_KEY = os.environ.get("BACK4APP_MASTER_KEY", "ZDYmU9PLUhJRhTscXJGBFlU8wThrKY6Q0alTtZu2")
 BACK4APP_TABLE_NAME = "API_Connector_Users"
 BACK4APP_CSV_TABLE_NAME = "Prelicensingcsv"
+# Parse serves /batch next to /classes; paths inside a batch are relative to the server root
+BACK4APP_BATCH_URL = f"{BACK4APP_API_BASE_URL.rsplit('/classes', 1)[0]}/batch"
+BACK4APP_BATCH_PATH = urlparse(BACK4APP_API_BASE_URL).path
+BACK4APP_BATCH_MAX = 50  # Parse rejects /batch calls with more requests than this
+BACK4APP_BATCH_SIZE = int(os.environ.get("BACK4APP_BATCH_SIZE", BACK4APP_BATCH_MAX))
+BACK4APP_QUERY_LIMIT = 1000  # Largest page Parse returns per query
+BACK4APP_LOOKUP_MAX_WHERE_CHARS = int(os.environ.get("BACK4APP_LOOKUP_MAX_WHERE_CHARS", 4000))
+BACK4APP_LOOKUP_CONCURRENCY = int(os.environ.get("BACK4APP_LOOKUP_CONCURRENCY", 4))
+PIPELINE_DEPTH = int(os.environ.get("PIPELINE_DEPTH", 2))  # Chunks whose lookups run ahead of the current chunk's writes
+RECORD_INDEX_MAX_SIZE = int(os.environ.get("RECORD_INDEX_MAX_SIZE", 200000))  # 0 disables the email → objectId cache
+RECORD_INDEX_TTL_SECONDS = float(os.environ.get("RECORD_INDEX_TTL_SECONDS", 6 * 3600))
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", 2))  # CSV jobs processed at once
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 10))  # Jobs allowed to wait before POSTs get 429
+JOB_RETRY_AFTER_SECONDS = int(os.environ.get("JOB_RETRY_AFTER_SECONDS", 30))
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get("SHUTDOWN_GRACE_SECONDS", 8))  # Cloud Run allows 10s after SIGTERM
+AGENTS_REFRESH_SECONDS = float(os.environ.get("AGENTS_REFRESH_SECONDS", 30))  # Max age of the dashboard snapshot
+AGENTS_FULL_RELOAD_SECONDS = float(os.environ.get("AGENTS_FULL_RELOAD_SECONDS", 3600))  # Picks up deleted records
+AGENTS_PAGE_SIZE = int(os.environ.get("AGENTS_PAGE_SIZE", 500))
+AGENTS_MAX_PAGE_SIZE = 1000
+STATIC_COMPRESS_MIN_BYTES = 1024  # Smaller frontend files are only served uncompressed
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # For script.js/styles.css requested with the ?v= index.html links to
+METRICS_RATE_WINDOW_SECONDS = float(os.environ.get("METRICS_RATE_WINDOW_SECONDS", 60))  # Window for the rows/sec gauges
+METRICS_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Seconds
+REPLICA_PATH = os.environ.get("REPLICA_PATH", "")  # SQLite file for the local API_Connector_Users replica; empty disables it
+REPLICA_MAX_STALENESS_SECONDS = float(os.environ.get("REPLICA_MAX_STALENESS_SECONDS", 60))  # Lookups sync first when older
+REPLICA_FULL_SYNC_SECONDS = float(os.environ.get("REPLICA_FULL_SYNC_SECONDS", 6 * 3600))  # Full pass that drops deleted records
+QUEUE_LARGE_FILES = os.environ.get("QUEUE_LARGE_FILES", "false").lower() == "true"  # Leave queued files to `main.py --worker`
+WORKER_ID = os.environ.get("WORKER_ID", f"{os.uname().nodename}-{os.getpid()}")
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 1))  # Queued files one worker processes at once
+WORKER_POLL_SECONDS = float(os.environ.get("WORKER_POLL_SECONDS", 15))
+WORKER_LEASE_SECONDS = int(os.environ.get("WORKER_LEASE_SECONDS", 300))  # Renewed on every checkpoint
+# Locked by the one serving process (of the gunicorn workers on this instance) that runs the startup resume pass
+RESUME_LOCK_PATH = os.environ.get("RESUME_LOCK_PATH", os.path.join(tempfile.gettempdir(), "csv-processor-resume.lock"))
+PROGRESS_FLUSH_SECONDS = float(os.environ.get("PROGRESS_FLUSH_SECONDS", 15))  # Longest gap between progress checkpoints
+PROGRESS_FLUSH_PERCENT = float(os.environ.get("PROGRESS_FLUSH_PERCENT", 10))  # ...or sooner, after this much of the file
+PROGRESS_KEEP_FINISHED = int(os.environ.get("PROGRESS_KEEP_FINISHED", 50))  # Finished jobs still shown at /jobs
 
 HEADERS = {
     "Authorization": f"Bearer {API_TOKEN}",
@@ -97,6 +300,278 @@ BACK4APP_HEADERS = {
     "Content-Type": "application/json",
 }
 
+# Metrics
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    """A Prometheus counter family, one value per label combination"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in self._values.items()]
+
+class Histogram(Counter):
+    """A Prometheus histogram family with fixed upper bounds (`buckets`, in ascending order)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = METRICS_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]  # Per-bucket counts, then the sum
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._values.items():
+                total = 0
+                for bound, count in zip(self.buckets, counts):
+                    total += count
+                    labels = _format_labels(self.labels + ("le",), key + (_format_value(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {total}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(counts[-1])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {total}")
+        return lines
+
+class ThroughputMeter:
+    """Rows per second over a sliding window"""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._events = deque()  # (monotonic time, rows)
+        self._lock = threading.Lock()
+
+    def add(self, rows: int):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, rows))
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._events and self._events[0][0] < now - self.window_seconds:
+            self._events.popleft()
+
+    def rate(self) -> float:
+        with self._lock:
+            self._trim(time.monotonic())
+            return sum(rows for _, rows in self._events) / self.window_seconds
+
+class Metrics:
+    """Process-wide metrics, rendered in the Prometheus text format at /metrics.
+
+    Counters and histograms are recorded where the work happens; state that other
+    components already track (limiters, pools, the job queue) is read at render
+    time by the collectors passed to add_collector().
+    """
+
+    def __init__(self):
+        self.rows = Counter("csv_rows_total", "CSV rows written to each sink, by outcome", ("sink", "result"))
+        self.duplicate_rows = Counter("csv_duplicate_rows_total", "CSV rows collapsed into a later row for the same email")
+        self.jobs = Counter("csv_jobs_total", "CSV jobs finished, by final status", ("status",))
+        self.job_rows_per_second = Histogram("csv_job_rows_per_second", "Throughput of finished CSV jobs", (),
+                                             (10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+        self.chunk_seconds = Histogram("csv_chunk_duration_seconds", "Time to look up and write one chunk")
+        self.request_seconds = Histogram("backend_request_duration_seconds", "Latency of one backend request attempt",
+                                         ("backend", "operation"))
+        self.responses = Counter("backend_responses_total", "Backend request attempts by response status ('error' for network errors)",
+                                 ("backend", "operation", "status"))
+        self.retries = Counter("backend_retries_total", "Backend requests retried", ("backend", "operation"))
+        self.throughput = ThroughputMeter(METRICS_RATE_WINDOW_SECONDS)
+        self._active_jobs = {}  # job → [rows, started at]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def add_rows(self, rows: int, job: str = ""):
+        """Count rows a job has finished (for rows/sec)"""
+        self.throughput.add(rows)
+        if job:
+            with self._lock:
+                progress = self._active_jobs.setdefault(job, [0, time.monotonic()])
+                progress[0] += rows
+
+    def job_started(self, job: str):
+        with self._lock:
+            self._active_jobs[job] = [0, time.monotonic()]
+
+    def job_finished(self, job: str, status: str):
+        self.jobs.inc(status=status)
+        with self._lock:
+            progress = self._active_jobs.pop(job, None)
+        if progress and progress[0]:
+            self.job_rows_per_second.observe(progress[0] / max(time.monotonic() - progress[1], 1e-6))
+
+    def add_collector(self, collector):
+        """Register `collector()` → [(name, type, help, [(labels dict, value)])] read at render time"""
+        self._collectors.append(collector)
+
+    def _job_families(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            jobs = list(self._active_jobs.items())
+        return [
+            ("csv_rows_per_second", "gauge", f"Rows per second over the last {METRICS_RATE_WINDOW_SECONDS:g}s", [({}, self.throughput.rate())]),
+            ("csv_job_rows_processed", "gauge", "Rows processed by each running job", [({"job": job}, rows) for job, (rows, _) in jobs]),
+            ("csv_job_current_rows_per_second", "gauge", "Throughput of each running job",
+             [({"job": job}, rows / max(now - started, 1e-6)) for job, (rows, started) in jobs]),
+        ]
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.rows, self.duplicate_rows, self.jobs, self.job_rows_per_second, self.chunk_seconds,
+                       self.request_seconds, self.responses, self.retries):
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}", *metric.samples()]
+        families = self._job_families()
+        for collector in self._collectors:
+            try:
+                families += collector()
+            except Exception as e:
+                logger.warning(f"[METRICS] Collector {getattr(collector, '__name__', collector)} failed: {e}")
+        for name, kind, help_text, samples in families:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def request_operation(method: str, url: str) -> str:
+    """Metrics label for a backend request: batch, status (Prelicensingcsv), lookup, create, update or delete"""
+    if url.startswith(BACK4APP_BATCH_URL) or url.endswith("/bulk"):
+        return "batch"
+    if f"/{BACK4APP_CSV_TABLE_NAME}" in url:
+        return "status"
+    return {"GET": "lookup", "POST": "create", "PUT": "update", "PATCH": "update", "DELETE": "delete"}.get(method.upper(), method.lower())
+
+# Shared HTTP Client
+class HttpClient:
+    """Process-wide aiohttp session with pooled keep-alive connections and a DNS cache.
+
+    Bubble, Back4App and CSV downloads all share it, so TLS handshakes and DNS
+    lookups are paid once per connection instead of once per job. A session
+    belongs to one event loop; get_session() opens a new one if called from a
+    different loop.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+        self.requests_total = 0
+        self.requests_in_flight = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.connections_reused += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.dns_cache_misses += 1
+
+        async def on_request_start(session, ctx, params):
+            self.requests_total += 1
+            self.requests_in_flight += 1
+
+        async def on_request_end(session, ctx, params):
+            self.requests_in_flight -= 1
+
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_end)
+        return trace
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Open the session on the running loop"""
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS, sock_connect=30),
+            trace_configs=[self._trace_config()],
+        )
+        self._loop = asyncio.get_running_loop()
+        logger.info(f"[HTTP] Connection pool ready (limit {HTTP_POOL_LIMIT}, {HTTP_POOL_LIMIT_PER_HOST} per host)")
+        return self._session
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed or self._loop is not asyncio.get_running_loop():
+            return await self.start()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        connector = self._session.connector if self._session is not None and not self._session.closed else None
+        return {
+            "open": connector is not None,
+            "limit": HTTP_POOL_LIMIT,
+            "limit_per_host": HTTP_POOL_LIMIT_PER_HOST,
+            # aiohttp has no public pool introspection; these read the connector's bookkeeping
+            "idle_connections": sum(len(conns) for conns in list(getattr(connector, "_conns", {}).values())) if connector else 0,
+            "active_connections": len(getattr(connector, "_acquired", ())) if connector else 0,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses,
+            "requests_total": self.requests_total,
+            "requests_in_flight": self.requests_in_flight,
+        }
+
+http_client = HttpClient()
+
 # Helper Functions
 def sanitize_phone(phone: str) -> str:
     digits = ''.join(filter(str.isdigit, phone or ''))
@@ -118,6 +593,11 @@ def parse_csv_date(s: str) -> Optional[datetime]:
         logger.warning(f"Couldn’t parse DateEnrolled '{s}': {e}")
         return None
 
+@functools.lru_cache(maxsize=65536)
+def parse_iso_utc(s: str) -> datetime:
+    """ISO 8601 string → UTC datetime; memoized since diffs re-parse the same payload and record dates"""
+    return datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(timezone.utc)
+
 def parse_record_date(s) -> datetime:
     # Se for um dicionário do Back4App com formato de data
     if isinstance(s, dict) and "__type" in s and s["__type"] == "Date":
@@ -126,9 +606,7 @@ def parse_record_date(s) -> datetime:
     # Se for string, processar normalmente
     if isinstance(s, str) and s.strip():
         try:
-            dt_aware = datetime.fromisoformat(s.replace("Z", "+00:00"))
-            dt_utc = dt_aware.astimezone(timezone.utc)
-            return dt_utc
+            return parse_iso_utc(s)
         except ValueError as e:
             # Tentar parsing alternativo com dateutil
             try:
@@ -148,18 +626,154 @@ def parse_record_date(s) -> datetime:
 def to_utc_iso(dt: datetime) -> str:
     return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
-def to_payload(row: dict) -> dict:
-    phone = sanitize_phone(row.get("Phone", ""))
-    enrolled = parse_csv_date(row.get("DateEnrolled", ""))
-    logged = parse_csv_date(row.get("LastLoggedIn", ""))
-    completed = parse_csv_date(row.get("PLE DateCompleted", ""))
+# Row Transformer
+# Tried in order when detecting a date column's format; "iso" means datetime.fromisoformat
+CSV_DATE_FORMATS = (
+    "%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %I:%M %p", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y",
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "iso",
+)
+_NO_DATE_FORMAT = ""  # Detected format of a column whose first value fit none of CSV_DATE_FORMATS
+ROW_DATE_CACHE_MAX = 50000  # Memoized date cells per transformer before the memo is reset
+# The only columns the payload builders read, in the order RowTransformer.build() takes them
+CSV_ROW_COLUMNS = (
+    "EmailAddress", "Phone", "DateEnrolled", "LastLoggedIn", "PLE DateCompleted", "% PLE Complete", "% Prep Complete",
+    "% Sim Complete", "FirstName", "LastName", "Department", "HiringManager", "Course", "Prepared to Pass", "TimeSpent",
+)
+
+class CsvRow(NamedTuple):
+    """One CSV row as the pipeline holds it: the cells the payload builders use, parsed once.
+
+    Other columns are not kept, and text cells that repeat across an export
+    (IMO, hiring manager, course, prepared to pass) are interned. Text cells are
+    None when the row has no such column, as csv.DictReader would give.
+    """
+    email: str
+    phone: str
+    enrolled: Optional[str]  # UTC ISO strings
+    logged: Optional[str]
+    completed: Optional[str]
+    ple_complete: Optional[float]
+    prep_complete: Optional[float]
+    sim_complete: Optional[float]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    department: Optional[str]
+    hiring_manager: Optional[str]
+    course: Optional[str]
+    prepared_to_pass: Optional[str]
+    time_spent: Optional[str]
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+class RowTransformer:
+    """Turns the rows of one CSV file into CsvRows, parsing email, phone, date and number cells once per row.
+
+    Both payload builders read the resulting CsvRow instead of re-parsing the row.
+    Each date column's format is detected from its first value (kept only if it
+    agrees with dateutil) and used through strptime afterwards; values it does not
+    fit go through parse_csv_date as before. Parsed date cells are memoized, since
+    exports repeat the same dates across many rows.
+    """
+
+    def __init__(self):
+        self._formats: dict[str, str] = {}  # column → format, or _NO_DATE_FORMAT; absent until detected
+        self._dates: dict[str, Optional[str]] = {}
+        self._header: Optional[list] = None
+        self._indexes: tuple = ()
+
+    @staticmethod
+    def _strptime(value: str, fmt: str) -> datetime:
+        return datetime.fromisoformat(value) if fmt == "iso" else datetime.strptime(value, fmt)
+
+    def _detect_format(self, value: str) -> str:
+        try:
+            expected = dateutil.parser.parse(value)
+        except (ValueError, OverflowError):
+            return _NO_DATE_FORMAT
+        for fmt in CSV_DATE_FORMATS:
+            try:
+                if self._strptime(value, fmt) == expected:
+                    return fmt
+            except ValueError:
+                continue
+        return _NO_DATE_FORMAT
+
+    def parse_date(self, column: str, value: Optional[str]) -> Optional[str]:
+        """UTC ISO string for a date cell, or None if it is empty or unparseable"""
+        if not value or not value.strip():
+            return None
+        if value in self._dates:
+            return self._dates[value]
+        fmt = self._formats.get(column)
+        if fmt is None:
+            fmt = self._formats[column] = self._detect_format(value.strip())
+        dt = None
+        if fmt != _NO_DATE_FORMAT:
+            try:
+                dt = self._strptime(value.strip(), fmt).astimezone(timezone.utc)
+            except ValueError:
+                dt = None
+        if dt is None:
+            dt = parse_csv_date(value)
+        iso = to_utc_iso(dt) if dt else None
+        if len(self._dates) >= ROW_DATE_CACHE_MAX:
+            self._dates.clear()
+        self._dates[value] = iso
+        return iso
+
+    def build(self, email, phone, enrolled, logged, completed, ple_complete, prep_complete, sim_complete,
+              first_name, last_name, department, hiring_manager, course, prepared_to_pass, time_spent) -> CsvRow:
+        """CsvRow from the raw CSV_ROW_COLUMNS cells (None for a missing column)"""
+        return CsvRow(
+            (email or "").lower().strip(),
+            sanitize_phone(phone),
+            self.parse_date("DateEnrolled", enrolled),
+            self.parse_date("LastLoggedIn", logged),
+            self.parse_date("PLE DateCompleted", completed),
+            parse_number(ple_complete),
+            parse_number(prep_complete),
+            parse_number(sim_complete),
+            first_name,
+            last_name,
+            _intern(department),
+            _intern(hiring_manager),
+            _intern(course),
+            _intern(prepared_to_pass),
+            time_spent,
+        )
+
+    def from_cells(self, header: list, cells: list) -> CsvRow:
+        """CsvRow from a csv.reader record, picking cells by their index in `header` (no per-row dict)"""
+        if header is not self._header:
+            positions = {name: i for i, name in enumerate(header)}  # A repeated header name means its last column, as in DictReader
+            self._header = header
+            self._indexes = tuple(positions.get(column, sys.maxsize) for column in CSV_ROW_COLUMNS)
+        size = len(cells)
+        return self.build(*[cells[i] if i < size else None for i in self._indexes])
+
+    def record(self, row: Union[dict, CsvRow]) -> CsvRow:
+        if isinstance(row, CsvRow):
+            return row  # Already built while parsing (or by the process pool)
+        return self.build(*[row.get(column) for column in CSV_ROW_COLUMNS])
+
+    async def records(self, rows: Union[Iterable[Union[dict, CsvRow]], AsyncIterator[Union[dict, CsvRow]]]) -> AsyncIterator[CsvRow]:
+        """Turn a sync or async iterable of one file's rows (dicts or CsvRows) into CsvRows as they stream by"""
+        if hasattr(rows, "__aiter__"):
+            async for row in rows:
+                yield self.record(row)
+        else:
+            for row in rows:
+                yield self.record(row)
 
-    ple_complete = parse_number(row.get("% PLE Complete", ""))
-    prep_complete = parse_number(row.get("% Prep Complete", ""))
-    sim_complete = parse_number(row.get("% Sim Complete", ""))
+# Used for rows that did not come through a per-file transformer
+row_transformer = RowTransformer()
 
-    raw_email = row.get("EmailAddress", "")
-    email = raw_email.lower().strip()
+def to_payload(row: Union[CsvRow, dict]) -> dict:
+    row = row_transformer.record(row)
+    enrolled = row.enrolled
+    completed = row.completed
+    email = row.email
 
     payload = {
         "UserPreLicensingEMAIL": email,  # ✅ Campo correto do Bubble
@@ -167,46 +781,40 @@ def to_payload(row: dict) -> dict:
         # Removido last_name - campo não reconhecido pela API do Bubble
         # Removido phone - campo não reconhecido pela API do Bubble
         # Removido imo - campo não reconhecido pela API do Bubble
-        **({"date_enrolled": to_utc_iso(enrolled)} if enrolled else {}),
+        **({"date_enrolled": enrolled} if enrolled else {}),
         # Removido pre_licensing_course_last_login - campo não reconhecido pela API do Bubble
         # Removido time_spent_in_course - campo não reconhecido pela API do Bubble
         # Removido percentage_ple_complete - campo não reconhecido pela API do Bubble
         # Removido percentage_prep_complete - campo não reconhecido pela API do Bubble
         # Removido percentage_sim_complete - campo não reconhecido pela API do Bubble
-        **({"ple_date_completed": to_utc_iso(completed)} if completed else {}),
-        "pre_licensing_course": row.get("Course"),
-        "hiring_manager": row.get("HiringManager"),
-        "prepared_to_pass": row.get("Prepared to Pass"),
+        **({"ple_date_completed": completed} if completed else {}),
+        "pre_licensing_course": row.course,
+        "hiring_manager": row.hiring_manager,
+        "prepared_to_pass": row.prepared_to_pass,
     }
     return {k: v for k, v in payload.items() if v is not None}
 
-def to_back4app_payload(row: dict) -> dict:
+def to_back4app_payload(row: Union[CsvRow, dict]) -> dict:
     """Map CSV row to Back4App API_Connector_Users format"""
-    phone = sanitize_phone(row.get("Phone", ""))
-    enrolled = parse_csv_date(row.get("DateEnrolled", ""))
-    logged = parse_csv_date(row.get("LastLoggedIn", ""))
-    completed = parse_csv_date(row.get("PLE DateCompleted", ""))
-
-    ple_complete = parse_number(row.get("% PLE Complete", ""))
-    prep_complete = parse_number(row.get("% Prep Complete", ""))
-    sim_complete = parse_number(row.get("% Sim Complete", ""))
-
-    raw_email = row.get("EmailAddress", "")
-    email = raw_email.lower().strip()
+    row = row_transformer.record(row)
+    phone = row.phone
+    enrolled, logged, completed = row.enrolled, row.logged, row.completed
+    ple_complete, prep_complete, sim_complete = row.ple_complete, row.prep_complete, row.sim_complete
+    email = row.email
 
     payload = {
-        "first_name_text": row.get("FirstName") or "",
-        "last_name_text": row.get("LastName") or "",
+        "first_name_text": row.first_name or "",
+        "last_name_text": row.last_name or "",
         "pre_licensing_email_text": email,
         "phone_text": phone or "",
-        "imo_custom_imo": row.get("Department") or "",
-        "hiring_manager_text": row.get("HiringManager") or "",
-        "pre_licensing_course_text": row.get("Course") or "",
-        "prepared_to_pass_text": row.get("Prepared to Pass") or "",
-        "time_spent_text": row.get("TimeSpent") or "",
-        **({"date_enrolled_date": {"__type": "Date", "iso": to_utc_iso(enrolled)}} if enrolled else {}),
-        **({"pre_licensing_course_last_login_date": {"__type": "Date", "iso": to_utc_iso(logged)}} if logged else {}),
-        **({"ple_date_completed_date": {"__type": "Date", "iso": to_utc_iso(completed)}} if completed else {}),
+        "imo_custom_imo": row.department or "",
+        "hiring_manager_text": row.hiring_manager or "",
+        "pre_licensing_course_text": row.course or "",
+        "prepared_to_pass_text": row.prepared_to_pass or "",
+        "time_spent_text": row.time_spent or "",
+        **({"date_enrolled_date": {"__type": "Date", "iso": enrolled}} if enrolled else {}),
+        **({"pre_licensing_course_last_login_date": {"__type": "Date", "iso": logged}} if logged else {}),
+        **({"ple_date_completed_date": {"__type": "Date", "iso": completed}} if completed else {}),
         **({"ple_complete_number": ple_complete} if ple_complete is not None else {}),
         **({"percentage_prep_complete_number": prep_complete} if prep_complete is not None else {}),
         **({"percentage_sim_complete_number": sim_complete} if sim_complete is not None else {}),
@@ -214,33 +822,242 @@ def to_back4app_payload(row: dict) -> dict:
     # Retornar todos os campos, mesmo os vazios, para garantir dados completos
     return payload
 
+# Adaptive Rate Limiting
+class AdaptiveLimiter:
+    """Token bucket plus AIMD concurrency limit for one backend.
+
+    Every request takes a concurrency slot and a token. Successes raise the
+    request rate and the concurrency limit additively; a 429/503 halves both
+    and pauses the backend for the server's Retry-After. Usable from any
+    thread or event loop.
+    """
+
+    def __init__(self, name: str, max_rate: float, max_concurrency: int, min_rate: float = 1.0, min_concurrency: int = 1):
+        self.name = name
+        self.max_rate = max(max_rate, min_rate)
+        self.min_rate = min_rate
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.min_concurrency = min_concurrency
+        self.rate = self.max_rate
+        self.limit = float(self.max_concurrency)
+        self._tokens = self.max_rate
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._decreased_at = 0.0
+        self._in_flight = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.requests_total = 0
+        self.throttled_total = 0
+        self.retries_total = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _wake(self):
+        # Called with the lock held: wake one waiter per free slot
+        free = int(self.limit) - self._in_flight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.get_loop().call_soon_threadsafe(_resolve_waiter, fut)
+                free -= 1
+
+    async def acquire(self):
+        while True:
+            with self._lock:
+                if self._in_flight < max(int(self.limit), self.min_concurrency):
+                    self._in_flight += 1
+                    self.requests_total += 1
+                    break
+                fut = asyncio.get_running_loop().create_future()
+                self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                with self._lock:
+                    if fut in self._waiters:
+                        self._waiters.remove(fut)
+                raise
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._blocked_until - now
+                    if wait <= 0:
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            return
+                        wait = (1 - self._tokens) / self.rate
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+            self._wake()
+
+    def on_throttle(self, retry_after: Optional[float]):
+        with self._lock:
+            self.throttled_total += 1
+            now = time.monotonic()
+            # Requests already in flight when we backed off report the same overload; count it once
+            if now - self._decreased_at >= 1.0:
+                self._decreased_at = now
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        logger.warning(f"[RATE LIMIT] {self.name} throttled, now {self.rate:.1f} req/s and {int(self.limit)} in flight"
+                       + (f", paused {retry_after:.1f}s" if retry_after else ""))
+
+    def on_retry(self):
+        with self._lock:
+            self.retries_total += 1
+
+    def share(self, parts: int):
+        """Keep 1/`parts` of the configured rate and concurrency (one of `parts` processes using the same backend)"""
+        with self._lock:
+            self.max_rate = max(self.max_rate / parts, self.min_rate)
+            self.max_concurrency = max(self.max_concurrency // parts, self.min_concurrency)
+            self.rate = min(self.rate, self.max_rate)
+            self.limit = min(self.limit, float(self.max_concurrency))
+            self._tokens = min(self._tokens, self.rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "max_rate": self.max_rate,
+                "concurrency_limit": int(self.limit),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "requests_total": self.requests_total,
+                "throttled_total": self.throttled_total,
+                "retries_total": self.retries_total,
+            }
+
+def _resolve_waiter(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
+
+back4app_limiter = AdaptiveLimiter("back4app", BACK4APP_RATE_LIMIT, BACK4APP_MAX_IN_FLIGHT)
+bubble_limiter = AdaptiveLimiter("bubble", BUBBLE_RATE_LIMIT, BUBBLE_MAX_IN_FLIGHT)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class DuplicateRequestError(Exception):
+    """Parse rejected a write whose X-Parse-Request-Id it already applied (an earlier attempt succeeded)"""
+
+def write_request_id(*parts) -> str:
+    """Deterministic X-Parse-Request-Id for a write, so retries and resumed jobs reuse it"""
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+def idempotent_write_headers(*parts) -> dict:
+    if not BACK4APP_IDEMPOTENT_WRITES:
+        return BACK4APP_HEADERS
+    return {**BACK4APP_HEADERS, "X-Parse-Request-Id": write_request_id(*parts)}
+
+def parse_error_code(body: str):
+    try:
+        return json.loads(body).get("code")
+    except (ValueError, AttributeError):
+        return None
+
+async def request_with_limits(session, limiter: AdaptiveLimiter, method: str, url: str, headers: dict,
+                              idempotent: Optional[bool] = None, **kwargs) -> tuple[int, str]:
+    """Send a request through `limiter` and return (status, body text).
+
+    Throttled responses (429) are always retried after Retry-After or a jittered
+    backoff, since the server did not apply them. A 503 also slows the limiter down,
+    but like other 5xx responses and network errors (which a proxy may return after
+    the write went through) it is retried only for idempotent requests (GET/PUT/PATCH/DELETE by default,
+    or any request carrying an X-Parse-Request-Id). Raises DuplicateRequestError when
+    Parse reports that request id as already applied, and aiohttp.ClientResponseError
+    for any other final non-2xx response.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS or "X-Parse-Request-Id" in headers
+    operation = request_operation(method, url)
+    attempt = 0
+    throttles = 0
+    while True:
+        attempt += 1
+        status = None
+        retry_after = None
+        async with limiter.slot():
+            started = time.monotonic()
+            try:
+                async with session.request(method, url, headers=headers, **kwargs) as resp:
+                    status = resp.status
+                    body = await resp.text()
+                    if status < 400:
+                        limiter.on_success()
+                        return status, body
+                    if status == 400 and "X-Parse-Request-Id" in headers and parse_error_code(body) == PARSE_DUPLICATE_REQUEST:
+                        limiter.on_success()
+                        raise DuplicateRequestError(f"{method} {url} already applied (X-Parse-Request-Id {headers['X-Parse-Request-Id']})")
+                    if status in SLOWDOWN_STATUSES:
+                        retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                        limiter.on_throttle(retry_after)
+                    error = aiohttp.ClientResponseError(resp.request_info, resp.history, status=status,
+                                                        message=resp.reason or "", headers=resp.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                metrics.request_seconds.observe(time.monotonic() - started, backend=limiter.name, operation=operation)
+                metrics.responses.inc(backend=limiter.name, operation=operation, status=status or "error")
+        
+        if status in THROTTLE_STATUSES and throttles < THROTTLE_RETRY_TOTAL:
+            throttles += 1
+        elif not (idempotent and (status is None or status in STATUS_FORCELIST)) or attempt - throttles >= RETRY_TOTAL:
+            raise error
+        delay = max(retry_after or 0.0, random.uniform(0, BACKOFF_FACTOR * (2 ** (attempt - 1))))
+        limiter.on_retry()
+        metrics.retries.inc(backend=limiter.name, operation=operation)
+        logger.warning(f"{limiter.name} request {method} {url} failed (attempt {attempt}): {error}; retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
 # Retryable Request
 async def request_with_retries(session, method, url, **kwargs):
-    for attempt in range(1, RETRY_TOTAL + 1):
-        try:
-            async with session.request(method, url, headers=HEADERS, **kwargs) as resp:
-                if resp.status in STATUS_FORCELIST:
-                    raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
-                return await resp.json() if method.upper() == "GET" else None
-        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            logger.warning(f"Request {method} {url} failed (attempt {attempt}): {e}")
-            if attempt == RETRY_TOTAL:
-                raise
-            await asyncio.sleep(BACKOFF_FACTOR * (2 ** (attempt - 1)))
+    status, body = await request_with_limits(session, bubble_limiter, method, url, HEADERS, **kwargs)
+    return json.loads(body) if method.upper() == "GET" and body else None
 
 # Retryable Request for Back4App
 async def request_with_retries_back4app(session, method, url, **kwargs):
-    for attempt in range(1, RETRY_TOTAL + 1):
-        try:
-            async with session.request(method, url, headers=BACK4APP_HEADERS, **kwargs) as resp:
-                if resp.status in STATUS_FORCELIST:
-                    raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
-                return await resp.json() if method.upper() == "GET" else None
-        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            logger.warning(f"Back4App Request {method} {url} failed (attempt {attempt}): {e}")
-            if attempt == RETRY_TOTAL:
-                raise
-            await asyncio.sleep(BACKOFF_FACTOR * (2 ** (attempt - 1)))
+    status, body = await request_with_limits(session, back4app_limiter, method, url, BACK4APP_HEADERS, **kwargs)
+    return json.loads(body) if method.upper() == "GET" and body else None
 
 # Async API Calls
 async def get_records_by_emails(session: aiohttp.ClientSession, emails: list[str]) -> dict:
@@ -264,48 +1081,434 @@ async def get_records_by_emails(session: aiohttp.ClientSession, emails: list[str
 
 async def create_record(session: aiohttp.ClientSession, payload: dict):
     url = f"{API_BASE_URL}/{TABLE_NAME}"
-    logger.info(f"[CREATE] Sending POST to {url} with payload: {json.dumps(payload)}")
+    logger.debug("[CREATE] Sending POST to %s with payload: %s", url, LogPayload(payload))
     try:
-        async with session.post(url, headers=HEADERS, json=payload) as resp:
-            body = await resp.text()
-            logger.info(f"[CREATE RESPONSE] status={resp.status}, body={body}")
-            resp.raise_for_status()
-            try:
-                data = json.loads(body)
-                logger.debug(f"[CREATE DATA] {data}")
-            except Exception:
-                logger.debug("[CREATE DATA] Response not JSON")
-        logger.info(f"[CREATE SUCCESS] {payload.get('UserPreLicensingEMAIL')}")
+        status, body = await request_with_limits(session, bubble_limiter, "POST", url, HEADERS, json=payload)
+        logger.debug("[CREATE RESPONSE] status=%s, body=%s", status, LogPayload(body))
+        try:
+            data = json.loads(body)
+            logger.debug("[CREATE DATA] %s", LogPayload(data))
+        except Exception:
+            logger.debug("[CREATE DATA] Response not JSON")
+        logger.info("[CREATE SUCCESS] %s", payload.get('UserPreLicensingEMAIL'), extra={"category": "row"})
     except Exception as e:
         logger.error(f"[CREATE FAILED] {payload.get('UserPreLicensingEMAIL')} → {e}")
         raise
 
 async def update_record(session: aiohttp.ClientSession, record_id: str, payload: dict, email: str):
     url = f"{API_BASE_URL}/{TABLE_NAME}/{record_id}"
-    logger.info(f"[UPDATE] Sending PATCH to {url} with payload: {json.dumps(payload)}")
+    logger.debug("[UPDATE] Sending PATCH to %s with payload: %s", url, LogPayload(payload))
     try:
-        async with session.patch(url, headers=HEADERS, json=payload) as resp:
-            body = await resp.text()
-            logger.info(f"[UPDATE RESPONSE] status={resp.status}, body={body}")
-            resp.raise_for_status()
-            try:
-                data = json.loads(body)
-                logger.debug(f"[UPDATE DATA] {data}")
-            except Exception:
-                logger.debug("[UPDATE DATA] Response not JSON")
-        logger.info(f"[UPDATE SUCCESS] {email}")
+        status, body = await request_with_limits(session, bubble_limiter, "PATCH", url, HEADERS, json=payload)
+        logger.debug("[UPDATE RESPONSE] status=%s, body=%s", status, LogPayload(body))
+        try:
+            data = json.loads(body)
+            logger.debug("[UPDATE DATA] %s", LogPayload(data))
+        except Exception:
+            logger.debug("[UPDATE DATA] Response not JSON")
+        logger.info("[UPDATE SUCCESS] %s", email, extra={"category": "row"})
     except Exception as e:
         logger.error(f"[UPDATE FAILED] {email} → {e}")
         raise
 
+async def create_records_bulk(session: aiohttp.ClientSession, payloads: list[dict]) -> list[dict]:
+    """Create records with one Data API /bulk call; returns a {"status", "id"|"message"} dict per payload.
+
+    The body is one JSON object per line (text/plain) and so is the response, in the same order.
+    """
+    url = f"{API_BASE_URL}/{TABLE_NAME}/bulk"
+    body = "\n".join(json.dumps(payload) for payload in payloads)
+    logger.debug("[BULK CREATE] Sending %s records to %s", len(payloads), url)
+    status, text = await request_with_limits(session, bubble_limiter, "POST", url,
+                                             {**HEADERS, "Content-Type": "text/plain"}, data=body)
+    results = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if len(results) != len(payloads):
+        raise RuntimeError(f"Bubble /bulk returned {len(results)} results for {len(payloads)} records")
+    return results
+
+# CSV Streaming
+class _FallbackDecoder:
+    """Incremental decoder with the utf-8 → cp1252 → utf-8 (replace) fallback chain.
+
+    Text decoded before the first invalid byte is kept; only the remainder of the
+    stream is decoded with the next encoding in the chain.
+    """
+
+    def __init__(self):
+        self.encoding = "utf-8"
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def decode(self, data: bytes, final: bool = False) -> str:
+        try:
+            return self._decoder.decode(data, final)
+        except UnicodeDecodeError as e:
+            pending = e.object
+            decoded = pending[:e.start].decode(self.encoding)
+            if self.encoding == "utf-8":
+                self.encoding = "cp1252"
+                self._decoder = codecs.getincrementaldecoder("cp1252")()
+            else:
+                self.encoding = "utf-8-replace"
+                self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            logger.warning(f"[CSV STREAM] Invalid byte in CSV body, falling back to {self.encoding}")
+            return decoded + self.decode(pending[e.start:], final)
+
+    def copy(self) -> "_FallbackDecoder":
+        """An independent decoder in the same state, for decoding the same bytes a second time"""
+        clone = _FallbackDecoder()
+        clone.encoding = self.encoding
+        clone._decoder = type(self._decoder)(self._decoder.errors)
+        clone._decoder.setstate(self._decoder.getstate())
+        return clone
+
+class _RecordFeed:
+    """Iterator handed to csv.reader; yields complete CSV records queued by the splitter."""
+
+    def __init__(self):
+        self.records = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.records:
+            raise StopIteration
+        return self.records.popleft()
+
+def _split_records(lines: list[str], state: dict) -> list[str]:
+    """Join physical lines into logical CSV records (quoted fields may contain newlines)."""
+    records = []
+    for line in lines:
+        state["parts"].append(line)
+        if line.count('"') % 2:
+            state["in_quotes"] = not state["in_quotes"]
+        if not state["in_quotes"]:
+            records.append("".join(state["parts"]))
+            state["parts"] = []
+    return records
+
+async def iter_csv_rows(text_chunks: AsyncIterator[str]) -> AsyncIterator[CsvRow]:
+    """Parse CSV text chunks into CsvRows without holding the whole file.
+
+    Each record goes from its csv.reader cells straight to a CsvRow (one
+    RowTransformer per file). Rows whose cells are all empty are skipped, as the
+    list-based ingestion did.
+    """
+    feed = _RecordFeed()
+    reader = csv.reader(feed)
+    transformer = RowTransformer()
+    state = {"parts": [], "in_quotes": False}
+    fieldnames = None
+    tail = ""
+
+    def parse(records):
+        nonlocal fieldnames
+        for record in records:
+            feed.records.append(record)
+            row = next(reader)
+            if fieldnames is None:
+                fieldnames = row
+                continue
+            if any(row):
+                yield transformer.from_cells(fieldnames, row)
+
+    async for text in text_chunks:
+        lines = (tail + text).split("\n")
+        tail = lines.pop()
+        for item in parse(_split_records([line + "\n" for line in lines], state)):
+            yield item
+
+    leftover = _split_records([tail], state) if tail else []
+    if state["parts"]:
+        leftover.append("".join(state["parts"]))
+    for item in parse(leftover):
+        yield item
+
+class CsvStream:
+    """A single CSV download, decoded and parsed incrementally as it arrives."""
+
+    def __init__(self, byte_chunks: AsyncIterator[bytes], fingerprint: str = ""):
+        self._byte_chunks = byte_chunks
+        self.fingerprint = fingerprint  # See source_fingerprint()
+        self._decoder = _FallbackDecoder()
+        self._buffered: list[str] = []
+        self._eof = False
+        self._hasher = hashlib.blake2b(digest_size=16)
+        self._spooled: Optional[deque] = None  # Raw chunks read ahead by spool(), not decoded yet
+        self.bytes_read = 0
+        self.downloaded = False  # The whole body has been read (and hashed)
+
+    async def _next_bytes(self) -> bytes:
+        if self.downloaded:
+            return b""
+        try:
+            data = await self._byte_chunks.__anext__()
+        except StopAsyncIteration:
+            data = b""
+        if data:
+            self.bytes_read += len(data)
+            self._hasher.update(data)
+        else:
+            self.downloaded = True
+        return data
+
+    async def _read_text(self) -> Optional[str]:
+        if self._eof:
+            return None
+        data = self._spooled.popleft() if self._spooled else await self._next_bytes()
+        if not data:
+            self._eof = True
+            return self._decoder.decode(b"", final=True)
+        return self._decoder.decode(data)
+
+    async def spool(self, limit: int = CSV_SPOOL_MEMORY_BYTES) -> str:
+        """Read ahead up to `limit` bytes of the body and return its content hash, or "" if the body is longer.
+
+        Rows are then parsed from the read-ahead chunks, so a file that fits can be
+        recognised as a duplicate before any of it is written. A longer body keeps
+        streaming after the read-ahead part (memory stays bounded by `limit`) and
+        its content_hash is only complete once the rows have all been read.
+        """
+        if self._spooled is None and not self._eof:
+            self._spooled = deque()
+            size = 0
+            while size <= limit:
+                data = await self._next_bytes()
+                if not data:
+                    break
+                self._spooled.append(data)
+                size += len(data)
+        return self.content_hash
+
+    @property
+    def content_hash(self) -> str:
+        """blake2b of the raw body; "" until the whole body has been read"""
+        return self._hasher.hexdigest() if self.downloaded else ""
+
+    def estimate_rows(self) -> Optional[int]:
+        """Data rows in a body spool() read completely, counted by line breaks (quoted newlines overcount); else None"""
+        if self._spooled is None or not self.downloaded:
+            return None
+        lines = sum(text.count("\n") for text in self._buffered) + sum(data.count(b"\n") for data in self._spooled)
+        return max(0, lines - 1)
+
+    async def peek(self, limit: int) -> str:
+        """Buffer at least `limit` characters (or the whole body if shorter) and return them."""
+        size = sum(len(text) for text in self._buffered)
+        while size < limit and not self._eof:
+            text = await self._read_text()
+            self._buffered.append(text)
+            size += len(text)
+        return "".join(self._buffered)
+
+    async def read(self) -> str:
+        """Read the remaining body into memory (only for small files)."""
+        text = await self.peek(sys.maxsize)
+        self._buffered = []
+        return text
+
+    async def _text_chunks(self) -> AsyncIterator[str]:
+        while self._buffered:
+            yield self._buffered.pop(0)
+        while True:
+            text = await self._read_text()
+            if text is None:
+                break
+            yield text
+
+    async def read_ahead_rows(self) -> AsyncIterator[CsvRow]:
+        """Parse the part of the body peek() and spool() read ahead, without consuming it (call before rows()).
+
+        If the body is longer than that, its last row here may be cut off, so it is left out.
+        """
+        async def text_chunks():
+            for text in list(self._buffered):
+                yield text
+            decoder = self._decoder.copy()
+            for data in list(self._spooled or ()):
+                yield decoder.decode(data)
+            if self.downloaded:
+                yield decoder.decode(b"", final=True)
+
+        previous = None
+        async for row in iter_csv_rows(text_chunks()):
+            if previous is not None:
+                yield previous
+            previous = row
+        if previous is not None and self.downloaded:
+            yield previous
+
+    def rows(self) -> AsyncIterator[CsvRow]:
+        """Async generator over the CSV rows as CsvRows; buffered text from peek() is parsed first.
+
+        With CSV_PARSE_WORKERS set, rows are parsed and transformed in the process pool.
+        """
+        if CSV_PARSE_WORKERS > 0:
+            return parallel_csv_records(self._text_chunks())
+        return iter_csv_rows(self._text_chunks())
+
+def source_fingerprint(headers) -> str:
+    """Identify a download's body from its response headers ("" when the server sends nothing usable)"""
+    etag = headers.get("ETag", "")
+    if etag and not etag.startswith("W/"):  # Weak ETags do not promise identical bytes
+        return f"etag:{etag}"
+    if headers.get("Content-Length") and headers.get("Last-Modified"):
+        return f"size:{headers['Content-Length']}:{headers['Last-Modified']}"
+    return ""
+
+@asynccontextmanager
+async def open_csv_stream(session: aiohttp.ClientSession, url: str):
+    """Start downloading `url` and yield a CsvStream over its body."""
+    # The body is consumed while rows are being written, so only bound socket reads
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+    try:
+        async with session.get(url, timeout=timeout) as resp:
+            resp.raise_for_status()
+            yield CsvStream(resp.content.iter_chunked(CSV_STREAM_CHUNK_BYTES), source_fingerprint(resp.headers))
+    except aiohttp.ClientError as e:
+        logger.error(f"Failed to fetch CSV from {url}: {e}")
+        raise
+
+def store_content_hash(checkpoint, stream: CsvStream):
+    """Wrap a job checkpoint so it also stores the stream's content_hash once the whole body has been read.
+
+    Bodies larger than CSV_SPOOL_MEMORY_BYTES are only hashed while their rows
+    stream, so their completed job is the first checkpoint that knows the hash.
+    """
+    async def store(status: str, processed_records: int, error_message: str = "", fields: Optional[dict] = None):
+        if stream.downloaded:
+            fields = {**(fields or {}), "content_hash": stream.content_hash}
+        return await checkpoint(status, processed_records, error_message, fields)
+    return store
+
+async def iter_chunks(rows: Union[Iterable[CsvRow], AsyncIterator[CsvRow]], size: Union[int, Callable[[], int]]) -> AsyncIterator[list[CsvRow]]:
+    """Group a sync or async iterable of rows into lists of at most `size` rows.
+
+    `size` may be a callable, read again for every chunk.
+    """
+    chunk_size = size if callable(size) else lambda: size
+    chunk = []
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size():
+                yield chunk
+                chunk = []
+    else:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size():
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+# CPU Stage (process pool)
+_csv_pool: Optional[ProcessPoolExecutor] = None
+_csv_pool_lock = threading.Lock()
+_shard_transformers: "OrderedDict[str, RowTransformer]" = OrderedDict()  # Per worker process, keyed by file
+
+def get_csv_pool() -> ProcessPoolExecutor:
+    """Process pool shared by every job; spawned, since the service process runs threads"""
+    global _csv_pool
+    with _csv_pool_lock:
+        if _csv_pool is None:
+            _csv_pool = ProcessPoolExecutor(CSV_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            logger.info(f"[CSV POOL] Started {CSV_PARSE_WORKERS} parse processes")
+        return _csv_pool
+
+def shutdown_csv_pool():
+    global _csv_pool
+    with _csv_pool_lock:
+        if _csv_pool is not None:
+            _csv_pool.shutdown(wait=False, cancel_futures=True)
+            _csv_pool = None
+
+def transform_csv_shard(file_key: str, fieldnames: list[str], text: str) -> list[CsvRow]:
+    """Runs in a pool process: parse a block of whole CSV records into CsvRows
+
+    Cells interned here come back as one object per distinct value in the shard (pickle shares them).
+    """
+    transformer = _shard_transformers.get(file_key)
+    if transformer is None:
+        transformer = _shard_transformers[file_key] = RowTransformer()
+        while len(_shard_transformers) > 4:
+            _shard_transformers.popitem(last=False)
+    return [transformer.from_cells(fieldnames, row) for row in csv.reader(io.StringIO(text)) if any(row)]
+
+def _record_boundary(text: str, last: bool = True) -> int:
+    """Index just past the last (or first) newline outside quoted fields, or -1"""
+    idx = text.rfind("\n") if last else text.find("\n")
+    while idx >= 0:
+        if text.count('"', 0, idx) % 2 == 0:
+            return idx + 1
+        idx = text.rfind("\n", 0, idx) if last else text.find("\n", idx + 1)
+    return -1
+
+async def iter_csv_shards(text_chunks: AsyncIterator[str], shard_chars: int = CSV_PARSE_SHARD_CHARS) -> AsyncIterator[tuple[list[str], str]]:
+    """Cut decoded CSV text into blocks of whole records, yielded with the header's fieldnames.
+
+    Blocks end at a newline with an even number of quotes before it, the same
+    rule iter_csv_rows uses to join quoted fields that span lines.
+    """
+    fieldnames = None
+    pending = ""
+    async for text in text_chunks:
+        pending += text
+        if fieldnames is None:
+            cut = _record_boundary(pending, last=False)
+            if cut < 0:
+                continue
+            fieldnames = next(csv.reader([pending[:cut]]), [])
+            pending = pending[cut:]
+        if len(pending) < shard_chars:
+            continue
+        cut = _record_boundary(pending)
+        if cut > 0:
+            yield fieldnames, pending[:cut]
+            pending = pending[cut:]
+    if fieldnames is None and pending:
+        fieldnames = next(csv.reader([pending]), [])
+        pending = ""
+    if pending:
+        yield fieldnames, pending
+
+async def parallel_csv_records(text_chunks: AsyncIterator[str]) -> AsyncIterator[CsvRow]:
+    """Rows of one CSV, parsed and transformed across CSV_PARSE_WORKERS processes, in file order.
+
+    Up to two shards per process are in flight, so parsing overlaps with the
+    writes the caller makes for rows already yielded.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_csv_pool()
+    file_key = uuid.uuid4().hex
+    in_flight: deque = deque()
+    
+    async for fieldnames, text in iter_csv_shards(text_chunks):
+        in_flight.append(loop.run_in_executor(pool, transform_csv_shard, file_key, fieldnames, text))
+        while in_flight and (in_flight[0].done() or len(in_flight) >= CSV_PARSE_WORKERS * 2):
+            for record in await in_flight.popleft():
+                yield record
+    while in_flight:
+        for record in await in_flight.popleft():
+            yield record
+
 # CSV Files Management Functions
-async def save_csv_file(session: aiohttp.ClientSession, csv_url: str, csv_content: str, filename: str) -> str:
-    """Save CSV file to Prelicensingcsv table and return the objectId"""
+async def save_csv_file(session: aiohttp.ClientSession, csv_url: str, csv_content: str, filename: str,
+                        content_hash: str = "", duplicate_of: str = "", resumable: bool = True, source_fingerprint: str = "") -> str:
+    """Save CSV file to Prelicensingcsv table and return the objectId
+
+    A file whose `content_hash` matched completed job `duplicate_of` is saved as
+    "duplicate" so the upload is still visible in the table. A file that is not
+    `resumable` (a direct upload) is never saved as "queued": no worker could read it.
+    `content_hash` and `source_fingerprint` let a resumed job check that its
+    csv_url still serves the same body.
+    """
     url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_CSV_TABLE_NAME}"
     
     # For large files, save only URL and queue for processing
-    if len(csv_content) > 100000:  # 100KB threshold
-        logger.info(f"[CSV QUEUE] Large file detected, queuing for background processing: {filename}")
+    if len(csv_content) > CSV_INLINE_MAX_CHARS:  # 100KB threshold
+        logger.info(f"[CSV QUEUE] Large file detected, saving URL only: {filename}")
         payload = {
             "filename": filename,
             "csv_url": csv_url,
@@ -313,7 +1516,7 @@ async def save_csv_file(session: aiohttp.ClientSession, csv_url: str, csv_conten
             "file_size": 0,
             "total_records": 0,
             "processed_records": 0,
-            "processing_status": "queued",
+            "processing_status": "queued" if QUEUE_LARGE_FILES and resumable else "pending",  # Workers only lease "queued" files
             "source_email": "google_apps_script",
             "imo": "",
             "queue_priority": 1,
@@ -345,22 +1548,28 @@ async def save_csv_file(session: aiohttp.ClientSession, csv_url: str, csv_conten
             "imo": imo
         }
     
+    if content_hash:
+        payload["content_hash"] = content_hash
+    if source_fingerprint:
+        payload["source_fingerprint"] = source_fingerprint
+    if duplicate_of:
+        payload.update(processing_status="duplicate", duplicate_of=duplicate_of)
+    
     logger.info(f"[CSV SAVE] Saving CSV file: {filename}")
     try:
-        async with session.post(url, headers=BACK4APP_HEADERS, json=payload) as resp:
-            body = await resp.text()
-            logger.info(f"[CSV SAVE RESPONSE] status={resp.status}, body={body}")
-            resp.raise_for_status()
-            data = json.loads(body)
-            csv_file_id = data.get("objectId")
-            logger.info(f"[CSV SAVE SUCCESS] CSV file saved with ID: {csv_file_id}")
-            return csv_file_id
+        status, body = await request_with_limits(session, back4app_limiter, "POST", url, BACK4APP_HEADERS, json=payload)
+        logger.info("[CSV SAVE RESPONSE] status=%s, body=%s", status, LogPayload(body))
+        data = json.loads(body)
+        csv_file_id = data.get("objectId")
+        logger.info(f"[CSV SAVE SUCCESS] CSV file saved with ID: {csv_file_id}")
+        return csv_file_id
     except Exception as e:
         logger.error(f"[CSV SAVE FAILED] {filename} → {e}")
         raise
 
-async def update_csv_file_status(session: aiohttp.ClientSession, csv_file_id: str, status: str, processed_records: int = 0, error_message: str = ""):
-    """Update CSV file processing status"""
+async def update_csv_file_status(session: aiohttp.ClientSession, csv_file_id: str, status: str, processed_records: int = 0, error_message: str = "",
+                                 fields: Optional[dict] = None) -> dict:
+    """Update CSV file processing status (plus any extra `fields`) and return Back4App's response"""
     url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_CSV_TABLE_NAME}/{csv_file_id}"
     
     payload = {
@@ -371,294 +1580,2515 @@ async def update_csv_file_status(session: aiohttp.ClientSession, csv_file_id: st
     if error_message:
         payload["error_message"] = error_message
     
-    if status == "completed":
+    if status in ("completed", "completed_partial"):
         payload["processed_at"] = {"__type": "Date", "iso": to_utc_iso(datetime.now())}
     
+    if fields:
+        payload.update(fields)
+    
     logger.info(f"[CSV UPDATE] Updating CSV file {csv_file_id} status to {status}")
     try:
-        async with session.put(url, headers=BACK4APP_HEADERS, json=payload) as resp:
-            body = await resp.text()
-            logger.info(f"[CSV UPDATE RESPONSE] status={resp.status}, body={body}")
-            resp.raise_for_status()
-            logger.info(f"[CSV UPDATE SUCCESS] CSV file {csv_file_id} updated")
+        status, body = await request_with_limits(session, back4app_limiter, "PUT", url, BACK4APP_HEADERS, json=payload)
+        logger.debug("[CSV UPDATE RESPONSE] status=%s, body=%s", status, LogPayload(body))
+        logger.info(f"[CSV UPDATE SUCCESS] CSV file {csv_file_id} updated")
+        return json.loads(body) if body else {}
     except Exception as e:
         logger.error(f"[CSV UPDATE FAILED] {csv_file_id} → {e}")
         raise
 
+async def increment_csv_file_field(session: aiohttp.ClientSession, csv_file_id: str, field: str, amount: int = 1) -> Optional[int]:
+    """Atomically add `amount` to one numeric field (nothing else is written) and return its new value"""
+    url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_CSV_TABLE_NAME}/{csv_file_id}"
+    # Not retried: a replayed increment would be applied twice
+    status, body = await request_with_limits(session, back4app_limiter, "PUT", url, BACK4APP_HEADERS, idempotent=False,
+                                             json={field: {"__op": "Increment", "amount": amount}})
+    return (json.loads(body) if body else {}).get(field)
+
+async def find_completed_file(session: aiohttp.ClientSession, content_hash: str) -> Optional[dict]:
+    """Latest completed Prelicensingcsv file with the same content hash, if any.
+
+    A failed lookup is logged and returns None: the file is then processed
+    normally (its rows diff as unchanged if it really is a duplicate).
+    """
+    url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_CSV_TABLE_NAME}"
+    params = {
+        "where": json.dumps({"content_hash": content_hash, "processing_status": "completed"}),
+        "order": "-createdAt",
+        "limit": 1,
+        "keys": "objectId,filename,processed_records",
+    }
+    try:
+        data = await request_with_retries_back4app(session, "GET", url, params=params)
+    except Exception as e:
+        logger.warning(f"[CSV DEDUPE] Could not look up completed files, processing normally: {e}")
+        return None
+    results = (data or {}).get("results", [])
+    return results[0] if results else None
+
+async def get_csv_file(session: aiohttp.ClientSession, csv_file_id: str) -> Optional[dict]:
+    """The stored status fields of one Prelicensingcsv record (None if it does not exist or Back4App returned nothing)"""
+    url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_CSV_TABLE_NAME}"
+    params = {
+        "where": json.dumps({"objectId": csv_file_id}),
+        "limit": 1,
+        "keys": "objectId,filename,processing_status,processed_records,error_message,processed_at,lease_owner,updatedAt",
+    }
+    data = await request_with_retries_back4app(session, "GET", url, params=params)
+    results = (data or {}).get("results", [])
+    return results[0] if results else None
+
 # Back4App API Functions
-async def get_records_by_emails_back4app(session: aiohttp.ClientSession, emails: list[str]) -> dict:
-    url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_TABLE_NAME}"
-    normalized_emails = [email.lower().strip() for email in emails]
-    constraints = [{"key": "pre_licensing_email_text", "constraint_type": "in", "value": normalized_emails}]
-    params = {"where": json.dumps({"$or": [{"pre_licensing_email_text": email} for email in normalized_emails]}), "limit": 1000}
+def split_email_queries(emails: list[str], max_chars: int = BACK4APP_LOOKUP_MAX_WHERE_CHARS) -> list[list[str]]:
+    """Split emails into groups whose `$in` clause stays under `max_chars` (URL-safe GETs)"""
+    groups, current, size = [], [], 0
+    for email in emails:
+        cost = len(quote(email)) + 6  # quotes, comma and encoding slack per entry
+        if current and size + cost > max_chars:
+            groups.append(current)
+            current, size = [], 0
+        current.append(email)
+        size += cost
+    if current:
+        groups.append(current)
+    return groups
+
+async def _query_back4app_emails(session: aiohttp.ClientSession, url: str, emails: list[str]) -> list[dict]:
+    """Fetch every record matching `emails`, paging by objectId cursor"""
+    where = {"pre_licensing_email_text": {"$in": emails}}
+    keys = ",".join(["objectId", *BACK4APP_UPDATE_FIELDS])
     results = []
+    last_id = None
     
     while True:
+        page_where = {**where, "objectId": {"$gt": last_id}} if last_id else where
+        params = {"where": json.dumps(page_where), "order": "objectId", "keys": keys, "limit": BACK4APP_QUERY_LIMIT}
         data = await request_with_retries_back4app(session, 'GET', url, params=params) or {}
-        response = data.get("results", [])
-        results.extend(response)
-        if len(response) < 1000:  # Back4App doesn't have remaining field
+        page = data.get("results", [])
+        results.extend(page)
+        if len(page) < BACK4APP_QUERY_LIMIT:  # Back4App doesn't have remaining field
             break
-        # For pagination, we'd need to implement skip/limit logic if needed
+        last_id = page[-1]["objectId"]
     
-    return {r.get("pre_licensing_email_text", "").lower().strip(): r for r in results}
+    return results
+
+async def get_records_by_emails_back4app(session: aiohttp.ClientSession, emails: list[str]) -> dict:
+    """Map normalized email → existing record (objectId plus the fields diffed by plan_back4app_write)"""
+    url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_TABLE_NAME}"
+    normalized_emails = list(dict.fromkeys(email.lower().strip() for email in emails if email and email.strip()))
+    if not normalized_emails:
+        return {}
+    
+    lookup_sem = asyncio.Semaphore(BACK4APP_LOOKUP_CONCURRENCY)
+    
+    async def query(group):
+        async with lookup_sem:
+            return await _query_back4app_emails(session, url, group)
+    
+    pages = await asyncio.gather(*(query(group) for group in split_email_queries(normalized_emails)))
+    return {r.get("pre_licensing_email_text", "").lower().strip(): r for page in pages for r in page}
 
 async def create_record_back4app(session: aiohttp.ClientSession, payload: dict):
     url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_TABLE_NAME}"
-    logger.info(f"[BACK4APP CREATE] Sending POST to {url} with payload: {json.dumps(payload)}")
+    logger.debug("[BACK4APP CREATE] Sending POST to %s with payload: %s", url, LogPayload(payload))
     try:
-        async with session.post(url, headers=BACK4APP_HEADERS, json=payload) as resp:
-            body = await resp.text()
-            logger.info(f"[BACK4APP CREATE RESPONSE] status={resp.status}, body={body}")
-            resp.raise_for_status()
-            try:
-                data = json.loads(body)
-                logger.debug(f"[BACK4APP CREATE DATA] {data}")
-            except Exception:
-                logger.debug("[BACK4APP CREATE DATA] Response not JSON")
-        logger.info(f"[BACK4APP CREATE SUCCESS] {payload.get('pre_licensing_email_text')}")
+        headers = idempotent_write_headers("create", BACK4APP_TABLE_NAME, payload)
+        try:
+            status, body = await request_with_limits(session, back4app_limiter, "POST", url, headers, json=payload)
+        except DuplicateRequestError:
+            # An earlier attempt created the record; its response was lost
+            result = (await resolve_applied_batch(session, [{"method": "POST", "body": payload}]))[0]
+            if isinstance(result, Exception):
+                raise result
+            return result
+        logger.debug("[BACK4APP CREATE RESPONSE] status=%s, body=%s", status, LogPayload(body))
+        data = {}
+        try:
+            data = json.loads(body)
+            logger.debug("[BACK4APP CREATE DATA] %s", LogPayload(data))
+        except Exception:
+            logger.debug("[BACK4APP CREATE DATA] Response not JSON")
+        logger.info("[BACK4APP CREATE SUCCESS] %s", payload.get('pre_licensing_email_text'), extra={"category": "row"})
+        return data
     except Exception as e:
         logger.error(f"[BACK4APP CREATE FAILED] {payload.get('pre_licensing_email_text')} → {e}")
         raise
 
 async def update_record_back4app(session: aiohttp.ClientSession, record_id: str, payload: dict, email: str):
     url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_TABLE_NAME}/{record_id}"
-    logger.info(f"[BACK4APP UPDATE] Sending PUT to {url} with payload: {json.dumps(payload)}")
+    logger.debug("[BACK4APP UPDATE] Sending PUT to %s with payload: %s", url, LogPayload(payload))
     try:
-        async with session.put(url, headers=BACK4APP_HEADERS, json=payload) as resp:
-            body = await resp.text()
-            logger.info(f"[BACK4APP UPDATE RESPONSE] status={resp.status}, body={body}")
-            resp.raise_for_status()
-            try:
-                data = json.loads(body)
-                logger.debug(f"[BACK4APP UPDATE DATA] {data}")
-            except Exception:
-                logger.debug("[BACK4APP UPDATE DATA] Response not JSON")
-        logger.info(f"[BACK4APP UPDATE SUCCESS] {email}")
+        status, body = await request_with_limits(session, back4app_limiter, "PUT", url, BACK4APP_HEADERS, json=payload)
+        logger.debug("[BACK4APP UPDATE RESPONSE] status=%s, body=%s", status, LogPayload(body))
+        try:
+            data = json.loads(body)
+            logger.debug("[BACK4APP UPDATE DATA] %s", LogPayload(data))
+        except Exception:
+            logger.debug("[BACK4APP UPDATE DATA] Response not JSON")
+        logger.info("[BACK4APP UPDATE SUCCESS] %s", email, extra={"category": "row"})
     except Exception as e:
         logger.error(f"[BACK4APP UPDATE FAILED] {email} → {e}")
         raise
 
-async def handle_row(row, bubble_map, back4app_map, session, sem):
-    global new_records_count, updated_records_count, new_records_back4app_count, updated_records_back4app_count
-    
-    # Process Back4App FIRST (independente do Bubble)
-    back4app_payload = to_back4app_payload(row)
-    back4app_email = back4app_payload.get("pre_licensing_email_text")
-    
-    async with sem:
-        # Process Back4App FIRST
+# Fields compared against (and sent to) existing API_Connector_Users records
+BACK4APP_UPDATE_FIELDS = [
+    "first_name_text",
+    "last_name_text",
+    "pre_licensing_email_text",
+    "phone_text",
+    "imo_custom_imo",
+    "hiring_manager_text",
+    "pre_licensing_course_text",
+    "prepared_to_pass_text",
+    "time_spent_text",
+    "date_enrolled_date",
+    "pre_licensing_course_last_login_date",
+    "ple_date_completed_date",
+    "ple_complete_number",
+    "percentage_prep_complete_number",
+    "percentage_sim_complete_number"
+]
+
+def normalize_back4app_value(field: str, value):
+    """Normalize a CSV payload or stored Back4App value so equal data compares equal.
+
+    Dates (`*_date`, including Parse {"__type": "Date"} values) become UTC datetimes
+    at second precision, numbers become floats, and empty text becomes None.
+    """
+    if value is None:
+        return None
+    if field.endswith("_date"):
         try:
-            back4app_existing = back4app_map.get(back4app_email) if back4app_email else None
-            
-            # Parse DB "last login" if present
-            back4app_db_val = back4app_existing.get("pre_licensing_course_last_login_date") if back4app_existing else None
-            back4app_db_dt = None
-            if back4app_db_val:
-                back4app_db_dt = parse_record_date(back4app_db_val)
-
-            # Parse CSV "last login" if present
-            back4app_csv_val = back4app_payload.get("pre_licensing_course_last_login_date")
-            back4app_csv_dt = None
-            if back4app_csv_val:
-                try:
-                    back4app_csv_dt = parse_record_date(back4app_csv_val)
-                except Exception as e:
-                    logger.warning(f"Couldn't parse CSV last login date '{back4app_csv_val}': {e}")
-                    back4app_csv_dt = None
-            
-            # Process Back4App record
-            if back4app_existing:
-                # Sempre atualizar se houver dados válidos (removida lógica de comparação de data)
-                update_fields = [
-                    "first_name_text",
-                    "last_name_text",
-                    "pre_licensing_email_text",
-                    "phone_text",
-                    "imo_custom_imo",
-                    "hiring_manager_text",
-                    "pre_licensing_course_text",
-                    "prepared_to_pass_text",
-                    "time_spent_text",
-                    "date_enrolled_date",
-                    "pre_licensing_course_last_login_date",
-                    "ple_date_completed_date",
-                    "ple_complete_number",
-                    "percentage_prep_complete_number",
-                    "percentage_sim_complete_number"
-                ]
-                upd = {k: back4app_payload[k] for k in update_fields if k in back4app_payload}
-                if upd:  # Só atualizar se houver campos para atualizar
-                    rid = back4app_existing.get("objectId")
-                    await update_record_back4app(session, rid, upd, str(back4app_email))
-                    updated_records_back4app_count += 1
-                    logger.info(f"[BACK4APP UPDATED] {back4app_email} — changes: {upd}")
-                else:
-                    logger.debug(f"[BACK4APP SKIPPED] {back4app_email} — no changes needed")
-            else:
-                await create_record_back4app(session, back4app_payload)
-                new_records_back4app_count += 1
-                logger.info(f"[BACK4APP CREATED] {back4app_email}")
+            dt = parse_record_date(value)
+        except ValueError:
+            return value
+        return dt.replace(microsecond=0) if dt else None
+    if field.endswith("_number"):
+        return parse_number(value)
+    if isinstance(value, str) and not value.strip():
+        return None
+    return value
+
+def diff_back4app_fields(payload: dict, existing: dict) -> dict:
+    """Return the subset of `payload` update fields that differ from the `existing` record"""
+    return {
+        k: payload[k]
+        for k in BACK4APP_UPDATE_FIELDS
+        if k in payload and normalize_back4app_value(k, payload[k]) != normalize_back4app_value(k, existing.get(k))
+    }
+
+FIELD_DIGEST_SIZE = 8  # Bytes of blake2b kept per BACK4APP_UPDATE_FIELDS value in the record index
+
+def back4app_field_digests(record: dict, base: bytes = b"") -> bytes:
+    """Digest of each normalized BACK4APP_UPDATE_FIELDS value, concatenated in field order.
+
+    Missing fields digest as empty, unless `base` (earlier digests of the same
+    record) is given, in which case they keep their digest from `base`.
+    """
+    digests = []
+    for i, k in enumerate(BACK4APP_UPDATE_FIELDS):
+        if base and k not in record:
+            digests.append(base[i * FIELD_DIGEST_SIZE : (i + 1) * FIELD_DIGEST_SIZE])
+        else:
+            value = repr(normalize_back4app_value(k, record.get(k))).encode()
+            digests.append(hashlib.blake2b(value, digest_size=FIELD_DIGEST_SIZE).digest())
+    return b"".join(digests)
+
+# Record Index Cache
+class RecordIndexEntry:
+    __slots__ = ("object_id", "field_digests", "expires_at")
+
+    def __init__(self, object_id: str, field_digests: bytes, expires_at: float):
+        self.object_id = object_id
+        self.field_digests = field_digests
+        self.expires_at = expires_at
+
+    def changed_fields(self, payload: dict) -> dict:
+        """The update fields of `payload` whose normalized value differs from the indexed record"""
+        digests = back4app_field_digests(payload)
+        changed = {}
+        for i, k in enumerate(BACK4APP_UPDATE_FIELDS):
+            span = slice(i * FIELD_DIGEST_SIZE, (i + 1) * FIELD_DIGEST_SIZE)
+            if k in payload and digests[span] != self.field_digests[span]:
+                changed[k] = payload[k]
+        return changed
+
+class RecordIndexCache:
+    """Process-wide map of normalized email → (objectId, per-field digests) with LRU and TTL eviction.
+
+    Shared by every job (each runs in its own thread), so access is guarded by a lock.
+    Entries are refreshed by our own successful writes and dropped when a write fails;
+    changes made outside this service are only picked up once an entry expires.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get_many(self, emails: Iterable[str]) -> dict:
+        """Return {email: RecordIndexEntry} for the cached, unexpired emails"""
+        if not self.enabled:
+            return {}
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for email in emails:
+                entry = self._entries.get(email)
+                if entry is not None and entry.expires_at <= now:
+                    del self._entries[email]
+                    self.evictions += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(email)
+                self.hits += 1
+                found[email] = entry
+        return found
+
+    def put(self, email: str, object_id: Optional[str], field_digests: bytes):
+        if not self.enabled or not email or not object_id:
+            return
+        with self._lock:
+            self._entries[email] = RecordIndexEntry(object_id, field_digests, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email: str):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+record_index = RecordIndexCache(RECORD_INDEX_MAX_SIZE, RECORD_INDEX_TTL_SECONDS)
+
+# Local Record Replica
+class RecordReplica:
+    """SQLite copy of API_Connector_Users kept current by `updatedAt` delta syncs.
+
+    sync() pulls only records updated after the stored (updatedAt, objectId)
+    watermark, paging on that pair instead of `skip`, and the watermark is kept in
+    the database so a restart resumes the delta. Our own writes go through to the
+    replica immediately. Deleted records are dropped by a full resync every
+    REPLICA_FULL_SYNC_SECONDS. Lookups that must be current call ensure_fresh()
+    first, which syncs when the last sync is older than REPLICA_MAX_STALENESS_SECONDS.
+    """
+
+    def __init__(self, path: str, max_staleness: float, full_sync_seconds: float):
+        self.path = path
+        self.max_staleness = max_staleness
+        self.full_sync_seconds = full_sync_seconds
+        self.synced_at = 0.0
+        self.syncs = 0
+        self.records_pulled = 0
+        self._records: Optional[int] = None  # Row count for stats(), recounted after each sync
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._sync_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # A lost replica is rebuilt from Back4App, so durability is traded for speed
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")
+            db.execute("CREATE TABLE IF NOT EXISTS records (object_id TEXT PRIMARY KEY, email TEXT, updated_at TEXT, data TEXT NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS records_email ON records (email)")
+            db.execute("CREATE INDEX IF NOT EXISTS records_updated ON records (updated_at)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db = db
+        return self._db
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _row(record: dict) -> tuple:
+        email = (record.get("pre_licensing_email_text") or "").lower().strip()
+        return (record["objectId"], email, record.get("updatedAt") or "", json.dumps(record, separators=(",", ":")))
+
+    def put_many(self, records: list[dict]):
+        if not records:
+            return
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN")
+            db.executemany("INSERT OR REPLACE INTO records (object_id, email, updated_at, data) VALUES (?, ?, ?, ?)",
+                           [self._row(r) for r in records])
+            db.execute("COMMIT")
+
+    def put_write(self, record: dict):
+        """Write-through for a record we just created/updated (merged over the stored copy)"""
+        if not self.enabled or not record.get("objectId"):
+            return
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT data FROM records WHERE object_id = ?", (record["objectId"],)).fetchone()
+            merged = {**(json.loads(row[0]) if row else {}), **{k: v for k, v in record.items() if not k.startswith("_")}}
+            db.execute("INSERT OR REPLACE INTO records (object_id, email, updated_at, data) VALUES (?, ?, ?, ?)", self._row(merged))
+            if row is None and self._records is not None:
+                self._records += 1
+
+    def delete(self, object_id: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            deleted = self._conn().execute("DELETE FROM records WHERE object_id = ?", (object_id,)).rowcount
+            if self._records is not None:
+                self._records -= deleted
+
+    def get_by_emails(self, emails: list[str]) -> dict:
+        """email → stored record (marked with "_source": "replica")"""
+        found = {}
+        with self._lock:
+            db = self._conn()
+            for i in range(0, len(emails), 500):
+                group = emails[i : i + 500]
+                rows = db.execute(f"SELECT email, data FROM records WHERE email IN ({','.join('?' * len(group))})", group).fetchall()
+                for email, data in rows:
+                    found[email] = {**json.loads(data), "_source": "replica"}
+        return found
+
+    def changed_since(self, updated_at: Optional[str]) -> list[dict]:
+        """Every record (updated_at None) or those stored with a newer updatedAt"""
+        with self._lock:
+            if updated_at is None:
+                rows = self._conn().execute("SELECT data FROM records").fetchall()
+            else:
+                rows = self._conn().execute("SELECT data FROM records WHERE updated_at > ?", (updated_at,)).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    async def _pull(self, session: aiohttp.ClientSession, full: bool) -> int:
+        url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_TABLE_NAME}"
+        keys = ",".join(dict.fromkeys(["objectId", "updatedAt", *BACK4APP_UPDATE_FIELDS, *AGENT_FIELDS]))
+        watermark = None if full else self._meta("watermark")
+        since, since_id = json.loads(watermark) if watermark else (None, None)
+        pulled = 0
+        seen_ids = [] if full else None
+        while True:
+            where = {}
+            if since:
+                since_date = {"__type": "Date", "iso": since}
+                where = {"$or": [{"updatedAt": {"$gt": since_date}}, {"updatedAt": since_date, "objectId": {"$gt": since_id}}]}
+            params = {"where": json.dumps(where), "order": "updatedAt,objectId", "limit": BACK4APP_QUERY_LIMIT, "keys": keys}
+            page = (await request_with_retries_back4app(session, "GET", url, params=params) or {}).get("results", [])
+            self.put_many(page)
+            pulled += len(page)
+            if seen_ids is not None:
+                seen_ids.extend(r["objectId"] for r in page)
+            if page:
+                since, since_id = page[-1].get("updatedAt"), page[-1]["objectId"]
+                with self._lock:
+                    self._set_meta("watermark", json.dumps([since, since_id]))
+            if len(page) < BACK4APP_QUERY_LIMIT:
+                break
+        if seen_ids is not None:
+            # Anything not returned by a full pass was deleted in Back4App
+            with self._lock:
+                db = self._conn()
+                db.execute("BEGIN")
+                db.execute("CREATE TEMP TABLE IF NOT EXISTS seen (object_id TEXT PRIMARY KEY)")
+                db.execute("DELETE FROM seen")
+                db.executemany("INSERT OR IGNORE INTO seen (object_id) VALUES (?)", [(i,) for i in seen_ids])
+                deleted = db.execute("DELETE FROM records WHERE object_id NOT IN (SELECT object_id FROM seen)").rowcount
+                self._set_meta("full_sync_at", str(time.time()))
+                db.execute("COMMIT")
+            if deleted:
+                logger.info(f"[REPLICA] Removed {deleted} records deleted in Back4App")
+        return pulled
+
+    async def sync(self, full: Optional[bool] = None) -> int:
+        """Pull records changed since the watermark (or everything on a full resync)"""
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+        async with self._sync_lock:
+            if full is None:
+                with self._lock:
+                    last_full = float(self._meta("full_sync_at") or 0)
+                full = time.time() - last_full >= self.full_sync_seconds
+            session = await http_client.get_session()
+            started = time.monotonic()
+            pulled = await self._pull(session, full)
+            self.synced_at = time.monotonic()
+            self.syncs += 1
+            self.records_pulled += pulled
+            with self._lock:
+                self._records = self._conn().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            logger.info(f"[REPLICA] {'Full' if full else 'Delta'} sync pulled {pulled} records in {self.synced_at - started:.1f}s")
+            return pulled
+
+    async def ensure_fresh(self):
+        if time.monotonic() - self.synced_at >= self.max_staleness:
+            await self.sync()
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            if self._records is None:
+                self._records = self._conn().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            watermark = self._meta("watermark")
+        return {"enabled": True, "records": self._records, "watermark": json.loads(watermark) if watermark else None, "syncs": self.syncs,
+                "records_pulled": self.records_pulled, "age_seconds": round(time.monotonic() - self.synced_at, 1) if self.synced_at else None}
+
+replica = RecordReplica(REPLICA_PATH, REPLICA_MAX_STALENESS_SECONDS, REPLICA_FULL_SYNC_SECONDS)
+
+def plan_back4app_write(row: CsvRow, back4app_map: dict) -> Optional[dict]:
+    """Decide the Back4App write for one CsvRow.
+
+    `back4app_map` values are looked-up records or RecordIndexEntry cache hits.
+    Returns {"action": "create"|"update", "email", "record_id", "payload"} or
+    None when the existing record already matches the row (a skipped row).
+    """
+    # Process Back4App FIRST (independente do Bubble)
+    back4app_payload = to_back4app_payload(row)
+    back4app_email = back4app_payload.get("pre_licensing_email_text")
+    back4app_existing = back4app_map.get(back4app_email) if back4app_email else None
+    
+    if not back4app_existing:
+        return {"action": "create", "email": back4app_email, "record_id": None, "payload": back4app_payload}
+    
+    if isinstance(back4app_existing, RecordIndexEntry):
+        # Only digests of the stored fields are known: send the fields whose digest differs
+        upd = back4app_existing.changed_fields(back4app_payload)
+        if not upd:
+            logger.debug("[BACK4APP SKIPPED] %s — unchanged since last write", back4app_email, extra={"category": "row"})
+            return None
+        return {"action": "update", "email": back4app_email, "record_id": back4app_existing.object_id, "payload": upd}
+    
+    # Only send the fields whose normalized value differs from the stored record
+    upd = diff_back4app_fields(back4app_payload, back4app_existing)
+    if not upd:
+        logger.debug("[BACK4APP SKIPPED] %s — no changes needed", back4app_email, extra={"category": "row"})
+        return None
+    return {"action": "update", "email": back4app_email, "record_id": back4app_existing.get("objectId"), "payload": upd}
+
+class Back4AppBatchError(Exception):
+    """A single request inside a Parse /batch call failed."""
+
+    def __init__(self, code, message: str):
+        super().__init__(f"Parse error {code}: {message}")
+        self.code = code
+
+async def resolve_applied_batch(session: aiohttp.ClientSession, requests: list[dict]) -> list:
+    """Rebuild the results of writes Parse already applied: creates are looked up by email"""
+    emails = [r["body"].get("pre_licensing_email_text") for r in requests if r["method"] == "POST"]
+    existing = await get_records_by_emails_back4app(session, [e for e in emails if e]) if emails else {}
+    results = []
+    for r in requests:
+        if r["method"] != "POST":
+            results.append({})
+            continue
+        record = existing.get(r["body"].get("pre_licensing_email_text"))
+        results.append({"objectId": record["objectId"]} if record else Back4AppBatchError(101, "Applied create not found"))
+    logger.info(f"[BACK4APP IDEMPOTENT] Recovered {len(requests)} writes applied by an earlier attempt")
+    return results
+
+async def batch_write_back4app(session: aiohttp.ClientSession, requests: list[dict]) -> list:
+    """Send one Parse /batch call; returns each request's `success` dict or a Back4AppBatchError, in order"""
+    logger.info("[BACK4APP BATCH] Sending POST to %s with %d requests", BACK4APP_BATCH_URL, len(requests), extra={"category": "http"})
+    try:
+        # A batch of updates only can be replayed safely; one with creates needs a request id, else it is retried only when throttled
+        idempotent = BACK4APP_IDEMPOTENT_WRITES or all(r["method"] == "PUT" for r in requests)
+        headers = idempotent_write_headers("batch", requests)
+        try:
+            status, body = await request_with_limits(session, back4app_limiter, "POST", BACK4APP_BATCH_URL, headers,
+                                                     idempotent=idempotent, json={"requests": requests})
+        except DuplicateRequestError:
+            return await resolve_applied_batch(session, requests)
+        logger.debug("[BACK4APP BATCH RESPONSE] status=%s, body=%s", status, LogPayload(body), extra={"category": "http"})
+        data = json.loads(body)
+    except Exception as e:
+        logger.error(f"[BACK4APP BATCH FAILED] {len(requests)} requests → {e}")
+        raise
+    
+    if not isinstance(data, list) or len(data) != len(requests):
+        raise ValueError(f"Unexpected /batch response for {len(requests)} requests: {body[:200]}")
+    results = []
+    for item in data:
+        if "success" in item:
+            results.append(item["success"])
+        else:
+            error = item.get("error") or {}
+            results.append(Back4AppBatchError(error.get("code"), error.get("error", "unknown error")))
+    return results
+
+class Back4AppBatchWriter:
+    """Collects Back4App creates/updates and sends them as grouped Parse /batch requests.
+
+    Results from flush() are aligned with the order of add() calls: each entry is
+    the Parse `success` dict or the exception that failed that write.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, sem: asyncio.Semaphore, batch_size: int = BACK4APP_BATCH_SIZE):
+        self.session = session
+        self.sem = sem
+        self.batch_size = max(1, min(batch_size, BACK4APP_BATCH_MAX))
+        self._requests: list[dict] = []
+
+    def add(self, op: dict):
+        """Queue an op produced by plan_back4app_write"""
+        if op["action"] == "create":
+            self._requests.append({"method": "POST", "path": f"{BACK4APP_BATCH_PATH}/{BACK4APP_TABLE_NAME}", "body": op["payload"]})
+        else:
+            self._requests.append({"method": "PUT", "path": f"{BACK4APP_BATCH_PATH}/{BACK4APP_TABLE_NAME}/{op['record_id']}", "body": op["payload"]})
+
+    async def _send(self, requests: list[dict]) -> list:
+        async with self.sem:
+            try:
+                return await batch_write_back4app(self.session, requests)
+            except Exception as e:
+                # The whole call failed: every write in it failed
+                return [e] * len(requests)
+
+    async def flush(self) -> list:
+        requests, self._requests = self._requests, []
+        batches = [requests[i : i + self.batch_size] for i in range(0, len(requests), self.batch_size)]
+        results = await asyncio.gather(*(self._send(batch) for batch in batches))
+        return [result for batch_results in results for result in batch_results]
+
+def record_back4app_write(written: Optional[dict], op: dict, result: dict, back4app_map: dict):
+    """Remember the record state produced by a successful write in the record index and `written`"""
+    if not op["email"]:
+        return
+    existing = back4app_map.get(op["email"])
+    digest_base = b""
+    if op["action"] == "create":
+        record = {**op["payload"], "objectId": result.get("objectId")}
+    elif isinstance(existing, RecordIndexEntry):
+        # Only the changed fields were sent; the others keep their indexed digests
+        record = {**op["payload"], "objectId": existing.object_id}
+        digest_base = existing.field_digests
+    else:
+        record = {**(existing or {}), **op["payload"]}
+    record_index.put(op["email"], record["objectId"], back4app_field_digests(record, digest_base))
+    replica.put_write(record)
+    agents_snapshot.mark_stale()
+    if written is not None:
+        written[op["email"]] = record
+
+def recreate_if_stale(op: dict, error: Exception, back4app_map: dict) -> Optional[dict]:
+    """Turn an update of a cached or replicated objectId that no longer exists into a create op"""
+    existing = back4app_map.get(op["email"])
+    cached = isinstance(existing, RecordIndexEntry) or (isinstance(existing, dict) and existing.get("_source") == "replica")
+    if op["action"] != "update" or not cached:
+        return None
+    code = getattr(error, "code", None) if isinstance(error, Back4AppBatchError) else getattr(error, "status", None)
+    if code not in (101, 404):  # Parse "object not found"
+        return None
+    logger.warning(f"[RECORD INDEX] Cached objectId for {op['email']} is gone, creating the record again")
+    record_index.invalidate(op["email"])
+    replica.delete(op["record_id"])
+    back4app_map.pop(op["email"], None)
+    return {**op, "action": "create", "record_id": None}
+
+async def handle_row(row: CsvRow, back4app_map, session, sem, written: Optional[dict] = None) -> tuple[int, int, int]:
+    """Write one row to Back4App with its own POST/PUT (used when batching is disabled); returns (created, updated, skipped)"""
+    back4app_email = None
+    async with sem:
+        try:
+            op = plan_back4app_write(row, back4app_map)
+            if op is None:
+                metrics.rows.inc(sink="back4app", result="unchanged")
+                return 0, 0, 1
+            back4app_email = op["email"]
+            if op["action"] == "update":
+                try:
+                    await update_record_back4app(session, op["record_id"], op["payload"], str(back4app_email))
+                except aiohttp.ClientResponseError as e:
+                    op = recreate_if_stale(op, e, back4app_map)
+                    if op is None:
+                        raise
+                else:
+                    record_back4app_write(written, op, {}, back4app_map)
+                    metrics.rows.inc(sink="back4app", result="updated")
+                    logger.info("[BACK4APP UPDATED] %s — changes: %s", back4app_email, LogPayload(op["payload"]), extra={"category": "row"})
+                    return 0, 1, 0
+            data = await create_record_back4app(session, op["payload"])
+            record_back4app_write(written, op, data, back4app_map)
+            metrics.rows.inc(sink="back4app", result="created")
+            logger.info("[BACK4APP CREATED] %s", back4app_email, extra={"category": "row"})
+            return 1, 0, 0
         except Exception as e:
             logger.error(f"[BACK4APP ERROR] {back4app_email} — {e}")
+            metrics.rows.inc(sink="back4app", result="failed")
+            if back4app_email:
+                record_index.invalidate(back4app_email)
             # Continue processing even if Back4App fails
-        
-        # Process Bubble DISABLED (focando apenas no Back4App)
-        logger.debug(f"[BUBBLE DISABLED] Skipping Bubble processing for {back4app_email}")
-        
-        # Return counts for this row
-        return 0, 0, (1 if not back4app_existing else 0), (1 if back4app_existing else 0)
+            return 0, 0, 0
 
-async def process_chunk(chunk, session, sem):
-    # Extract emails for Back4App only (Bubble disabled)
-    back4app_emails = [r.get("EmailAddress", "").lower().strip() for r in chunk if r.get("EmailAddress")]
+async def write_chunk_batched(chunk, back4app_map, session, sem, written: Optional[dict] = None) -> tuple[int, int, int]:
+    """Write a chunk's Back4App creates/updates through /batch; returns (created, updated, skipped)"""
+    writer = Back4AppBatchWriter(session, sem)
+    ops = []
+    skipped = 0
+    for row in chunk:
+        try:
+            op = plan_back4app_write(row, back4app_map)
+        except Exception as e:
+            logger.error(f"[BACK4APP ERROR] {row.email} — {e}")
+            metrics.rows.inc(sink="back4app", result="failed")
+            continue
+        if op is None:
+            skipped += 1
+            continue
+        writer.add(op)
+        ops.append(op)
     
-    # Fetch existing records from Back4App only
-    bubble_map = {}  # Empty map for Bubble (disabled)
-    back4app_map = {}
+    results = list(zip(ops, await writer.flush()))
+    recreated = []
+    for op, result in results:
+        if isinstance(result, Exception):
+            new_op = recreate_if_stale(op, result, back4app_map)
+            if new_op is not None:
+                writer.add(new_op)
+                recreated.append((op, new_op))
+    if recreated:
+        stale = {id(op) for op, _ in recreated}
+        results = [(op, result) for op, result in results if id(op) not in stale]
+        results += zip([new_op for _, new_op in recreated], await writer.flush())
+    
+    created = updated = 0
+    for op, result in results:
+        if isinstance(result, Exception):
+            logger.error(f"[BACK4APP ERROR] {op['email']} — {result}")
+            metrics.rows.inc(sink="back4app", result="failed")
+            if op["email"]:
+                record_index.invalidate(op["email"])
+            continue
+        record_back4app_write(written, op, result, back4app_map)
+        if op["action"] == "create":
+            created += 1
+            logger.info("[BACK4APP CREATED] %s", op["email"], extra={"category": "row"})
+        else:
+            updated += 1
+            logger.info("[BACK4APP UPDATED] %s — changes: %s", op["email"], LogPayload(op["payload"]), extra={"category": "row"})
+    metrics.rows.inc(created, sink="back4app", result="created")
+    metrics.rows.inc(updated, sink="back4app", result="updated")
+    metrics.rows.inc(skipped, sink="back4app", result="unchanged")
+    if skipped:
+        logger.info(f"[BACK4APP SKIPPED] {skipped} unchanged rows in chunk")
+    return created, updated, skipped
+
+async def lookup_chunk(chunk, session) -> dict:
+    """Load the existing Back4App records for a chunk's emails (empty on failure)"""
+    back4app_emails = [row.email for row in chunk if row.email]
     
-    # Bubble disabled
-    logger.debug(f"[BUBBLE DISABLED] Skipping Bubble data loading")
+    # Cached emails skip the lookup; only misses are queried
+    back4app_map = record_index.get_many(back4app_emails)
+    misses = [email for email in back4app_emails if email not in back4app_map]
+    if not misses:
+        logger.info(f"[BACK4APP] All {len(back4app_map)} records served from the record index")
+        return back4app_map
+    
+    if replica.enabled:
+        # A freshly synced replica answers for most missing emails; the rest (e.g. created since its last sync) are queried
+        try:
+            await replica.ensure_fresh()
+            found = replica.get_by_emails(list(dict.fromkeys(misses)))
+            back4app_map.update(found)
+            misses = [email for email in misses if email not in found]
+            logger.info(f"[BACK4APP] {len(found)} existing records from the replica ({len(back4app_map) - len(found)} from the record index)")
+            if not misses:
+                return back4app_map
+        except Exception as e:
+            logger.warning(f"[REPLICA] Lookup failed, querying Back4App: {e}")
     
     try:
-        back4app_map = await get_records_by_emails_back4app(session, back4app_emails)
-        logger.info(f"[BACK4APP] Loaded {len(back4app_map)} existing records")
+        fetched = await get_records_by_emails_back4app(session, misses)
+        for email, record in fetched.items():
+            record_index.put(email, record.get("objectId"), back4app_field_digests(record))
+        back4app_map.update(fetched)
+        logger.info(f"[BACK4APP] Loaded {len(fetched)} existing records ({len(back4app_map) - len(fetched)} from the record index)")
+        return back4app_map
     except Exception as e:
         logger.error(f"[BACK4APP] Failed to load existing records: {e}")
         # Continue without Back4App data
+        return back4app_map
+
+async def write_chunk(chunk, back4app_map, session, sem, written: Optional[dict] = None) -> tuple[int, int, int]:
+    """Write a chunk to Back4App, whose existing records are already in `back4app_map`.
+
+    Returns (created, updated, skipped). Successful writes are recorded in `written`
+    (email → record) when given.
+    """
+    if BACK4APP_BATCH_SIZE > 1:
+        return await write_chunk_batched(chunk, back4app_map, session, sem, written)
     
-    # Process each row for both platforms
-    tasks = [handle_row(row, bubble_map, back4app_map, session, sem) for row in chunk]
+    tasks = [handle_row(row, back4app_map, session, sem, written) for row in chunk]
     results = await asyncio.gather(*tasks, return_exceptions=True)
     
     # Count successful results
-    new_bubble = 0
-    updated_bubble = 0
     new_back4app = 0
     updated_back4app = 0
+    skipped_back4app = 0
     
     for result in results:
         if isinstance(result, Exception):
             logger.error(f"Task failed: {result}")
             # Continue processing other rows
         else:
-            # result is a tuple: (new_bubble, updated_bubble, new_back4app, updated_back4app)
-            new_bubble += result[0]
-            updated_bubble += result[1]
-            new_back4app += result[2]
-            updated_back4app += result[3]
+            new_back4app += result[0]
+            updated_back4app += result[1]
+            skipped_back4app += result[2]
     
-    return new_bubble, updated_bubble, new_back4app, updated_back4app
+    return new_back4app, updated_back4app, skipped_back4app
 
-async def main_async(rows, csv_url: str = "", csv_filename: str = ""):
-    sem = asyncio.Semaphore(MAX_CONCURRENT)
-    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT)
-    csv_file_id = None
-    
-    async with aiohttp.ClientSession(connector=connector) as session:
-        # Step 1: Save CSV file to CSV_Files table if URL provided
-        if csv_url and csv_filename:
+# Chunk Auto-Tuning
+class ResizableSemaphore:
+    """asyncio.Semaphore whose limit can be changed while it is in use"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self.waits = 0  # Acquisitions that found every slot taken
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            if self.in_use >= self.limit:
+                self.waits += 1
+            await self._cond.wait_for(lambda: self.in_use < self.limit)
+            self.in_use += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_use -= 1
+            self._cond.notify()
+
+    async def resize(self, limit: int):
+        async with self._cond:
+            self.limit = max(1, limit)
+            self._cond.notify_all()
+
+def _clamp(value: float, low: int, high: int) -> int:
+    return int(min(max(round(value), low), high))
+
+class ChunkTuner:
+    """Adjusts one job's chunk size and write concurrency from what the job observes.
+
+    Every AUTOTUNE_WINDOW_CHUNKS chunks the window's rows/sec is compared with the
+    previous window's: the chunk size keeps moving in the same direction while
+    throughput improves and turns around (with a smaller step) when it drops.
+    Throttling halves the concurrency only (smaller chunks would mean more requests
+    per row); failed rows and retried errors halve both. Chunks slower than
+    AUTOTUNE_MAX_CHUNK_SECONDS shrink the chunk size so checkpoints and lease
+    renewals stay frequent. Clean windows in which writes had to wait for a slot
+    add one to the concurrency.
+
+    Failed rows are this job's own. Throttles and retried errors are read from the
+    shared back4app_limiter on purpose: every job in the process draws on the same
+    rate budget and backend, so when it pushes back all of them should ease off,
+    not only the job whose request happened to get the 429.
+    """
+
+    def __init__(self, job: str, chunk_size: int = CHUNK_SIZE, concurrency: int = MAX_CONCURRENT, enabled: bool = AUTOTUNE):
+        self.job = job
+        self.enabled = enabled
+        self.chunk_size = _clamp(chunk_size, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX) if enabled else chunk_size
+        self.concurrency = _clamp(concurrency, MAX_CONCURRENT_MIN, MAX_CONCURRENT_MAX) if enabled else concurrency
+        self.sem = ResizableSemaphore(self.concurrency)
+        self.last_rate = 0.0
+        self._failed = 0  # Rows of this job that failed on Back4App
+        self._step = AUTOTUNE_STEP
+        self._direction = 1
+        self._previous_rate = None
+        self._start_window()
+
+    def _pressure(self) -> tuple:
+        """Backend pushback so far: (throttled requests, retried errors + this job's failed rows)"""
+        throttled = back4app_limiter.throttled_total
+        return throttled, back4app_limiter.retries_total - throttled + self._failed
+
+    def _start_window(self):
+        self._rows = 0
+        self._seconds = 0.0
+        self._chunks = 0
+        self._slowest = 0.0
+        self._pressure_start = self._pressure()
+        self._waits_start = self.sem.waits
+
+    def size(self) -> int:
+        return self.chunk_size
+
+    async def observe(self, rows: int, seconds: float, failed: int = 0):
+        """Record one finished chunk (`failed` of its rows failed); retunes at the end of each window"""
+        if not self.enabled:
+            return
+        self._failed += failed
+        self._rows += rows
+        self._seconds += seconds
+        self._chunks += 1
+        self._slowest = max(self._slowest, seconds)
+        if self._chunks < AUTOTUNE_WINDOW_CHUNKS:
+            return
+        
+        rate = self._rows / max(self._seconds, 1e-6)
+        chunk_size, concurrency = self.chunk_size, self.concurrency
+        throttled, errors = (now - start for now, start in zip(self._pressure(), self._pressure_start))
+        if errors > 0:
+            reason = "backend errors"
+            chunk_size, concurrency = chunk_size / 2, concurrency / 2
+            self._direction, self._step, self._previous_rate = 1, AUTOTUNE_STEP, None
+        elif throttled > 0:
+            reason = "throttled"
+            concurrency = concurrency / 2
+            self._previous_rate = None
+        elif self._slowest > AUTOTUNE_MAX_CHUNK_SECONDS:
+            reason = f"chunks over {AUTOTUNE_MAX_CHUNK_SECONDS:g}s"
+            chunk_size = chunk_size * AUTOTUNE_MAX_CHUNK_SECONDS / self._slowest
+            self._direction, self._previous_rate = -1, None
+        else:
+            reason = "throughput rising"
+            if self._previous_rate is not None and rate < self._previous_rate * 0.95:
+                reason = "throughput fell"
+                self._direction = -self._direction
+                self._step = max(1.1, self._step ** 0.5)
+            chunk_size = chunk_size * self._step if self._direction > 0 else chunk_size / self._step
+            if self.sem.waits > self._waits_start:
+                concurrency += 1
+            self._previous_rate = rate
+        self.last_rate = rate
+        self._start_window()
+        
+        chunk_size = _clamp(chunk_size, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX)
+        concurrency = _clamp(concurrency, MAX_CONCURRENT_MIN, MAX_CONCURRENT_MAX)
+        if (chunk_size, concurrency) != (self.chunk_size, self.concurrency):
+            logger.info(f"[TUNER] {self.job}: chunk size {self.chunk_size}→{chunk_size}, concurrency "
+                        f"{self.concurrency}→{concurrency} ({rate:.0f} rows/sec, {reason})")
+            self.chunk_size, self.concurrency = chunk_size, concurrency
+            await self.sem.resize(concurrency)
+
+active_tuners: dict = {}  # job → ChunkTuner of each running job
+
+class DuplicateRowFilter:
+    """Collapses rows that repeat an email within one file before they are looked up or written.
+
+    With policy "last" the last row for an email wins; with "latest_login" the row
+    with the newest LastLoggedIn does (ties go to the later row). plan() picks the
+    winners among the rows a CsvStream read ahead before any of them is written, so
+    in a body spool() read completely every email is written once. Rows past the
+    read-ahead part are judged as they arrive: "last" then only drops repeats
+    within a chunk (an email repeated in a later chunk is written again, and the
+    last write wins), while "latest_login" writes a row only if it is the newest
+    so far. Rows are counted by their position in the file; a resumed job hands
+    the rows it skips to skip() so both policies pick the same rows as a full run.
+    """
+
+    def __init__(self, policy: str = CSV_DUPLICATE_EMAILS):
+        if policy not in ("last", "latest_login"):
+            raise ValueError(f"Unknown CSV_DUPLICATE_EMAILS policy: {policy}")
+        self.policy = policy
+        self.dropped = 0
+        self.position = 0  # File position (data rows) of the next row collapse() or skip() sees
+        self._latest_login = {}  # email → LastLoggedIn of the row kept so far (latest_login only)
+        self._winners = {}  # email → position of the row plan() picked for it
+        self._planned = 0  # Rows plan() saw
+
+    async def plan(self, stream: CsvStream):
+        """Pick each email's row among the rows `stream` has read ahead (before its rows() is read)"""
+        async for row in stream.read_ahead_rows():
+            if row.email and self._newest(row):
+                self._winners[row.email] = self._planned
+            self._planned += 1
+
+    def _newest(self, row: CsvRow) -> bool:
+        """Whether `row` beats the row kept so far for its email (always under "last")"""
+        if self.policy != "latest_login":
+            return True
+        logged = row.logged or ""
+        if logged < self._latest_login.get(row.email, ""):
+            return False
+        self._latest_login[row.email] = logged
+        return True
+
+    def _keep(self, row: CsvRow) -> bool:
+        position = self.position
+        self.position += 1
+        if not row.email:
+            return True
+        if position < self._planned and row.email in self._winners:
+            return self._winners[row.email] == position
+        return self._newest(row)
+
+    def skip(self, row: CsvRow):
+        """Account for a row an earlier attempt already handled"""
+        self._keep(row)
+
+    def collapse(self, chunk: list) -> list:
+        winners = {}  # email → index of the row kept for it
+        kept = []  # indexes of rows without an email (left for the writers to report)
+        for i, row in enumerate(chunk):
+            if not self._keep(row):
+                continue
+            if row.email:
+                winners[row.email] = i
+            else:
+                kept.append(i)
+        if len(winners) + len(kept) == len(chunk):
+            return chunk
+        rows = [chunk[i] for i in sorted(kept + list(winners.values()))]
+        self.dropped += len(chunk) - len(rows)
+        metrics.duplicate_rows.inc(len(chunk) - len(rows))
+        logger.debug("[CSV DEDUPE] Collapsed %s repeated emails in chunk", len(chunk) - len(rows), extra={"category": "row"})
+        return rows
+
+# Bubble Sink
+BUBBLE_DATE_FIELDS = {"date_enrolled", "ple_date_completed"}
+
+def diff_bubble_fields(payload: dict, existing: dict) -> dict:
+    """Fields of a to_payload() dict whose value differs from the Bubble record (dates compared as instants)"""
+    changes = {}
+    for field, value in payload.items():
+        current = existing.get(field)
+        if field in BUBBLE_DATE_FIELDS and value and current:
             try:
-                csv_content = await fetch_csv_from_url(session, csv_url)
-                csv_file_id = await save_csv_file(session, csv_url, csv_content, csv_filename)
-                await update_csv_file_status(session, csv_file_id, "processing")
+                if parse_record_date(value) == parse_record_date(current):
+                    continue
+            except (ValueError, OverflowError):
+                pass
+        elif value == current:
+            continue
+        changes[field] = value
+    return changes
+
+class BubbleSink:
+    """Writes one job's rows to Bubble on its own queue, independently of the Back4App pipeline.
+
+    Chunks queue up for a single consumer that looks their emails up with
+    get_records_by_emails, creates new records through the Data API /bulk endpoint
+    and PATCHes changed ones, with at most BUBBLE_CONCURRENCY requests in flight.
+    A slow Bubble only grows this queue; once BUBBLE_QUEUE_CHUNKS chunks are waiting,
+    submit() waits too, so the job slows down instead of losing rows. close() drains
+    the queue for up to BUBBLE_DRAIN_SECONDS; rows still queued after that are
+    counted as "dropped". `confirmed_rows` counts the CSV rows of every chunk that
+    has finished, in order, so a checkpoint never skips rows Bubble has not seen.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, job: str):
+        self.session = session
+        self.job = job
+        self.counts = {"created": 0, "updated": 0, "unchanged": 0, "failed": 0, "dropped": 0}
+        self.bulk_size = max(1, min(BUBBLE_BULK_SIZE, BUBBLE_BULK_MAX))
+        self._sem = asyncio.Semaphore(BUBBLE_CONCURRENCY)
+        self._queue = asyncio.Queue(maxsize=BUBBLE_QUEUE_CHUNKS)
+        self._pending_rows = 0  # Submitted rows whose chunk has not finished
+        self._finished_rows = 0  # Rows given an outcome other than "dropped"
+        self.confirmed_rows = 0  # CSV rows (before duplicates were collapsed) of the chunks that finished
+        active_sinks[job] = self
+        # email → record written by each recent chunk; Bubble searches may not show them yet
+        self._recent_writes = deque(maxlen=PIPELINE_DEPTH + 1)
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def submit(self, chunk: list, rows: Optional[int] = None):
+        """Queue `chunk` (standing for `rows` CSV rows), waiting while the queue is full"""
+        self._pending_rows += len(chunk)
+        await self._queue.put((chunk, len(chunk) if rows is None else rows))
+
+    def _count(self, result: str, rows: int = 1):
+        self.counts[result] += rows
+        metrics.rows.inc(rows, sink="bubble", result=result)
+        if result != "dropped":
+            self._finished_rows += rows
+
+    async def _consume(self):
+        while True:
+            chunk, rows = await self._queue.get()
+            finished = self._finished_rows
+            try:
+                await self._write(chunk)
+            except asyncio.CancelledError:
+                # Stopped by close(): the chunk's rows without an outcome yet were never confirmed
+                self._count("dropped", len(chunk) - (self._finished_rows - finished))
+                raise
             except Exception as e:
-                logger.error(f"[CSV SAVE ERROR] Failed to save CSV file: {e}")
-                if csv_file_id:
-                    await update_csv_file_status(session, csv_file_id, "error", error_message=str(e))
-                return
+                logger.error(f"[BUBBLE] {self.job}: chunk of {len(chunk)} rows failed: {e}")
+                self._count("failed", len(chunk))
+                self.confirmed_rows += rows
+            else:
+                self.confirmed_rows += rows
+            finally:
+                self._pending_rows -= len(chunk)
+                self._queue.task_done()
+
+    async def _lookup(self, emails: list[str]) -> dict:
+        async def lookup(group):
+            async with self._sem:
+                return await get_records_by_emails(self.session, group)
         
-        # Step 2: Process rows in chunks
-        total_processed = 0
-        total_new_bubble = 0
-        total_updated_bubble = 0
-        total_new_back4app = 0
-        total_updated_back4app = 0
+        existing = {}
+        groups = [emails[i : i + BUBBLE_LOOKUP_BATCH] for i in range(0, len(emails), BUBBLE_LOOKUP_BATCH)]
+        for found in await asyncio.gather(*(lookup(group) for group in groups)):
+            existing.update(found)
+        return existing
+
+    async def _create(self, payloads: list[dict], written: dict):
+        try:
+            async with self._sem:
+                results = await create_records_bulk(self.session, payloads)
+        except Exception as e:
+            logger.error(f"[BUBBLE] {self.job}: bulk create of {len(payloads)} records failed: {e}")
+            self._count("failed", len(payloads))
+            return
+        for payload, result in zip(payloads, results):
+            email = payload["UserPreLicensingEMAIL"]
+            if result.get("status") == "success":
+                written[email] = {**payload, "_id": result.get("id")}
+                self._count("created")
+                logger.info("[BUBBLE CREATED] %s", email, extra={"category": "row"})
+            else:
+                logger.error(f"[BUBBLE ERROR] {email} — {result.get('message', result)}")
+                self._count("failed")
+
+    async def _update(self, record: dict, changes: dict, written: dict):
+        email = record["UserPreLicensingEMAIL"]
+        try:
+            async with self._sem:
+                await update_record(self.session, record["_id"], changes, email)
+        except Exception:
+            self._count("failed")
+            return
+        written[email] = {**record, **changes}
+        self._count("updated")
+
+    async def _write(self, chunk: list):
+        payloads = {}
+        for row in chunk:
+            payload = to_payload(row)
+            if payload.get("UserPreLicensingEMAIL"):
+                payloads[payload["UserPreLicensingEMAIL"]] = payload
+            else:
+                self._count("failed")
+        
+        existing = {}
+        for recent in self._recent_writes:
+            existing.update(recent)
+        existing.update(await self._lookup([email for email in payloads if email not in existing]))
         
+        creates, updates = [], []
+        for email, payload in payloads.items():
+            record = existing.get(email)
+            if record is None:
+                creates.append(payload)
+            elif changes := diff_bubble_fields(payload, record):
+                updates.append((record, changes))
+            else:
+                self._count("unchanged")
+        
+        written = {}
+        await asyncio.gather(
+            *(self._create(creates[i : i + self.bulk_size], written) for i in range(0, len(creates), self.bulk_size)),
+            *(self._update(record, changes, written) for record, changes in updates),
+        )
+        self._recent_writes.append(written)
+
+    async def close(self, timeout: float = BUBBLE_DRAIN_SECONDS):
+        """Wait up to `timeout` seconds for queued chunks, then stop the consumer (0 stops it right away)"""
+        if self._consumer.done():
+            return
         try:
-            for idx in range(0, len(rows), CHUNK_SIZE):
-                chunk = rows[idx : idx + CHUNK_SIZE]
-                new_bubble, updated_bubble, new_back4app, updated_back4app = await process_chunk(chunk, session, sem)
-                
-                total_processed += len(chunk)
-                total_new_bubble += new_bubble
-                total_updated_bubble += updated_bubble
-                total_new_back4app += new_back4app
-                total_updated_back4app += updated_back4app
-                
-                # Update progress
-                if csv_file_id:
-                    await update_csv_file_status(session, csv_file_id, "processing", total_processed)
+            if timeout > 0:
+                await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+            active_sinks.pop(self.job, None)
+            if self._pending_rows:
+                logger.warning(f"[BUBBLE] {self.job}: dropping {self._pending_rows} queued rows not written to Bubble")
+                self._count("dropped", self._pending_rows)
+                self._pending_rows = 0
+
+    @property
+    def queued_rows(self) -> int:
+        return self._pending_rows
+
+    def summary(self) -> str:
+        return ", ".join(f"{count} {'new' if result == 'created' else result}" for result, count in self.counts.items())
+
+active_sinks: dict = {}  # job → BubbleSink of each running job
+
+# Job Progress
+class JobProgress:
+    """In-memory status of one CSV job, shown at /jobs/<id> and coalesced into Prelicensingcsv checkpoints.
+
+    report() only records a chunk and never waits. A background task calls
+    `checkpoint("processing", ...)` at most every PROGRESS_FLUSH_SECONDS, or sooner
+    once another PROGRESS_FLUSH_PERCENT of `total_rows` is done; a failed flush is
+    retried on the next one. finish() lets an in-flight flush land, then writes the
+    final status straight away. A LeaseLostError from a flush is raised by the next
+    report(), so the job stops at its next chunk as before. With a `sink` (a
+    BubbleSink), checkpoints store committed(), never more rows than it confirmed.
+    """
+
+    def __init__(self, job: str, checkpoint=None, processed_records: int = 0, total_rows: Optional[int] = None, filename: str = "",
+                 sink: Optional["BubbleSink"] = None):
+        self.job = job
+        self.filename = filename
+        self.status = "processing"
+        self.error_message = ""
+        self.processed = processed_records
+        self.total_rows = total_rows
+        self.counts = {}  # e.g. back4app_created, back4app_failed, duplicates
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.checkpointed = processed_records  # Rows stored in Prelicensingcsv
+        self.checkpoints = 0
+        self._resumed_from = processed_records
+        self._started = time.monotonic()
+        self._finished = None
+        self._flushed_at = self._started
+        self._checkpoint = checkpoint
+        self._sink = sink
+        self._lease_lost = None
+        self._closing = False
+        self._dirty = asyncio.Event()
+        self._urgent = asyncio.Event()
+        self._task = asyncio.create_task(self._run()) if checkpoint else None
+
+    def report(self, rows: int, **counts):
+        """Record a finished chunk of `rows` rows and what happened to them"""
+        if self._lease_lost is not None:
+            raise self._lease_lost
+        self.processed += rows
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+        self._dirty.set()
+        if self.total_rows and self.processed - self.checkpointed >= self.total_rows * PROGRESS_FLUSH_PERCENT / 100:
+            self._urgent.set()
+
+    def committed(self) -> int:
+        """Rows every sink has finished with: the offset a resumed job may skip to"""
+        if self._sink is None:
+            return self.processed
+        return min(self.processed, self._resumed_from + self._sink.confirmed_rows)
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            remaining = self._flushed_at + PROGRESS_FLUSH_SECONDS - time.monotonic()
+            if remaining > 0:
+                try:
+                    await asyncio.wait_for(self._urgent.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            if self._closing:
+                return
+            self._dirty.clear()
+            self._urgent.clear()
+            processed = self.committed()
+            try:
+                await self._checkpoint("processing", processed)
+            except LeaseLostError as e:
+                self._lease_lost = e
+                return
+            except Exception as e:
+                logger.warning(f"[PROGRESS] {self.job}: checkpoint at {processed} rows failed, retrying with the next one: {e}")
+                self._dirty.set()
+            else:
+                self.checkpointed = processed
+                self.checkpoints += 1
+            self._flushed_at = time.monotonic()
+
+    async def finish(self, status: str, error_message: str = "", checkpoint: bool = True):
+        """Stop the flush task and store the final `status` (skipped when `checkpoint` is False)"""
+        self.status = status
+        self.error_message = error_message
+        self.finished_at = datetime.now(timezone.utc)
+        self._finished = time.monotonic()
+        if self._task is not None and not self._task.done():
+            self._closing = True
+            self._urgent.set()
+            self._dirty.set()
+            await asyncio.shield(self._task)
+        if checkpoint and self._checkpoint is not None:
+            processed = self.committed()
+            await self._checkpoint(status, processed, error_message)
+            self.checkpointed = processed
+            self.checkpoints += 1
+
+    def snapshot(self) -> dict:
+        elapsed = max((self._finished or time.monotonic()) - self._started, 1e-6)
+        rate = (self.processed - self._resumed_from) / elapsed
+        remaining = max(0, self.total_rows - self.processed) if self.total_rows else None
+        tuner = active_tuners.get(self.job)
+        bubble = active_sinks.get(self.job)
+        counts = dict(self.counts)
+        if bubble:
+            counts.update({f"bubble_{result}": count for result, count in bubble.counts.items()})
+        return {
+            "job": self.job,
+            "filename": self.filename,
+            "status": self.status,
+            "processed_records": self.processed,
+            "total_rows": self.total_rows,
+            "percent": round(min(100.0, 100 * self.processed / self.total_rows), 1) if self.total_rows else None,
+            "rows_per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate, 1) if remaining is not None and rate > 0 and self.finished_at is None else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "counts": counts,
+            "errors": sum(count for name, count in counts.items() if name.endswith(("_failed", "_dropped"))),
+            "error_message": self.error_message,
+            "checkpointed_records": self.checkpointed,
+            "checkpoints": self.checkpoints,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            **({"chunk_size": tuner.chunk_size, "concurrency": tuner.concurrency} if tuner else {}),
+            **({"bubble_queued_rows": bubble.queued_rows} if bubble else {}),
+        }
+
+job_progress: OrderedDict = OrderedDict()  # job → JobProgress, running and recently finished
+
+def track_job_progress(progress: JobProgress):
+    job_progress[progress.job] = progress
+    job_progress.move_to_end(progress.job)
+    finished = [job for job, p in job_progress.items() if p.finished_at is not None]
+    for job in finished[: max(0, len(finished) - PROGRESS_KEEP_FINISHED)]:
+        job_progress.pop(job, None)
+
+async def pipeline_chunks(rows, session, sem, depth: int = PIPELINE_DEPTH,
+                          duplicates: Optional[DuplicateRowFilter] = None, chunk_size=CHUNK_SIZE,
+                          sinks: tuple = ()) -> AsyncIterator[tuple]:
+    """Yield (chunk, (created, updated, skipped, failed) on Back4App) in order, prefetching lookups for the next `depth` chunks.
+
+    Lookups run ahead while the current chunk's writes are in flight. Records written by
+    earlier chunks are overlaid on later lookups, which may have been issued before those
+    writes landed, so a repeated email is never created twice. With `duplicates`, repeated
+    emails are collapsed before the lookup; the yielded chunk is still the full one.
+    `chunk_size` is an int or a callable (see iter_chunks). Each collapsed chunk is
+    also handed to every sink in `sinks` (e.g. a BubbleSink), which writes it on its own
+    (submitting waits while the sink is too far behind).
+    """
+    chunks = iter_chunks(rows, chunk_size).__aiter__()
+    pending = deque()  # (chunk, lookup task), oldest first
+    recent_writes = deque(maxlen=depth + 1)  # email → record written by each recent chunk
+    exhausted = False
+    
+    try:
+        while True:
+            while not exhausted and len(pending) <= depth:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                unique = duplicates.collapse(chunk) if duplicates else chunk
+                for sink in sinks:
+                    await sink.submit(unique, len(chunk))
+                pending.append((chunk, unique, asyncio.create_task(lookup_chunk(unique, session))))
+            if not pending:
+                break
             
-            # Mark as completed
-            if csv_file_id:
-                await update_csv_file_status(session, csv_file_id, "completed", total_processed)
+            chunk, unique, lookup = pending.popleft()
+            back4app_map = await lookup
+            for written in recent_writes:
+                back4app_map.update(written)
             
-            # Log final results
-            logger.info(f"Processing completed — Bubble: {total_new_bubble} new, {total_updated_bubble} updated. Back4App: {total_new_back4app} new, {total_updated_back4app} updated.")
-                
+            written = {}
+            counts = await write_chunk(unique, back4app_map, session, sem, written)
+            recent_writes.append(written)
+            yield chunk, (*counts, len(unique) - sum(counts))
+    finally:
+        for _, _, lookup in pending:
+            lookup.cancel()
+
+async def process_csv_rows(rows, session: aiohttp.ClientSession, checkpoint=None,
+                           processed_records: int = 0, cancel_status: str = "error", job: str = "",
+                           filename: str = "", total_rows: Optional[int] = None,
+                           duplicates: Optional[DuplicateRowFilter] = None):
+    """Write `rows` in chunks, reporting progress after every chunk.
+
+    `checkpoint(status, processed_records, error_message="")` stores progress on
+    the Prelicensingcsv record; a JobProgress coalesces the per-chunk reports into
+    occasional checkpoints. `processed_records` counts rows already committed
+    before `rows` (when resuming) and `total_rows` (if known) is the file's row count.
+    A cancelled job is checkpointed as `cancel_status`. `job` names the run in the
+    per-job metrics and at /jobs/<job>. Chunks start at CHUNK_SIZE rows and
+    MAX_CONCURRENT writes; with AUTOTUNE a ChunkTuner adjusts both as the job runs.
+    With BUBBLE_SYNC the rows are also written to Bubble by a BubbleSink, which the
+    job waits for (up to BUBBLE_DRAIN_SECONDS) before it is marked completed; if
+    Bubble rows had to be dropped it ends as "completed_partial" instead, which is
+    resumed (from the rows Bubble confirmed) rather than matched as a duplicate.
+    Repeated emails are collapsed by `duplicates` (a fresh DuplicateRowFilter if
+    not given; pass one that has seen the skipped rows when resuming).
+    """
+    if total_rows is None and isinstance(rows, (list, tuple)):
+        total_rows = processed_records + len(rows)
+    # One transformer per file: date formats are detected from this file's rows (CsvRows from a CsvStream pass through)
+    rows = RowTransformer().records(rows)
+    duplicates = duplicates or DuplicateRowFilter()
+    
+    # Step 2: Process rows in chunks
+    total_processed = processed_records
+    total_new_back4app = 0
+    total_updated_back4app = 0
+    total_skipped_back4app = 0
+    job = job or f"adhoc-{uuid.uuid4().hex[:8]}"
+    tuner = active_tuners[job] = ChunkTuner(job)
+    bubble = BubbleSink(session, job) if BUBBLE_SYNC else None
+    progress = JobProgress(job, checkpoint, processed_records, total_rows, filename, sink=bubble)
+    track_job_progress(progress)
+    metrics.job_started(job)
+    chunk_started = time.monotonic()
+    
+    try:
+        async for chunk, counts in pipeline_chunks(rows, session, tuner.sem, duplicates=duplicates, chunk_size=tuner.size,
+                                                   sinks=(bubble,) if bubble else ()):
+            new_back4app, updated_back4app, skipped_back4app, failed_back4app = counts
+            metrics.chunk_seconds.observe(time.monotonic() - chunk_started)
+            metrics.add_rows(len(chunk), job)
+            
+            total_processed += len(chunk)
+            total_new_back4app += new_back4app
+            total_updated_back4app += updated_back4app
+            total_skipped_back4app += skipped_back4app
+            
+            # Update progress (stored in Prelicensingcsv by the reporter's own task)
+            progress.report(len(chunk), back4app_created=new_back4app, back4app_updated=updated_back4app,
+                            back4app_unchanged=skipped_back4app, back4app_failed=failed_back4app)
+            progress.counts["duplicates"] = duplicates.dropped
+            await tuner.observe(len(chunk), time.monotonic() - chunk_started, failed_back4app)
+            chunk_started = time.monotonic()
+        
+        if bubble:
+            await bubble.close()
+        
+        # Mark as completed (unless Bubble did not get every row)
+        status = "completed_partial" if bubble and bubble.counts["dropped"] else "completed"
+        await progress.finish(status)
+        metrics.job_finished(job, status)
+        
+        # Log final results
+        bubble_summary = f"Bubble: {bubble.summary()}" if bubble else "Bubble: sync off"
+        logger.info(f"Processing completed — Back4App: {total_new_back4app} new, {total_updated_back4app} updated, {total_skipped_back4app} unchanged. {bubble_summary}. {duplicates.dropped} repeated emails collapsed.")
+        return total_processed
+            
+    except asyncio.CancelledError:
+        logger.error(f"[PROCESSING CANCELLED] Stopped after {total_processed} rows")
+        metrics.job_finished(job, "cancelled")
+        message = "Interrupted by instance shutdown" if cancel_status == "error" else ""
+        await progress.finish(cancel_status, message)
+        raise
+    except LeaseLostError as e:
+        # Another worker owns the job now; its checkpoints are the ones that count
+        metrics.job_finished(job, "lease_lost")
+        await progress.finish("lease_lost", str(e), checkpoint=False)
+        raise
+    except Exception as e:
+        logger.error(f"[PROCESSING ERROR] Failed to process rows: {e}")
+        metrics.job_finished(job, "error")
+        await progress.finish("error", str(e))
+        raise
+    finally:
+        active_tuners.pop(job, None)
+        if bubble:
+            await bubble.close(0)
+            progress.counts.update({f"bubble_{result}": count for result, count in bubble.counts.items()})
+
+async def main_async(rows, csv_url: str = "", csv_filename: str = "", csv_content: Optional[str] = None,
+                     session: Optional[aiohttp.ClientSession] = None, content_hash: str = "", total_rows: Optional[int] = None,
+                     resumable: bool = True, on_saved: Optional[Callable[[str], None]] = None, source_fingerprint: str = "",
+                     stream: Optional[CsvStream] = None):
+    """Process `rows` (a list, iterable or async iterable of CSV dicts or CsvRows) in CHUNK_SIZE chunks.
+
+    When `csv_content` is given it is saved to Prelicensingcsv as-is instead of
+    downloading `csv_url` again. Requests go through the shared http_client
+    session unless `session` is given. With QUEUE_LARGE_FILES set, files that
+    save_csv_file queues are left for `main.py --worker` instead. A job interrupted
+    by shutdown is put back to "queued" at its last checkpoint, unless it is not
+    `resumable` (its rows cannot be read again), in which case it ends as "error".
+    A file whose `content_hash` matches a completed file is recorded as a duplicate
+    and skipped. `on_saved` is called with the Prelicensingcsv objectId once the
+    job is saved and leased. `source_fingerprint` is stored for resuming (see
+    resume_point). With the CsvStream that `rows` come from, its content_hash is
+    stored once the whole body has been read (see store_content_hash) and repeated
+    emails are collapsed across the part it has read ahead (see DuplicateRowFilter).
+    """
+    csv_file_id = None
+    if session is None:
+        session = await http_client.get_session()
+    
+    # Step 1: Save CSV file to CSV_Files table if URL provided
+    if csv_url and csv_filename:
+        try:
+            if csv_content is None:
+                csv_content = await fetch_csv_from_url(session, csv_url)
+            earlier = await find_completed_file(session, content_hash) if content_hash else None
+            if earlier:
+                logger.info(f"[CSV DEDUPE] {csv_filename} is identical to completed file {earlier.get('filename')} ({earlier['objectId']}), skipping")
+                await save_csv_file(session, csv_url, csv_content, csv_filename, content_hash, duplicate_of=earlier["objectId"])
+                metrics.jobs.inc(status="duplicate")
+                return
+            csv_file_id = await save_csv_file(session, csv_url, csv_content, csv_filename, content_hash, resumable=resumable,
+                                              source_fingerprint=source_fingerprint)
+            if QUEUE_LARGE_FILES and resumable and len(csv_content) > CSV_INLINE_MAX_CHARS:
+                logger.info(f"[CSV QUEUE] {csv_filename} left queued for a worker ({csv_file_id})")
+                return
+            # Leased like a worker job, so it can be resumed if this instance dies
+            lease = await JobLease.acquire(session, {"objectId": csv_file_id, "filename": csv_filename})
+            if lease is None:
+                raise RuntimeError(f"Could not lease {csv_file_id}")
+            if on_saved:
+                on_saved(csv_file_id)
         except Exception as e:
-            logger.error(f"[PROCESSING ERROR] Failed to process rows: {e}")
+            logger.error(f"[CSV SAVE ERROR] Failed to save CSV file: {e}")
             if csv_file_id:
-                await update_csv_file_status(session, csv_file_id, "error", total_processed, str(e))
-            raise
+                await update_csv_file_status(session, csv_file_id, "error", error_message=str(e))
+            return
+    
+    checkpoint = None
+    if csv_file_id:
+        checkpoint = store_content_hash(lease.checkpoint, stream) if stream and not content_hash else lease.checkpoint
+    duplicates = DuplicateRowFilter()
+    if stream:
+        await duplicates.plan(stream)
+    await process_csv_rows(rows, session, checkpoint, cancel_status="queued" if resumable else "error",
+                           job=csv_file_id or "", filename=csv_filename, total_rows=total_rows, duplicates=duplicates)
 
 # Google Cloud Function Entry Point
 
 async def fetch_csv_from_url(session: aiohttp.ClientSession, url: str) -> str:
+    """Download the whole CSV body as text (utf-8 → cp1252 → replace fallback)"""
+    async with open_csv_stream(session, url) as stream:
+        return await stream.read()
+
+async def process_csv_url(csv_url: str):
+    """Background job: stream the CSV at `csv_url` into Back4App"""
+    session = await http_client.get_session()
+    
+    # Resume an unfinished job for the same file instead of starting over
+    job = await find_resumable_job(session, csv_url)
+    if job:
+        if lease_active(job):
+            logger.info(f"[RESUME] {csv_url} is already being processed ({job['objectId']}), skipping")
+            return
+        lease = await JobLease.acquire(session, job)
+        if lease:
+            await process_leased_job(session, job, lease)
+        return
+    
+    # Stream CSV content from URL (downloaded once, parsed as it arrives)
+    logger.info("Streaming CSV content from URL")
+    async with open_csv_stream(session, csv_url) as stream:
+        # Only the head is buffered: small files are saved inline, large ones queued
+        csv_head = await stream.peek(CSV_INLINE_MAX_CHARS + 1)
+        
+        # Extract filename from URL or use default
+        filename = csv_url.split('/')[-1] if '/' in csv_url else f"csv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        
+        # Read bodies up to CSV_SPOOL_MEMORY_BYTES before writing anything, to hash them and collapse their repeated
+        # emails (files left queued are read by their worker); larger ones are hashed while they stream, so only
+        # their completed job records the hash
+        content_hash = ""
+        if not (QUEUE_LARGE_FILES and len(csv_head) > CSV_INLINE_MAX_CHARS):
+            spooled_hash = await stream.spool()
+            content_hash = spooled_hash if CSV_DEDUPE_FILES else ""
+        
+        logger.info(f"Starting background processing of {filename}")
+        await main_async(stream.rows(), csv_url, filename, csv_content=csv_head, session=session, content_hash=content_hash,
+                         total_rows=stream.estimate_rows(), source_fingerprint=stream.fingerprint, stream=stream)
+    
+    logger.info(f"Background processing completed for {csv_url}")
+
+# Direct Uploads
+class _ChunkReader(io.RawIOBase):
+    """Read-only file over an iterator of byte chunks (so uploads can be peeked and gunzipped)"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            self._pending = next(self._chunks, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def iter_upload_bytes(chunks: Iterable[bytes]) -> Iterable[bytes]:
+    """The body's chunks, gunzipped when it starts with the gzip magic bytes (whatever Content-Encoding says)"""
+    reader = io.BufferedReader(_ChunkReader(chunks), CSV_STREAM_CHUNK_BYTES)
+    if reader.peek(2)[:2] == b"\x1f\x8b":
+        reader = gzip.GzipFile(fileobj=reader)
+    return iter(lambda: reader.read(CSV_STREAM_CHUNK_BYTES), b"")
+
+def multipart_file(stream, boundary: bytes) -> tuple[str, Iterable[bytes]]:
+    """(filename, chunks) of the first file part of a multipart/form-data body, read from `stream` as it arrives"""
+    decoder = MultipartDecoder(boundary)
+
+    def events():
+        for data in itertools.chain(iter(lambda: stream.read(CSV_STREAM_CHUNK_BYTES), b""), [None]):
+            decoder.receive_data(data)
+            while (event := decoder.next_event()) is not NEED_DATA:
+                if isinstance(event, Epilogue):
+                    return
+                yield event
+
+    parts = events()
+    for event in parts:
+        if isinstance(event, File):
+            filename = event.filename or ""
+            break
+    else:
+        raise ValueError("multipart body has no file part")
+
+    def data():
+        for event in parts:
+            if isinstance(event, Data):
+                if event.data:
+                    yield event.data
+                if not event.more_data:
+                    return
+        raise ValueError("upload ended inside the file part")
+
+    return filename, data()
+
+class UploadBody:
+    """An upload's body, handed from the request thread reading it to the job parsing it.
+
+    The request thread feeds chunks in with put() (on the job executor loop) and the
+    job reads them from chunks() as they arrive. At most UPLOAD_BUFFER_CHUNKS wait in
+    between, so a job that falls behind slows the upload down instead of buffering
+    it. Once the job ends, put() returns False and the request stops reading.
+    """
+
+    def __init__(self):
+        self._queue = asyncio.Queue(UPLOAD_BUFFER_CHUNKS)
+        self._error: Optional[BaseException] = None
+        self.closed = False
+        self.job_id: Optional[str] = None
+        self.error_message = ""
+        self.saved = threading.Event()  # Set once the job has its Prelicensingcsv record (or has ended)
+
+    async def put(self, data: bytes) -> bool:
+        """Queue `data` (b"" ends the body); False once the job has stopped reading"""
+        if not self.closed:
+            await self._queue.put(data)
+        return not self.closed
+
+    async def abort(self, error: BaseException):
+        """End the body with `error`, raised in the job when it reads the next chunk"""
+        if self.closed:
+            return
+        self._error = error
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            data = await self._queue.get()
+            if data is None:
+                raise RuntimeError(f"Upload interrupted: {self._error!r}")
+            if not data:
+                return
+            yield data
+
+    def set_job(self, job_id: str):
+        self.job_id = job_id
+        self.saved.set()
+
+    def close(self, error_message: str = ""):
+        """Called on the executor loop when the job ends; unblocks and refuses further put()s"""
+        self.closed = True
+        self.error_message = error_message
+        self.saved.set()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+async def process_csv_upload(body: UploadBody, filename: str):
+    """Background job: process a CSV sent to POST /upload while its body is still arriving"""
+    session = await http_client.get_session()
+    error_message = ""
     try:
-        async with session.get(url) as resp:
-            resp.raise_for_status()
-            raw = await resp.read()
+        stream = CsvStream(body.chunks())
+        csv_head = await stream.peek(CSV_INLINE_MAX_CHARS + 1)
+        logger.info(f"[UPLOAD] Starting background processing of {filename}")
+        # Uploads are not checked against completed files (that would need the whole body before the first write),
+        # but their hash is stored once read, so a later identical csv_url is skipped
+        await main_async(stream.rows(), f"{UPLOAD_URL_PREFIX}{filename}", filename, csv_content=csv_head, session=session,
+                         resumable=False, on_saved=body.set_job, stream=stream)
+        logger.info(f"[UPLOAD] Background processing completed for {filename} ({stream.bytes_read} bytes)")
+    except Exception as e:
+        error_message = str(e)
+        raise
+    finally:
+        body.close(error_message)
+
+# Queued Job Worker
+class LeaseLostError(Exception):
+    """Another worker took over the job this worker was processing"""
+
+def lease_expiry(seconds: int = WORKER_LEASE_SECONDS) -> dict:
+    return {"__type": "Date", "iso": to_utc_iso(datetime.now(timezone.utc) + timedelta(seconds=seconds))}
 
+async def find_leasable_jobs(session: aiohttp.ClientSession, limit: int) -> list[dict]:
+    """Queued Prelicensingcsv jobs, plus processing jobs whose worker let the lease expire"""
+    url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_CSV_TABLE_NAME}"
+    now = {"__type": "Date", "iso": to_utc_iso(datetime.now(timezone.utc))}
+    where = {"$or": [
+        {"processing_status": "queued"},
+        {"processing_status": "processing", "lease_expires_at": {"$lt": now}},
+    ]}
+    params = {
+        "where": json.dumps(where),
+        "order": "-queue_priority,createdAt",
+        "limit": limit,
+        "keys": "objectId,filename,csv_url,processed_records,processing_status,lease_token,lease_claim,updatedAt,content_hash,source_fingerprint",
+    }
+    data = await request_with_retries_back4app(session, "GET", url, params=params)
+    # Parse cannot compare two fields in a query, so jobs another worker is halfway through claiming are dropped here
+    return [job for job in (data or {}).get("results", []) if not claim_in_flight(job)]
+
+def claim_in_flight(job: dict) -> bool:
+    """Another worker has taken a lease ticket for `job` but not written its claim yet.
+
+    A ticket left unclaimed for WORKER_LEASE_SECONDS (the worker died in between)
+    no longer counts, so the job does not stay stuck.
+    """
+    if (job.get("lease_claim") or 0) == (job.get("lease_token") or 0):
+        return False
+    stale = to_utc_iso(datetime.now(timezone.utc) - timedelta(seconds=WORKER_LEASE_SECONDS))
+    return (job.get("updatedAt") or "") > stale
+
+class JobLease:
+    """A Prelicensingcsv job held by this worker.
+
+    Parse has no conditional update, so a claim is an atomic Increment of
+    `lease_token` and nothing else: only the worker whose increment returns the
+    token it polled plus one has won, and a worker that lost writes nothing at
+    all. The winner then stores that ticket in `lease_claim` with the lease and
+    status fields. Until it has, `lease_claim` lags `lease_token` and pollers skip
+    the job (claim_in_flight), so nobody can take the next ticket in between.
+    Every checkpoint renews `lease_expires_at` and re-reads `lease_claim` (an
+    Increment of 0), including the one process_leased_job writes after spooling
+    and before the first chunk, so a worker whose claim was replaced, or that
+    stalled past its lease and was taken over, stops before writing more rows.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, job: dict, token: int):
+        self.session = session
+        self.job_id = job["objectId"]
+        self.filename = job.get("filename", self.job_id)
+        self.token = token
+
+    @classmethod
+    async def acquire(cls, session: aiohttp.ClientSession, job: dict) -> Optional["JobLease"]:
+        """Try to take `job` (as polled); None if another worker claimed it since"""
+        if claim_in_flight(job):
+            logger.info(f"[WORKER] {job['objectId']} is being leased by another worker")
+            return None
+        expected = (job.get("lease_token") or 0) + 1
         try:
-            return raw.decode('utf-8')
-        except UnicodeDecodeError:
-            try:
-                return raw.decode('cp1252')
-            except UnicodeDecodeError:
-                # last resort: keep all bytes, replacing invalid sequences
-                return raw.decode('utf-8', errors='replace')
-            
-    except aiohttp.ClientError as e:
-        logger.error(f"Failed to fetch CSV from {url}: {e}")
+            ticket = await increment_csv_file_field(session, job["objectId"], "lease_token")
+        except Exception as e:
+            logger.warning(f"[WORKER] Could not lease {job['objectId']}: {e}")
+            return None
+        if ticket != expected:
+            logger.info(f"[WORKER] {job['objectId']} leased by another worker")
+            return None
+        fields = {"lease_claim": ticket, "lease_owner": WORKER_ID, "lease_expires_at": lease_expiry()}
+        try:
+            await update_csv_file_status(session, job["objectId"], "processing", job.get("processed_records") or 0, fields=fields)
+        except Exception as e:
+            # Unclaimed, so the job is leasable again once its current lease (if any) expires
+            logger.warning(f"[WORKER] Could not lease {job['objectId']}: {e}")
+            return None
+        return cls(session, job, ticket)
+
+    async def checkpoint(self, status: str, processed_records: int, error_message: str = "", fields: Optional[dict] = None):
+        """Store progress (plus any extra `fields`) and renew the lease (or release it when the job stops)"""
+        fields = {**(fields or {}), "lease_claim": {"__op": "Increment", "amount": 0}}
+        if status == "processing":
+            fields.update(lease_owner=WORKER_ID, lease_expires_at=lease_expiry())
+        else:
+            fields.update(lease_owner="", lease_expires_at={"__op": "Delete"})
+        data = await update_csv_file_status(self.session, self.job_id, status, processed_records, error_message, fields=fields) or {}
+        if "lease_claim" not in data:
+            # Not a takeover: the write may not have landed, so the caller retries it like any failed checkpoint
+            raise RuntimeError(f"Checkpoint of {self.job_id} returned no lease_claim")
+        if data["lease_claim"] != self.token:
+            raise LeaseLostError(f"Lease on {self.job_id} taken over (claim {data.get('lease_claim')}, held {self.token})")
+
+def lease_active(job: dict) -> bool:
+    expires = (job.get("lease_expires_at") or {}).get("iso")
+    return bool(expires) and expires > to_utc_iso(datetime.now(timezone.utc))
+
+async def find_resumable_job(session: aiohttp.ClientSession, csv_url: str) -> Optional[dict]:
+    """Latest unfinished Prelicensingcsv job for `csv_url` (queued, interrupted or completed_partial), if any
+
+    Failed jobs are not resumed: posting their csv_url again starts a new job.
+    Only the URL is matched here; process_leased_job skips the committed rows
+    only if the body it downloads is verifiably the same (see resume_point).
+    """
+    url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_CSV_TABLE_NAME}"
+    where = {"csv_url": csv_url, "processing_status": {"$in": ["queued", "pending", "processing", "completed_partial"]}}
+    params = {
+        "where": json.dumps(where),
+        "order": "-createdAt",
+        "limit": 1,
+        "keys": "objectId,filename,csv_url,processed_records,processing_status,lease_token,lease_claim,lease_expires_at,updatedAt,content_hash,source_fingerprint",
+    }
+    data = await request_with_retries_back4app(session, "GET", url, params=params)
+    results = (data or {}).get("results", [])
+    if results:
+        logger.info(f"[RESUME] Found unfinished job {results[0]['objectId']} for {csv_url} at row {results[0].get('processed_records') or 0}")
+    return results[0] if results else None
+
+def resume_point(job: dict, stream: CsvStream, content_hash: str = "") -> int:
+    """Rows of `job` that can be skipped in `stream`: its processed_records only if the body is the one they came from.
+
+    The stored content_hash is compared when both sides have one, else the
+    source_fingerprint; a body that changed or cannot be verified starts over.
+    """
+    processed = job.get("processed_records") or 0
+    if not processed:
+        return 0
+    if content_hash and job.get("content_hash"):
+        same = content_hash == job["content_hash"]
+    elif stream.fingerprint and job.get("source_fingerprint"):
+        same = stream.fingerprint == job["source_fingerprint"]
+    else:
+        same = False
+    if not same:
+        logger.warning(f"[RESUME] {job.get('filename')} ({job['objectId']}) changed or cannot be verified since row {processed} "
+                       f"was committed, starting over")
+    return processed if same else 0
+
+async def skip_rows(rows: AsyncIterator[CsvRow], count: int,
+                    duplicates: Optional[DuplicateRowFilter] = None) -> AsyncIterator[CsvRow]:
+    """Drop the first `count` rows (already committed by an earlier attempt), showing them to `duplicates`"""
+    async for row in rows:
+        if count > 0:
+            count -= 1
+            if duplicates:
+                duplicates.skip(row)
+            continue
+        yield row
+
+async def process_leased_job(session: aiohttp.ClientSession, job: dict, lease: JobLease):
+    """Stream a queued file from its csv_url, resuming after `processed_records`"""
+    resume_from = job.get("processed_records") or 0
+    started = False  # Once process_csv_rows runs, it checkpoints how the job ended itself
+    logger.info(f"[WORKER] Processing {lease.filename} ({lease.job_id}) from row {resume_from}")
+    try:
+        if (job.get("csv_url") or "").startswith(UPLOAD_URL_PREFIX):
+            # An interrupted direct upload: its body was never stored anywhere
+            logger.warning(f"[WORKER] {lease.filename} ({lease.job_id}) was uploaded directly and cannot be resumed")
+            await lease.checkpoint("error", resume_from, "Upload interrupted; send the file again")
+            return
+        async with open_csv_stream(session, job["csv_url"]) as stream:
+            spooled_hash = await stream.spool()
+            content_hash = spooled_hash if CSV_DEDUPE_FILES else ""
+            resume_from = resume_point(job, stream, content_hash)
+            if content_hash and not resume_from:
+                earlier = await find_completed_file(session, content_hash)
+                if earlier:
+                    logger.info(f"[CSV DEDUPE] {lease.filename} is identical to completed file {earlier.get('filename')} ({earlier['objectId']}), skipping")
+                    await lease.checkpoint("duplicate", 0, fields={"content_hash": content_hash, "duplicate_of": earlier["objectId"]})
+                    metrics.jobs.inc(status="duplicate")
+                    return
+            # Also re-reads lease_claim, so a lease lost while the body was spooling stops the job before its first chunk
+            source = {"content_hash": content_hash, "source_fingerprint": stream.fingerprint}
+            await lease.checkpoint("processing", resume_from, fields={k: v for k, v in source.items() if v})
+            # Winners are picked from the start of the file, so rows an earlier attempt wrote still count
+            duplicates = DuplicateRowFilter()
+            await duplicates.plan(stream)
+            rows = skip_rows(stream.rows(), resume_from, duplicates) if resume_from else stream.rows()
+            started = True
+            checkpoint = store_content_hash(lease.checkpoint, stream) if CSV_DEDUPE_FILES and not content_hash else lease.checkpoint
+            total = await process_csv_rows(rows, session, checkpoint, resume_from, cancel_status="queued", job=lease.job_id,
+                                           filename=lease.filename, total_rows=stream.estimate_rows(), duplicates=duplicates)
+        logger.info(f"[WORKER] Completed {lease.filename}: {total} rows")
+    except LeaseLostError as e:
+        logger.warning(f"[WORKER] {e}, abandoning job")
+    except asyncio.CancelledError:
+        if not started:
+            await release_lease(lease, "queued", resume_from)
+        logger.info(f"[WORKER] Released {lease.job_id} back to the queue")
         raise
+    except Exception as e:
+        logger.error(f"[WORKER] Job {lease.job_id} failed: {e}")
+        if not started:
+            # e.g. the csv_url no longer downloads; without this the job is leased again every time its lease expires
+            await release_lease(lease, "error", resume_from, str(e))
+
+async def release_lease(lease: JobLease, status: str, processed_records: int, error_message: str = ""):
+    """Checkpoint a job that stopped before its rows were processed, logging instead of raising"""
+    try:
+        await lease.checkpoint(status, processed_records, error_message)
+    except Exception as e:
+        logger.error(f"[WORKER] Could not mark {lease.job_id} as {status}: {e}")
+
+async def run_worker(once: bool = False):
+    """Poll Prelicensingcsv for queued files and process up to WORKER_CONCURRENCY at once.
+
+    Any number of workers can run against the same table; leases make sure each
+    file is processed by one of them at a time. With `once`, exit when the queue
+    is empty instead of polling (the HTTP service does this on startup to resume
+    jobs a previous instance left behind).
+    """
+    session = await http_client.get_session()
+    running: set[asyncio.Task] = set()
+    logger.info(f"[WORKER] {WORKER_ID} started (concurrency {WORKER_CONCURRENCY}, lease {WORKER_LEASE_SECONDS}s)")
+    try:
+        while True:
+            free = WORKER_CONCURRENCY - len(running)
+            leased = 0
+            if free > 0:
+                try:
+                    jobs = await find_leasable_jobs(session, free)
+                except Exception as e:
+                    logger.error(f"[WORKER] Failed to poll queued jobs: {e}")
+                    jobs = []
+                for job in jobs:
+                    lease = await JobLease.acquire(session, job)
+                    if lease:
+                        leased += 1
+                        running.add(asyncio.create_task(process_leased_job(session, job, lease)))
+            if once and not running and not leased:
+                break
+            if running:
+                _, running = await asyncio.wait(running, timeout=WORKER_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(WORKER_POLL_SECONDS)
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        logger.info(f"[WORKER] {WORKER_ID} stopped")
+
+def start_worker(once: bool = False):
+    """Run the worker until SIGTERM/SIGINT; in-flight jobs are checkpointed and re-queued"""
+    async def main():
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            await run_worker(once)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await http_client.close()
+    asyncio.run(main())
+    shutdown_csv_pool()
+
+# Background Job Executor
+class JobExecutor:
+    """Runs background jobs on one long-lived event loop thread.
+
+    At most `max_jobs` jobs run at once and at most `queue_size` more wait; submit()
+    returns False beyond that so the endpoint can answer 429. shutdown() stops
+    accepting jobs and drains the running ones, cancelling whatever is left after
+    the grace period.
+    """
+
+    def __init__(self, max_jobs: int, queue_size: int, on_start=None, on_stop=None):
+        self.max_jobs = max(1, max_jobs)
+        self.queue_size = max(0, queue_size)
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._accepting = True
+        self._pending = 0  # Queued + running
+        self._running = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list = []
+        self._thread: Optional[threading.Thread] = None
+        self._on_start = on_start  # Coroutine functions run on the executor loop
+        self._on_stop = on_stop
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._queue = asyncio.Queue()
+            if self._on_start is not None:
+                self._loop.run_until_complete(self._on_start())
+            self._workers = [self._loop.create_task(self._worker()) for _ in range(self.max_jobs)]
+            ready.set()
+            self._loop.run_forever()
+            if self._on_stop is not None:
+                self._loop.run_until_complete(self._on_stop())
+
+        self._thread = threading.Thread(target=run, name="job-executor", daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info(f"[JOBS] Executor started with {self.max_jobs} workers, queue size {self.queue_size}")
+
+    def start(self):
+        """Start the loop thread ahead of the first job"""
+        with self._lock:
+            self._ensure_started()
+
+    def submit(self, name: str, coro_fn, *args, start_now: bool = False) -> bool:
+        """Queue `coro_fn(*args)`; returns False when shutting down or the queue is full.
+
+        With `start_now` the job is only accepted if a worker is free to start it
+        right away (for jobs that cannot wait in the queue, like a streaming upload).
+        """
+        with self._lock:
+            limit = self.max_jobs if start_now else self.max_jobs + self.queue_size
+            if not self._accepting or self._pending >= limit:
+                return False
+            self._ensure_started()
+            self._pending += 1
+            self._idle.clear()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (name, coro_fn, args))
+        logger.info(f"[JOBS] Queued {name}")
+        return True
+
+    async def _worker(self):
+        while True:
+            name, coro_fn, args = await self._queue.get()
+            with self._lock:
+                self._running += 1
+            try:
+                await coro_fn(*args)
+            except asyncio.CancelledError:
+                logger.warning(f"[JOBS] {name} cancelled")
+                raise
+            except Exception as e:
+                logger.error(f"Background processing failed: {e}")
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._idle.set()
+
+    def call(self, coro_fn, *args, timeout: Optional[float] = None):
+        """Run `coro_fn(*args)` on the executor loop (outside the job queue) and return its result"""
+        with self._lock:
+            self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro_fn(*args), self._loop).result(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "jobs_running": self._running,
+                "jobs_queued": self._pending - self._running,
+                "max_jobs": self.max_jobs,
+                "queue_size": self.queue_size,
+            }
+
+    async def _cancel_workers(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        while not self._queue.empty():
+            name, _, _ = self._queue.get_nowait()
+            logger.warning(f"[JOBS] {name} dropped before it started")
+
+    def shutdown(self, timeout: float) -> bool:
+        """Stop accepting jobs and wait up to `timeout` seconds for queued and running ones.
+
+        Returns True if everything finished; otherwise the remaining jobs are cancelled.
+        """
+        with self._lock:
+            self._accepting = False
+            started = self._thread is not None
+            pending = self._pending
+        if not started:
+            return True
+        logger.info(f"[JOBS] Draining {pending} jobs (up to {timeout}s)")
+        drained = self._idle.wait(timeout)
+        if not drained:
+            logger.warning(f"[JOBS] Grace period over, cancelling {self.stats()['jobs_running']} running jobs")
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancel_workers(), self._loop).result(timeout=5)
+            except Exception as e:
+                logger.error(f"[JOBS] Failed to cancel jobs cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        return drained
+
+job_executor = JobExecutor(MAX_CONCURRENT_JOBS, JOB_QUEUE_SIZE, on_start=http_client.start, on_stop=http_client.close)
+
+# Agents API
+# Fields the dashboard renders (script.js processBack4AppData)
+AGENT_FIELDS = [
+    "objectId", "updatedAt", "first_name_text", "last_name_text", "pre_licensing_email_text", "phone_text",
+    "imo_custom_imo", "hiring_manager_text", "pre_licensing_course_text", "prepared_to_pass_text", "time_spent_text",
+    "date_enrolled_date", "pre_licensing_course_last_login_date", "ple_date_completed_date", "ple_complete_number",
+]
+AGENT_SORT_FIELDS = {
+    "name": lambda r: f"{r.get('first_name_text') or ''} {r.get('last_name_text') or ''}".strip().lower() or None,
+    "email": lambda r: (r.get("pre_licensing_email_text") or "").lower() or None,
+    "imo": lambda r: (r.get("imo_custom_imo") or "").lower() or None,
+    "enrolled": lambda r: (r.get("date_enrolled_date") or {}).get("iso"),
+    "completed": lambda r: (r.get("ple_date_completed_date") or {}).get("iso"),
+    "last_login": lambda r: (r.get("pre_licensing_course_last_login_date") or {}).get("iso"),
+    "ple_complete": lambda r: r.get("ple_complete_number"),
+    "updated": lambda r: r.get("updatedAt"),
+}
+
+class AgentsSnapshot:
+    """In-memory copy of API_Connector_Users that the dashboard pages through.
+
+    The first request loads every record; later ones fetch only records whose
+    `updatedAt` moved since the last refresh (at most every AGENTS_REFRESH_SECONDS,
+    or right away after CSV ingestion wrote). Deleted records drop out on the full
+    reload every AGENTS_FULL_RELOAD_SECONDS. Filtered and sorted views are cached
+    per snapshot version.
+    """
+
+    def __init__(self, refresh_seconds: float, full_reload_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self.version = 0
+        self._records: dict[str, dict] = {}
+        self._updated_since: Optional[str] = None
+        self._refreshed_at = 0.0
+        self._loaded_at = 0.0
+        self._stale = False
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._lock = threading.Lock()
+        self._views: "OrderedDict[tuple, tuple[list, list]]" = OrderedDict()
+
+    def mark_stale(self):
+        """CSV ingestion wrote: refresh on the next request instead of waiting for the interval"""
+        self._stale = True
+
+    def _due(self) -> bool:
+        return self._stale or time.monotonic() - self._refreshed_at >= self.refresh_seconds
+
+    async def _fetch(self, session: aiohttp.ClientSession, since: Optional[str]) -> list[dict]:
+        url = f"{BACK4APP_API_BASE_URL}/{BACK4APP_TABLE_NAME}"
+        records, last_id = [], None
+        while True:
+            where = {}
+            if since:
+                where["updatedAt"] = {"$gt": {"__type": "Date", "iso": since}}
+            if last_id:
+                where["objectId"] = {"$gt": last_id}
+            params = {"where": json.dumps(where), "order": "objectId", "limit": BACK4APP_QUERY_LIMIT, "keys": ",".join(AGENT_FIELDS)}
+            page = (await request_with_retries_back4app(session, "GET", url, params=params) or {}).get("results", [])
+            records.extend(page)
+            if len(page) < BACK4APP_QUERY_LIMIT:
+                return records
+            last_id = page[-1]["objectId"]
+
+    async def refresh(self):
+        """Bring the snapshot up to date if it is due (runs on the executor loop)"""
+        session = await http_client.get_session()
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if not self._due():
+                return
+            self._stale = False
+            full = not self._loaded_at or time.monotonic() - self._loaded_at >= self.full_reload_seconds
+            # Records updated while the scan runs may sort before its cursor: overlap the next refresh
+            started = to_utc_iso(datetime.now(timezone.utc) - timedelta(seconds=60))
+            if replica.enabled:
+                await replica.sync()
+                records = replica.changed_since(None if full else self._updated_since)
+            else:
+                records = await self._fetch(session, None if full else self._updated_since)
+            with self._lock:
+                if full:
+                    self._records = {}
+                    self._loaded_at = time.monotonic()
+                changed = 0
+                for record in records:
+                    if self._records.get(record["objectId"]) != record:
+                        self._records[record["objectId"]] = record
+                        changed += 1
+                newest = max((r.get("updatedAt") or "" for r in records), default="")
+                self._updated_since = min(filter(None, [newest, started])) if newest else (self._updated_since or started)
+                if full or changed:
+                    self.version += 1
+                    self._views.clear()
+                self._refreshed_at = time.monotonic()
+            logger.info(f"[AGENTS] {'Loaded' if full else 'Refreshed'} {len(records)} records ({len(self._records)} cached, version {self.version})")
+
+    def _view(self, imo: str, search: str, sort: str) -> tuple[list, list]:
+        key = (self.version, imo, search, sort)
+        with self._lock:
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+                return view
+            records = list(self._records.values())
+        if imo:
+            records = [r for r in records if imo in (r.get("imo_custom_imo") or "").lower()]
+        if search:
+            records = [
+                r for r in records
+                if any(search in (r.get(f) or "").lower() for f in ("first_name_text", "last_name_text", "pre_licensing_email_text", "imo_custom_imo"))
+                or search in f"{r.get('first_name_text') or ''} {r.get('last_name_text') or ''}".lower()
+            ]
+        sort_value = AGENT_SORT_FIELDS[sort]
+        keyed = sorted(((self._sort_key(sort_value(r)), r["objectId"]), r) for r in records)
+        view = ([k for k, _ in keyed], [r for _, r in keyed])
+        with self._lock:
+            self._views[key] = view
+            while len(self._views) > 32:
+                self._views.popitem(last=False)
+        return view
+
+    @staticmethod
+    def _sort_key(value) -> tuple:
+        # Missing values sort first; numbers and strings never compare with each other within one field
+        return (0, "") if value is None else (1, value)
+
+    def page(self, imo: str = "", search: str = "", sort: str = "name", order: str = "asc",
+             cursor: Optional[str] = None, limit: int = 100) -> dict:
+        """One page of agents after `cursor` plus the cursor of the next page (None on the last)"""
+        keys, records = self._view(imo.lower().strip(), search.lower().strip(), sort)
+        after = decode_agents_cursor(cursor) if cursor else None
+        if order == "desc":
+            end = bisect.bisect_left(keys, after) if after else len(keys)
+            start = max(0, end - limit)
+            items, item_keys = records[start:end][::-1], keys[start:end][::-1]
+            more = start > 0
+        else:
+            start = bisect.bisect_right(keys, after) if after else 0
+            items, item_keys = records[start:start + limit], keys[start:start + limit]
+            more = start + limit < len(keys)
+        return {
+            "results": items,
+            "count": len(keys),
+            "next_cursor": encode_agents_cursor(item_keys[-1]) if more and item_keys else None,
+            "version": self.version,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"records": len(self._records), "version": self.version, "views_cached": len(self._views),
+                    "age_seconds": round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at else None}
+
+def encode_agents_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+def decode_agents_cursor(cursor: str) -> tuple:
+    data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    (present, value), object_id = data
+    return ((present, value), object_id)
+
+agents_snapshot = AgentsSnapshot(AGENTS_REFRESH_SECONDS, AGENTS_FULL_RELOAD_SECONDS)
+
+# Service Lifecycle
+def start_service(processes: int = 1):
+    """Log the configuration and start the background job executor in this serving process.
+
+    Called once per process: from `python main.py`, or from gunicorn.conf.py in each
+    gunicorn worker, where `processes` workers split the backend rate limits. Only
+    the process that wins claim_resume_pass() resumes interrupted jobs.
+    """
+    if processes > 1:
+        for limiter in (back4app_limiter, bubble_limiter):
+            limiter.share(processes)
+    logger.info("=" * 50)
+    logger.info(f"Starting CSV Processor Service (pid {os.getpid()})")
+    logger.info("=" * 50)
+    logger.info("Configuration loaded:")
+    logger.info(f"  - Bubble API: {API_BASE_URL}")
+    logger.info(f"  - Table: {TABLE_NAME}")
+    logger.info(f"  - Back4App API: {BACK4APP_API_BASE_URL}")
+    logger.info(f"  - Max Concurrent: {MAX_CONCURRENT}")
+    logger.info(f"  - Chunk Size: {CHUNK_SIZE}")
+    autotune = f"chunk size {CHUNK_SIZE_MIN}-{CHUNK_SIZE_MAX}, concurrency {MAX_CONCURRENT_MIN}-{MAX_CONCURRENT_MAX}" if AUTOTUNE else "off"
+    logger.info(f"  - Auto-tuning: {autotune}")
+    bubble_sync = f"on (/bulk batches of {BUBBLE_BULK_SIZE}, concurrency {BUBBLE_CONCURRENCY}, queue {BUBBLE_QUEUE_CHUNKS} chunks)" if BUBBLE_SYNC else "off"
+    logger.info(f"  - Bubble sync: {bubble_sync}")
+    logger.info(f"  - Rate limits: Back4App {back4app_limiter.max_rate:g}/s, Bubble {bubble_limiter.max_rate:g}/s"
+                + (f" (1/{processes} of the configured limits)" if processes > 1 else ""))
+    logger.info(f"  - Max Concurrent Jobs: {MAX_CONCURRENT_JOBS} (queue size {JOB_QUEUE_SIZE})")
+    logger.info(f"  - CSV Parse Workers: {CSV_PARSE_WORKERS or 'off (event loop)'}")
+    logger.info(f"  - Static assets: {', '.join(static_assets) or 'none'} (precompressed: gzip{', br' if brotli else ''})")
+    logger.info("=" * 50)
+    
+    job_executor.start()
+    if not QUEUE_LARGE_FILES and claim_resume_pass():
+        # No separate workers: pick up files a previous instance left queued or stalled (once, not in every gunicorn worker)
+        job_executor.submit("resume-interrupted", run_worker, True)
+
+_resume_lock = None  # Open RESUME_LOCK_PATH while this process holds it
+
+def claim_resume_pass() -> bool:
+    """True in the first serving process to lock RESUME_LOCK_PATH; the lock is held until the process exits"""
+    global _resume_lock
+    lock = open(RESUME_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _resume_lock = lock
+    return True
+
+def stop_service():
+    """Drain background jobs (up to SHUTDOWN_GRACE_SECONDS) and stop the CSV process pool"""
+    job_executor.shutdown(SHUTDOWN_GRACE_SECONDS)
+    shutdown_csv_pool()
+
+def handle_sigterm(signum, frame):
+    """Cloud Run sends SIGTERM before stopping an instance: drain jobs, then exit"""
+    logger.info("SIGTERM received, shutting down")
+    stop_service()
+    sys.exit(0)
+
+def collect_component_metrics() -> list:
+    """Gauges and counters read from the limiters, job queue, HTTP pool and caches"""
+    limiters = {limiter.name: limiter.stats() for limiter in (back4app_limiter, bubble_limiter)}
+    jobs = job_executor.stats()
+    pool = http_client.stats()
+    index = record_index.stats()
+
+    def per_backend(key):
+        return [({"backend": name}, stats[key]) for name, stats in limiters.items()]
+
+    families = [
+        ("backend_requests_in_flight", "gauge", "Requests holding a limiter slot", per_backend("in_flight")),
+        ("backend_requests_waiting", "gauge", "Requests waiting for a limiter slot", per_backend("waiting")),
+        ("backend_rate_limit", "gauge", "Current adaptive request rate (requests/sec)", per_backend("rate")),
+        ("backend_concurrency_limit", "gauge", "Current adaptive concurrency limit", per_backend("concurrency_limit")),
+        ("backend_throttled_total", "counter", "Requests answered with 429/503", per_backend("throttled_total")),
+        ("job_queue_depth", "gauge", "CSV jobs waiting in the executor queue", [({}, jobs["jobs_queued"])]),
+        ("jobs_running", "gauge", "CSV jobs running in the executor", [({}, jobs["jobs_running"])]),
+        ("http_pool_connections", "gauge", "Pooled HTTP connections",
+         [({"state": "active"}, pool["active_connections"]), ({"state": "idle"}, pool["idle_connections"])]),
+        ("record_index_lookups_total", "counter", "Record index lookups", [({"result": "hit"}, index["hits"]), ({"result": "miss"}, index["misses"])]),
+        ("record_index_size", "gauge", "Emails in the record index", [({}, index["size"])]),
+    ]
+    tuners = list(active_tuners.values())
+    families += [
+        ("csv_tuner_chunk_size", "gauge", "Chunk size each running job is using", [({"job": t.job}, t.chunk_size) for t in tuners]),
+        ("csv_tuner_concurrency", "gauge", "Write concurrency each running job is using", [({"job": t.job}, t.concurrency) for t in tuners]),
+        ("csv_sink_queued_rows", "gauge", "Rows waiting in each running job's Bubble queue",
+         [({"job": job, "sink": "bubble"}, sink.queued_rows) for job, sink in list(active_sinks.items())]),
+    ]
+    if replica.enabled:
+        replica_stats = replica.stats()
+        families.append(("replica_records", "gauge", "Records in the local replica", [({}, replica_stats["records"])]))
+        if replica_stats["age_seconds"] is not None:
+            families.append(("replica_age_seconds", "gauge", "Seconds since the last replica sync", [({}, replica_stats["age_seconds"])]))
+    return families
+
+metrics.add_collector(collect_component_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     logger.info("Health check requested")
-    return jsonify({"status": "healthy", "message": "Service is running"}), 200
+    return jsonify({"status": "healthy", "message": "Service is running", "record_index": record_index.stats(), "http_pool": http_client.stats(),
+                    "rate_limits": {"back4app": back4app_limiter.stats(), "bubble": bubble_limiter.stats()},
+                    "agents": agents_snapshot.stats(), "replica": replica.stats()}), 200
+
+async def jobs_snapshot(job: Optional[str] = None):
+    """Status of `job` (None if this process has not run it recently), or of every tracked job"""
+    if job is None:
+        return [progress.snapshot() for progress in job_progress.values()]
+    progress = job_progress.get(job)
+    return progress.snapshot() if progress else None
+
+async def stored_job_status(job: str) -> Optional[dict]:
+    session = await http_client.get_session()
+    return await get_csv_file(session, job)
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Running and recently finished jobs of this process"""
+    return jsonify({"worker": WORKER_ID, "jobs": job_executor.call(jobs_snapshot, timeout=5)})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Live status of a job run by this process; otherwise its last Prelicensingcsv checkpoint"""
+    try:
+        status = job_executor.call(jobs_snapshot, job_id, timeout=5)
+        if status:
+            return jsonify({"worker": WORKER_ID, "source": "live", **status})
+        record = job_executor.call(stored_job_status, job_id, timeout=HTTP_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.error(f"[JOBS] Status of {job_id} unavailable: {e}")
+        return jsonify({"error": "Job status unavailable", "details": str(e)}), 503
+    if record is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify({"worker": WORKER_ID, "source": "checkpoint", "job": job_id, **record})
 
 # Static file routes for frontend
+@app.route('/api/agents', methods=['GET'])
+def list_agents():
+    """Dashboard agents: server-side filter (imo, q), sort and cursor pagination over a cached snapshot"""
+    args = request.args
+    sort = args.get("sort", "name")
+    order = args.get("order", "asc")
+    if sort not in AGENT_SORT_FIELDS or order not in ("asc", "desc"):
+        return jsonify({"error": f"sort must be one of {sorted(AGENT_SORT_FIELDS)} and order asc or desc"}), 400
+    try:
+        limit = min(max(1, int(args.get("limit", AGENTS_PAGE_SIZE))), AGENTS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    
+    try:
+        job_executor.call(agents_snapshot.refresh, timeout=HTTP_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.error(f"[AGENTS] Refresh failed: {e}")
+        if not agents_snapshot.version:
+            return jsonify({"error": "Agents are not available yet", "details": str(e)}), 503
+    
+    try:
+        page = agents_snapshot.page(args.get("imo", ""), args.get("q", ""), sort, order, args.get("cursor"), limit)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    etag = hashlib.blake2b(f"{page['version']}|{request.query_string.decode()}".encode(), digest_size=8).hexdigest()
+    if request.if_none_match.contains(etag):
+        return "", 304, {"ETag": f'"{etag}"'}
+    response = jsonify(page)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Static Assets
+class StaticAsset:
+    """A frontend file held in memory, with its ETag and gzip/brotli bodies compressed once at load"""
+
+    def __init__(self, body: bytes, mimetype: str, cache_control: str = "no-cache"):
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.version = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self.bodies = {"identity": body}
+        if len(body) >= STATIC_COMPRESS_MIN_BYTES:
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=11)
+            self.bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+
+    def etag(self, encoding: str) -> str:
+        # Each encoding is a different representation, so it gets its own strong ETag
+        return self.version if encoding == "identity" else f"{self.version}-{encoding}"
+
+    def response(self, cache_control: Optional[str] = None) -> Response:
+        """The best encoding the client accepts (br, gzip, then identity), or a 304 for a matching If-None-Match"""
+        encoding = next((e for e in ("br", "gzip") if e in self.bodies and request.accept_encodings.quality(e) > 0), "identity")
+        headers = {"Cache-Control": cache_control or self.cache_control, "Vary": "Accept-Encoding"}
+        if any(request.if_none_match.contains(self.etag(e)) for e in self.bodies):
+            return Response(status=304, headers={**headers, "ETag": f'"{self.etag(encoding)}"'})
+        response = Response(self.bodies[encoding], mimetype=self.mimetype, headers=headers)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.set_etag(self.etag(encoding))
+        return response
+
+def load_static_assets() -> dict:
+    """index.html, script.js and styles.css from the app directory, keyed by file name.
+
+    index.html links the other two with ?v=<content hash>, so those can be cached
+    for a year while index.html itself is revalidated on every load.
+    """
+    assets = {}
+    try:
+        for name, mimetype in (("script.js", "application/javascript"), ("styles.css", "text/css")):
+            with open(os.path.join(app.root_path, name), "rb") as f:
+                assets[name] = StaticAsset(f.read(), mimetype)
+        with open(os.path.join(app.root_path, "index.html"), "rb") as f:
+            page = f.read()
+    except OSError as e:
+        logger.warning(f"[STATIC] Frontend files not available: {e}")
+        return assets
+    for name, asset in assets.items():
+        for attr in (b'src="', b'href="'):
+            page = page.replace(attr + name.encode() + b'"', attr + f"{name}?v={asset.version}".encode() + b'"')
+    assets["index.html"] = StaticAsset(page, "text/html")
+    return assets
+
+static_assets = load_static_assets()
+
+def serve_static_asset(name: str) -> Response:
+    asset = static_assets.get(name)
+    if asset is None:
+        return Response("Not found", status=404, mimetype="text/plain")
+    versioned = name != "index.html" and request.args.get("v") == asset.version
+    return asset.response(f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable" if versioned else None)
+
 @app.route('/', methods=['GET'])
 def serve_frontend():
     """Serve the main frontend page"""
-    logger.info("Serving frontend page")
-    return send_file('index.html')
+    return serve_static_asset("index.html")
 
 @app.route('/script.js')
 def serve_script():
     """Serve JavaScript file"""
-    logger.info("Serving JavaScript file")
-    return send_file('script.js', mimetype='application/javascript')
+    return serve_static_asset("script.js")
 
 @app.route('/styles.css')
 def serve_styles():
     """Serve CSS file"""
-    logger.info("Serving CSS file")
-    return send_file('styles.css', mimetype='text/css')
+    return serve_static_asset("styles.css")
+
+def check_bubble_header():
+    """401 response unless the request carries the shared 'bubble' header (None when it does)"""
+    if request.headers.get('bubble') != 'eafe2749ca27a1c37ccf000431c2d083':
+        logger.error("Unauthorized request: missing or invalid 'bubble' header")
+        return jsonify({"error": "Unauthorized: missing or invalid 'bubble' header"}), 401
+    return None
+
+def job_queue_full(name: str):
+    """429 response for a job the executor has no room for"""
+    logger.warning(f"Job queue full, rejecting CSV: {name}")
+    response = jsonify({"error": "Too many CSV jobs in progress, retry later", **job_executor.stats()})
+    response.headers["Retry-After"] = str(JOB_RETRY_AFTER_SECONDS)
+    return response, 429
 
 @app.route('/', methods=['POST'])
 def process_csv_endpoint():
     """Main CSV processing endpoint - Returns immediately, processes in background"""
     logger.info("CSV processing endpoint called")
     try:
-        # Check for the 'bubble' header with value 'X'
-        if request.headers.get('bubble') != 'eafe2749ca27a1c37ccf000431c2d083':
-            logger.error("Unauthorized request: missing or invalid 'bubble' header")
-            return jsonify({"error": "Unauthorized: missing or invalid 'bubble' header"}), 401
-        
+        unauthorized = check_bubble_header()
+        if unauthorized:
+            return unauthorized
+
         # Expect JSON payload with 'csvfile' key
         content_type = request.headers.get('Content-Type', '')
         if 'application/json' not in content_type.lower():
@@ -674,73 +4104,108 @@ def process_csv_endpoint():
 
         logger.info(f"Starting background processing for CSV: {csv_url}")
 
-        # Start background processing
-        def run_background_processing():
-            try:
-                # Reset counters
-                global new_records_count, updated_records_count, new_records_back4app_count, updated_records_back4app_count
-                new_records_count = 0
-                updated_records_count = 0
-                new_records_back4app_count = 0
-                updated_records_back4app_count = 0
-                
-                # Fetch CSV content from URL
-                async def process_csv():
-                    async with aiohttp.ClientSession() as session:
-                        logger.info("Fetching CSV content from URL")
-                        content = await fetch_csv_from_url(session, csv_url)
-                        text_stream = io.StringIO(content)
-                        reader = csv.DictReader(text_stream)
-                        rows = [row for row in reader if any(row.values())]
-                        
-                        # Extract filename from URL or use default
-                        filename = csv_url.split('/')[-1] if '/' in csv_url else f"csv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                        
-                        logger.info(f"Starting background processing of {len(rows)} rows from {filename}")
-                        await main_async(rows, csv_url, filename)
-                
-                asyncio.run(process_csv())
-
-                logger.info(f"Background processing completed — Bubble: {new_records_count} new, "
-                            f"{updated_records_count} updated. Back4App: {new_records_back4app_count} new, "
-                            f"{updated_records_back4app_count} updated.")
-            except Exception as e:
-                logger.error(f"Background processing failed: {e}")
-        
-        # Start background thread
-        import threading
-        thread = threading.Thread(target=run_background_processing)
-        thread.daemon = True
-        thread.start()
+        # Hand off to the shared job executor; reject when its queue is full
+        if not job_executor.submit(f"csv:{csv_url}", process_csv_url, csv_url):
+            return job_queue_full(csv_url)
         
         # Return immediately
         return jsonify({
             "message": "Processing started in background",
             "status": "queued",
             "csv_url": csv_url,
-            "note": "Check Prelicensingcsv table for processing status"
+            "note": "Check Prelicensingcsv table for processing status",
+            **job_executor.stats()
         }), 200
         
     except Exception as e:
         logger.error(f"Error starting background processing: {e}")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
+@app.route('/upload', methods=['POST'])
+def upload_csv_endpoint():
+    """Process a CSV sent as the request body while it uploads.
+
+    The body is the raw CSV (any Content-Type, chunked or not; name it with
+    ?filename=) or a multipart/form-data form whose first file part is the CSV.
+    Gzipped files are detected and decompressed. Rows are written as the body
+    arrives; the response comes once it has been read completely. Answers 429
+    before reading the body when all MAX_CONCURRENT_JOBS job slots are busy.
+    """
+    unauthorized = check_bubble_header()
+    if unauthorized:
+        return unauthorized
+
+    try:
+        if request.mimetype == "multipart/form-data":
+            boundary = request.mimetype_params.get("boundary")
+            if not boundary:
+                return jsonify({"error": "multipart/form-data body without a boundary"}), 400
+            filename, chunks = multipart_file(request.stream, boundary.encode())
+        else:
+            filename = request.args.get("filename", "")
+            chunks = iter(lambda: request.stream.read(CSV_STREAM_CHUNK_BYTES), b"")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    filename = os.path.basename(filename).removesuffix(".gz") or f"upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+    # The client keeps sending while the job reads, so it must start now rather than wait behind other jobs
+    body = UploadBody()
+    if not job_executor.submit(f"upload:{filename}", process_csv_upload, body, filename, start_now=True):
+        return job_queue_full(filename)
+
+    received = 0
+    complete = False  # False if the job stopped reading before the end of the body
+    try:
+        for data in iter_upload_bytes(chunks):
+            received += len(data)
+            if not job_executor.call(body.put, data, timeout=UPLOAD_STALL_SECONDS):
+                break
+        else:
+            complete = job_executor.call(body.put, b"", timeout=UPLOAD_STALL_SECONDS)
+    except Exception as e:
+        # Client went away, corrupt gzip/multipart body, or a job that stopped reading
+        logger.error(f"[UPLOAD] {filename} failed after {received} bytes: {e!r}")
+        try:
+            job_executor.call(body.abort, e, timeout=5)
+        except Exception:
+            pass
+        if isinstance(e, TimeoutError):
+            return jsonify({"error": "Upload stalled: the job stopped reading it", "job_id": body.job_id}), 503
+        return jsonify({"error": f"Could not read upload: {e}", "job_id": body.job_id}), 400
+
+    body.saved.wait(UPLOAD_STALL_SECONDS)
+    if not complete or body.error_message:
+        return jsonify({"error": "Processing stopped before the upload was read", "details": body.error_message,
+                        "job_id": body.job_id}), 500
+    logger.info(f"[UPLOAD] Received {filename} ({received} bytes), job {body.job_id}")
+    return jsonify({
+        "message": "Upload received, processing continues in background",
+        "status": "processing",
+        "filename": filename,
+        "bytes": received,
+        "job_id": body.job_id,
+        "status_url": f"/jobs/{body.job_id}" if body.job_id else None,
+        **job_executor.stats()
+    }), 200
+
 # Cloud Run entry point
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CSV Processor Service")
+    parser.add_argument("--worker", action="store_true", help="process queued Prelicensingcsv files instead of serving HTTP")
+    parser.add_argument("--once", action="store_true", help="with --worker, exit once the queue is empty")
+    args = parser.parse_args()
+    
+    if args.worker:
+        start_worker(once=args.once)
+        sys.exit(0)
+    
     try:
-        logger.info("=" * 50)
-        logger.info("Starting CSV Processor Service")
-        logger.info("=" * 50)
-        logger.info("Configuration loaded:")
-        logger.info(f"  - Bubble API: {API_BASE_URL}")
-        logger.info(f"  - Table: {TABLE_NAME}")
-        logger.info(f"  - Back4App API: {BACK4APP_API_BASE_URL}")
-        logger.info(f"  - Max Concurrent: {MAX_CONCURRENT}")
-        logger.info(f"  - Chunk Size: {CHUNK_SIZE}")
-        logger.info("=" * 50)
+        start_service()
+        signal.signal(signal.SIGTERM, handle_sigterm)
         
+        # Flask's development server; the container runs gunicorn (see gunicorn.conf.py)
         port = int(os.environ.get("PORT", 8080))
-        logger.info(f"Starting Flask server on port {port}")
+        logger.info(f"Starting Flask development server on port {port}")
         app.run(host="0.0.0.0", port=port, debug=False)
     except Exception as e:
         logger.error(f"Failed to start server: {e}")
@@ -16,9 +16,10 @@ let columnVisibility = {};
 
 // Configuration
 const CONFIG = {
-    BACK4APP_API_URL: 'https://parseapi.back4app.com/classes/API_Connector_Users',
-    BACK4APP_APP_ID: 'mK60GEj1uzfoICD3dFxW75KZ5K77bbBoaWeeENeK',
-    BACK4APP_MASTER_KEY: 'ZDYmU9PLUhJRhTscXJGBFlU8wThrKY6Q0alTtZu2'
+    // Served by main.py from a cached snapshot of API_Connector_Users (no Back4App keys in the browser)
+    AGENTS_API_URL: '/api/agents',
+    PAGE_SIZE: 500,
+    IMO_FILTER: 'Unitrust'
 };
 
 // Initialize the application
@@ -84,114 +85,51 @@ async function loadAgentsData() {
     }
 }
 
-// Load data from Back4App API
-async function loadFromBack4AppAPI() {
-    try {
-        // First, count total records for Unitrust Financial (try different variations)
-        const countQueries = [
-            {"imo_custom_imo": "Unitrust Financial"},
-            {"imo_custom_imo": "\"Unitrust Financial\""},
-            {"imo_custom_imo": {"$regex": "Unitrust", "$options": "i"}}
-        ];
-        
-        let totalRecords = 0;
-        let bestQuery = null;
+// Fetch pages of agents from the server, following next_cursor.
+// onPage is called with each page's records as soon as it arrives.
+async function fetchAgentPages(params, onPage) {
+    const allRecords = [];
+    let cursor = null;
+    
+    do {
+        const query = new URLSearchParams({ ...params, limit: CONFIG.PAGE_SIZE });
+        if (cursor) query.set('cursor', cursor);
         
-        for (const query of countQueries) {
-            try {
-                const countResponse = await fetch(`${CONFIG.BACK4APP_API_URL}?where=${encodeURIComponent(JSON.stringify(query))}&count=1&limit=0`, {
-                    method: 'GET',
-                    headers: {
-                        'X-Parse-Application-Id': CONFIG.BACK4APP_APP_ID,
-                        'X-Parse-Master-Key': CONFIG.BACK4APP_MASTER_KEY,
-                        'Content-Type': 'application/json'
-                    }
-                });
-                
-                if (countResponse.ok) {
-                    const countData = await countResponse.json();
-                    const count = countData.count || 0;
-                    console.log(`Query ${JSON.stringify(query)}: ${count} records`);
-                    
-                    if (count > totalRecords) {
-                        totalRecords = count;
-                        bestQuery = query;
-                    }
-                }
-            } catch (error) {
-                console.error(`Error with query ${JSON.stringify(query)}:`, error);
-            }
+        const response = await fetch(`${CONFIG.AGENTS_API_URL}?${query}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        console.log(`Best query found: ${JSON.stringify(bestQuery)} with ${totalRecords} records`);
+        const data = await response.json();
+        const records = data.results || [];
+        allRecords.push(...records);
+        cursor = data.next_cursor;
         
-        // Also try to get total count without filter to see all records
-        try {
-            const totalCountResponse = await fetch(`${CONFIG.BACK4APP_API_URL}?count=1&limit=0`, {
-                method: 'GET',
-                headers: {
-                    'X-Parse-Application-Id': CONFIG.BACK4APP_APP_ID,
-                    'X-Parse-Master-Key': CONFIG.BACK4APP_MASTER_KEY,
-                    'Content-Type': 'application/json'
-                }
-            });
-            
-            if (totalCountResponse.ok) {
-                const totalCountData = await totalCountResponse.json();
-                console.log(`Total records in table: ${totalCountData.count || 0}`);
-            }
-        } catch (error) {
-            console.error('Error getting total count:', error);
-        }
-        
-        // Load all records in batches using the best query
-        const allRecords = [];
-        let skip = 0;
-        const limit = 100; // Maximum per request from Back4App
-        
-        while (skip < totalRecords) {
-            try {
-                const response = await fetch(`${CONFIG.BACK4APP_API_URL}?where=${encodeURIComponent(JSON.stringify(bestQuery))}&limit=${limit}&skip=${skip}`, {
-                    method: 'GET',
-                    headers: {
-                        'X-Parse-Application-Id': CONFIG.BACK4APP_APP_ID,
-                        'X-Parse-Master-Key': CONFIG.BACK4APP_MASTER_KEY,
-                        'Content-Type': 'application/json'
-                    }
-                });
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
-                
-                const data = await response.json();
-                const records = data.results || [];
-                
-                if (records.length === 0) break;
-                
-                allRecords.push(...records);
-                skip += limit;
-                
-                // Update progress
-                const progress = Math.min((skip / totalRecords) * 100, 100);
-                console.log(`Loading progress: ${Math.round(progress)}% (${skip}/${totalRecords})`);
-                
-            } catch (error) {
-                console.error(`Error loading batch ${skip}-${skip + limit}:`, error);
-                break;
-            }
-        }
+        console.log(`Loading progress: ${allRecords.length}/${data.count}`);
+        if (onPage) onPage(records, data.count);
+    } while (cursor);
+    
+    return allRecords;
+}
+
+// Load data from Back4App (through the agents API)
+async function loadFromBack4AppAPI() {
+    try {
+        // Each page is rendered as soon as it arrives, so the table shows up after the first request
+        agentsData = [];
+        const allRecords = await fetchAgentPages({ imo: CONFIG.IMO_FILTER }, (records) => {
+            agentsData.push(...processBack4AppData(records));
+            filteredData = [...agentsData];
+            renderTable();
+            updateCounts();
+            showLoading(false);
+        });
         
         console.log(`Successfully loaded ${allRecords.length} records`);
-        
-        // Debug: Check what IMO values we actually got
-        const imoValues = [...new Set(allRecords.map(record => record.imo_custom_imo))];
-        console.log('Unique IMO values found:', imoValues);
-        
         return allRecords;
         
     } catch (error) {
-        console.error('Back4App API error:', error);
+        console.error('Agents API error:', error);
         return null;
     }
 }
@@ -669,73 +607,26 @@ async function loadAllRecordsWithoutFilter() {
     try {
         console.log('Loading ALL records without filter...');
         
-        // Count total records
-        const countResponse = await fetch(`${CONFIG.BACK4APP_API_URL}?count=1&limit=0`, {
-            method: 'GET',
-            headers: {
-                'X-Parse-Application-Id': CONFIG.BACK4APP_APP_ID,
-                'X-Parse-Master-Key': CONFIG.BACK4APP_MASTER_KEY,
-                'Content-Type': 'application/json'
-            }
-        });
-        
-        if (countResponse.ok) {
-            const countData = await countResponse.json();
-            const totalRecords = countData.count || 0;
-            console.log(`Total records in database: ${totalRecords}`);
-            
-            // Load all records in batches
-            const allRecords = [];
-            let skip = 0;
-            const limit = 100;
-            
-            while (skip < totalRecords) {
-                const response = await fetch(`${CONFIG.BACK4APP_API_URL}?limit=${limit}&skip=${skip}`, {
-                    method: 'GET',
-                    headers: {
-                        'X-Parse-Application-Id': CONFIG.BACK4APP_APP_ID,
-                        'X-Parse-Master-Key': CONFIG.BACK4APP_MASTER_KEY,
-                        'Content-Type': 'application/json'
-                    }
-                });
-                
-                if (response.ok) {
-                    const data = await response.json();
-                    const records = data.results || [];
-                    
-                    if (records.length === 0) break;
-                    
-                    allRecords.push(...records);
-                    skip += limit;
-                    
-                    const progress = Math.min((skip / totalRecords) * 100, 100);
-                    console.log(`Loading all records: ${Math.round(progress)}% (${skip}/${totalRecords})`);
-                } else {
-                    break;
-                }
-            }
-            
-            console.log(`Loaded ${allRecords.length} total records`);
-            
-            // Analyze IMO values
-            const imoAnalysis = {};
-            allRecords.forEach(record => {
-                const imo = record.imo_custom_imo || 'Empty';
-                imoAnalysis[imo] = (imoAnalysis[imo] || 0) + 1;
-            });
-            
-            console.log('Complete IMO analysis:', imoAnalysis);
-            
-            // Process and display all records
-            agentsData = processBack4AppData(allRecords);
+        agentsData = [];
+        const allRecords = await fetchAgentPages({}, (records) => {
+            agentsData.push(...processBack4AppData(records));
             filteredData = [...agentsData];
             renderTable();
-            initializeFilterOptions();
             updateCounts();
-            
-        } else {
-            console.error('Failed to get total count');
-        }
+        });
+        
+        console.log(`Loaded ${allRecords.length} total records`);
+        
+        // Analyze IMO values
+        const imoAnalysis = {};
+        allRecords.forEach(record => {
+            const imo = record.imo_custom_imo || 'Empty';
+            imoAnalysis[imo] = (imoAnalysis[imo] || 0) + 1;
+        });
+        
+        console.log('Complete IMO analysis:', imoAnalysis);
+        
+        initializeFilterOptions();
         
     } catch (error) {
         console.error('Error loading all records:', error);